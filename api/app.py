@@ -1,117 +1,304 @@
 import os
-from flask import Flask, request, jsonify
+import io
+import re
+import csv
+import gzip
+import heapq
+import json
+import math
+import queue
+import atexit
+import hashlib
+import random
+import threading
+import time
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import pymysql
-from pymysql.cursors import DictCursor
-from datetime import datetime
+import sqlite3
+from pymysql.cursors import DictCursor, SSDictCursor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from db_pool import ConnectionPool
+from downsample import lttb_series
+import rollups
+import storage
+from wal import WALLocked, WriteBehindQueue
+from hot_cache import HotCache
+from summary import GAP_TIMEOUT_S, SEED_S, Summaries
+from events import Broadcaster, StreamPosition
+import archive
+import binproto
+import metrics
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
 
 DB_HOST = os.getenv('DB_HOST', '127.0.0.1')  # IP/hostname of MariaDB (container name if using docker network)
 DB_PORT = int(os.getenv('DB_PORT', '3306'))
 DB_NAME = os.getenv('DB_NAME', 'stationmeteo')
 DB_USER = os.getenv('DB_USER', 'pico')
 DB_PASS = os.getenv('DB_PASS', 'motdepassepico')
+# Connection pool (one TCP + auth handshake per pooled connection instead of per request)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = float(os.getenv('DB_POOL_RECYCLE', '3600'))  # max connection age in seconds
+DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', '1'))  # ping on borrow if idle longer than this
+# 'mariadb' (server above) or 'sqlite' (embedded file at SQLITE_PATH, see storage.py)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mariadb')
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stationmeteo.db'))
 
 app = Flask(__name__)
 
-TABLE_DDL = """
-CREATE TABLE IF NOT EXISTS mesures (
-  id INT AUTO_INCREMENT PRIMARY KEY,
-  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  temperature DOUBLE,
-  humidite DOUBLE,
-  pression DOUBLE,
-  co2 DOUBLE,
-  humidite_surface DOUBLE,
-  pluie_detectee TINYINT(1),
-  indice_uv DOUBLE
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-"""
-
-# Expected columns (for lightweight forward-compatible migrations)
-EXPECTED_COLUMNS = {
-    'created_at': 'TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP',
-    'temperature': 'DOUBLE',
-    'humidite': 'DOUBLE',
-    'pression': 'DOUBLE',
-    'co2': 'DOUBLE',
-    'humidite_surface': 'DOUBLE',
-    'pluie_detectee': 'TINYINT(1)',
-    'indice_uv': 'DOUBLE'
-}
+# Prometheus metrics, served on /metrics (values are per process)
+METRICS = metrics.Registry()
+HTTP_REQUESTS = METRICS.counter('stationmeteo_http_requests_total', 'HTTP requests by route, method and status.',
+                                ('route', 'method', 'status'))
+HTTP_DURATION = METRICS.histogram('stationmeteo_http_request_duration_seconds',
+                                  'Time to build the response (streamed bodies excluded).', ('route', 'method'))
+HTTP_IN_FLIGHT = METRICS.gauge('stationmeteo_http_requests_in_flight',
+                               'Requests being processed, open streams included.')
+DB_QUERY_SECONDS = METRICS.histogram('stationmeteo_db_query_duration_seconds',
+                                     'Time spent executing SQL statements, by statement kind.', ('statement',))
+DB_CONNECT_SECONDS = METRICS.histogram('stationmeteo_db_connect_duration_seconds',
+                                       'Time to open a database connection (TCP, auth, init command).')
+ROWS_INSERTED = METRICS.counter('stationmeteo_rows_inserted_total', 'Measurement rows committed to the database.')
+ROWS_DUPLICATE = METRICS.counter('stationmeteo_ingest_duplicates_total',
+                                 'Measurement rows dropped because their station already sent that seq.')
+FIELDS_REJECTED = METRICS.counter('stationmeteo_ingest_fields_rejected_total',
+                                  'Posted values that were not numbers and were stored as NULL.', ('field',))
+SQL_STATEMENTS = ('select', 'insert', 'update', 'delete', 'replace', 'alter', 'create', 'do')
+
+def statement_kind(sql):
+    word = sql.lstrip().split(None, 1)[0].lower() if sql.strip() else ''
+    return word if word in SQL_STATEMENTS else 'other'
+
+class TimedCursorMixin:
+    """Observe the duration of each execute() in DB_QUERY_SECONDS."""
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement=statement_kind(query))
+
+class TimedDictCursor(TimedCursorMixin, DictCursor):
+    pass
+
+class TimedSSDictCursor(TimedCursorMixin, SSDictCursor):
+    pass
+
+class TimedSQLiteCursor(TimedCursorMixin, sqlite3.Cursor):
+
+    def execute(self, query, args=()):
+        return super().execute(query, args)
+
+def connect_db():
+    with DB_CONNECT_SECONDS.time():
+        return pymysql.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=DB_PASS,
+            database=DB_NAME,
+            cursorclass=TimedDictCursor,
+            autocommit=True,
+            # created_at is a TIMESTAMP: read and compare it in UTC, as the dashboards assume
+            init_command="SET time_zone = '+00:00'",
+        )
+
+POOL = ConnectionPool(
+    connect_db,
+    size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    recycle=DB_POOL_RECYCLE,
+    ping_interval=DB_POOL_PING_INTERVAL,
+)
 
 def get_conn():
-    return pymysql.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASS,
-        database=DB_NAME,
-        cursorclass=DictCursor,
-        autocommit=True,
-    )
+    # Borrow a pooled connection; conn.close() returns it to the pool
+    return POOL.get()
+
+def connect_sqlite():
+    with DB_CONNECT_SECONDS.time():
+        os.makedirs(os.path.dirname(SQLITE_PATH) or '.', exist_ok=True)
+        return storage.connect_sqlite(SQLITE_PATH)
 
-# Lazy DB initialization so that /health never fails
+def open_storage():
+    if STORAGE_BACKEND == 'sqlite':
+        return storage.SQLiteStorage(connect_sqlite, cursor_class=TimedSQLiteCursor)
+    if STORAGE_BACKEND != 'mariadb':
+        raise ValueError(f'Unknown STORAGE_BACKEND: {STORAGE_BACKEND!r} (expected mariadb or sqlite)')
+    return storage.MariaDBStorage(POOL, insert_rows, TimedSSDictCursor, connect_db)
+
+# Schema migrations run once per process (at startup, or lazily on the first DB request)
+# so /health never fails; request handlers only check the flag
 DB_INIT_DONE = False
 DB_INIT_ERROR = None
+SCHEMA_VERSION = None
+DB_INIT_LOCK = threading.Lock()
 
 def ensure_db():
-    global DB_INIT_DONE, DB_INIT_ERROR
+    global DB_INIT_DONE, DB_INIT_ERROR, SCHEMA_VERSION
     if DB_INIT_DONE:
         return
-    try:
-        conn = get_conn()
+    with DB_INIT_LOCK:
+        if DB_INIT_DONE:
+            return
         try:
-            with conn.cursor() as cur:
-                cur.execute(TABLE_DDL)
-                # Lightweight schema migration: add any missing expected columns
-                try:
-                    cur.execute("SHOW COLUMNS FROM mesures")
-                    existing = {row['Field'] for row in cur.fetchall()}
-                    missing = [col for col in EXPECTED_COLUMNS if col not in existing]
-                    for col in missing:
-                        ddl = f"ALTER TABLE mesures ADD COLUMN {col} {EXPECTED_COLUMNS[col]}"
-                        cur.execute(ddl)
-                except Exception as mig_e:
-                    # Non critical; record but continue
-                    DB_INIT_ERROR = f"migration: {mig_e}" if not DB_INIT_ERROR else DB_INIT_ERROR
+            applied, SCHEMA_VERSION = STORAGE.migrate(log=print)
+            if applied:
+                print('Schema migrated to version', SCHEMA_VERSION)
+            DB_INIT_ERROR = None
             DB_INIT_DONE = True
-            if DB_INIT_ERROR is None:
-                DB_INIT_ERROR = None
-        finally:
-            conn.close()
-    except Exception as e:
-        DB_INIT_ERROR = str(e)
+        except Exception as e:
+            DB_INIT_ERROR = str(e)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.metrics_in_flight = True
+    HTTP_IN_FLIGHT.inc()
+
+# Registered before compress_response so that it runs after it (after_request runs in reverse order)
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_DURATION.observe(time.perf_counter() - started, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    # Runs once the body is sent, i.e. when a stream_with_context stream ends
+    if g.pop('metrics_in_flight', False):
+        HTTP_IN_FLIGHT.dec()
+
+@METRICS.collect
+def runtime_metrics():
+    pool = POOL.stats()
+    samples = [
+        ('stationmeteo_db_pool_connections_open', 'gauge', 'Pooled database connections open.', pool['open']),
+        ('stationmeteo_db_pool_connections_in_use', 'gauge', 'Pooled connections borrowed.', pool['in_use']),
+        ('stationmeteo_db_pool_waits_total', 'counter', 'Borrows that waited for a free connection.', pool['waits']),
+        ('stationmeteo_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a free connection.',
+         pool['wait_ms_total'] / 1000),
+        ('stationmeteo_db_connect_errors_total', 'counter', 'Failed database connection attempts.',
+         pool['connect_errors']),
+        ('stationmeteo_stream_subscribers', 'gauge', 'Open /measures/stream subscriptions.',
+         BROADCASTER.stats()['subscribers']),
+    ]
+    if HOT_CACHE is not None:
+        cache = HOT_CACHE.stats()
+        samples += [
+            ('stationmeteo_hot_cache_hits_total', 'counter', 'Reads served by the hot cache.', cache['hits']),
+            ('stationmeteo_hot_cache_misses_total', 'counter', 'Reads the hot cache could not serve.', cache['misses']),
+        ]
+    if INGEST_QUEUE is not None:
+        samples.append(('stationmeteo_wal_pending_rows', 'gauge', 'Rows logged in the WAL, not yet inserted.',
+                        INGEST_QUEUE.stats()['pending']))
+    return samples
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Compress JSON responses bigger than this (bytes); 0 disables compression
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_MIMETYPES = ('application/json', 'text/csv', 'application/x-ndjson')
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli-encode buffered responses according to Accept-Encoding."""
+    if (COMPRESS_MIN_BYTES <= 0 or response.direct_passthrough or response.is_streamed
+            or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accept['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/health', methods=['GET'])
 def health():
     # Do not touch DB here to keep health robust
     status = 'ok'
     db_status = 'ready' if DB_INIT_DONE else ('error' if DB_INIT_ERROR else 'not-initialized')
-    return jsonify(status=status, db=db_status, db_error=DB_INIT_ERROR, time=datetime.utcnow().isoformat()+'Z')
+    cache = HOT_CACHE.stats() if HOT_CACHE is not None else None
+    ingest = {'mode': INGEST_MODE}
+    if INGEST_QUEUE is not None:
+        ingest.update(INGEST_QUEUE.stats())
+    return jsonify(status=status, db=db_status, db_error=DB_INIT_ERROR, storage=STORAGE.name,
+                   schema_version=SCHEMA_VERSION, pool=POOL.stats(), ingest=ingest,
+                   cache=cache, stream=BROADCASTER.stats(), time=datetime.utcnow().isoformat()+'Z')
 
-@app.route('/add', methods=['POST'])
-def add():
-    if not request.is_json:
-        return jsonify(error='Expected application/json'), 400
-    data = request.get_json(silent=True) or {}
+# Measurement columns written by /add, in INSERT order
+MEASURE_FIELDS = ('temperature', 'humidite', 'pression', 'co2', 'humidite_surface', 'pluie_detectee', 'indice_uv')
 
-    # Ensure DB/table exists (retry each call until success)
-    ensure_db()
+def insert_statement(columns, n_rows=1):
+    return storage.insert_sql(columns, n_rows=n_rows)
 
-    # Extract and basic type validation
-    def as_float(x):
-        try:
-            return float(x)
-        except (TypeError, ValueError):
-            return None
-    def as_bool(x):
-        if isinstance(x, bool):
-            return x
-        if isinstance(x, (int, float)):
-            return bool(int(x))
-        if isinstance(x, str):
-            return x.strip().lower() in ('1','true','yes','on')
+# Columns returned by the read endpoints (the first three whatever ?fields= asks for)
+ID_COLUMNS = ('id', 'created_at', 'station_id')
+SELECT_COLUMNS = ', '.join(ID_COLUMNS + MEASURE_FIELDS)
+# Station of rows sent without one (single-station setups, older firmware)
+DEFAULT_STATION = os.getenv('DEFAULT_STATION', 'default')
+STATION_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+# Optional "token:station,token:station" list: a request with Authorization: Bearer <token> is
+# stored under that station and may not claim another one
+STATION_TOKENS = dict(
+    item.strip().split(':', 1) for item in os.getenv('STATION_TOKENS', '').split(',') if ':' in item
+)
+# Reject ingest requests without a known token (only when STATION_TOKENS is set)
+STATION_TOKEN_REQUIRED = os.getenv('STATION_TOKEN_REQUIRED', '0') == '1'
+# Max rows accepted by /add/batch, and rows per multi-row INSERT statement
+BATCH_MAX_ROWS = int(os.getenv('BATCH_MAX_ROWS', '10000'))
+BATCH_CHUNK_ROWS = int(os.getenv('BATCH_CHUNK_ROWS', '500'))
+# Ingest mode: 'direct' (INSERT before answering) or 'wal' (append to a local write-ahead log,
+# answer 202 right away, and let a background thread flush batches to MariaDB)
+INGEST_MODE = os.getenv('INGEST_MODE', 'direct')
+WAL_PATH = os.getenv('WAL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ingest.wal'))
+WAL_FLUSH_INTERVAL = float(os.getenv('WAL_FLUSH_INTERVAL', '1'))  # seconds between flushes
+WAL_FLUSH_ROWS = int(os.getenv('WAL_FLUSH_ROWS', '500'))  # max rows per flush transaction
+WAL_FSYNC = os.getenv('WAL_FSYNC', 'always')  # 'always' (each request), 'interval' (each flush) or 'never'
+# Idempotent ingest: a measurement with a seq (or a client ts) already stored for its station is
+# dropped. Keys are remembered SEQ_RETENTION_DAYS; replays older than that insert again.
+SEQ_MAX = 2 ** 63 - 1
+SEQ_RETENTION_DAYS = int(os.getenv('SEQ_RETENTION_DAYS', '30'))
+CLIENT_CLOCK_SKEW_S = int(os.getenv('CLIENT_CLOCK_SKEW_S', '300'))  # how far in the future a ts may be
+
+# Extract and basic type validation
+def as_float(x):
+    try:
+        return float(x)
+    except (TypeError, ValueError):
         return None
 
+def as_bool(x):
+    if isinstance(x, bool):
+        return x
+    if isinstance(x, (int, float)):
+        return bool(int(x))
+    if isinstance(x, str):
+        return x.strip().lower() in ('1','true','yes','on')
+    return None
+
+def parse_measure(data):
     row = {
         'temperature': as_float(data.get('temperature')),
         'humidite': as_float(data.get('humidite')),
@@ -121,33 +308,552 @@ def add():
         'pluie_detectee': 1 if as_bool(data.get('pluie_detectee')) else 0,
         'indice_uv': as_float(data.get('indice_uv')),
     }
+    for field, value in row.items():
+        if value is None and data.get(field) not in (None, ''):
+            FIELDS_REJECTED.inc(field=field)
 
     # Optional: basic sanity clamp
     if row['humidite'] is not None:
         row['humidite'] = max(0.0, min(100.0, row['humidite']))
     if row['humidite_surface'] is not None:
         row['humidite_surface'] = max(0.0, min(100.0, row['humidite_surface']))
+    return row
 
-    # Insert into DB
-    sql = (
-        "INSERT INTO mesures (temperature, humidite, pression, co2, humidite_surface, pluie_detectee, indice_uv) "
-        "VALUES (%s, %s, %s, %s, %s, %s, %s)"
-    )
+def row_values(row, columns=MEASURE_FIELDS):
+    return tuple(row[f] for f in columns)
+
+def is_number(x):
+    return isinstance(x, (int, float)) and not isinstance(x, bool) and x == x
+
+def measure_time(item, received_at):
+    """created_at for an ingested item: its client timestamp ts (epoch seconds) if any, else
+    receive time minus its optional age_s (seconds). Raises ValueError for a bad ts."""
+    ts = item.get('ts')
+    if ts not in (None, ''):
+        if not is_number(ts) or not 0 < ts < 2 ** 32:
+            raise ValueError(f'Invalid ts: {ts!r} (epoch seconds)')
+        created_at = datetime.utcfromtimestamp(int(ts))
+        if created_at > received_at + timedelta(seconds=CLIENT_CLOCK_SKEW_S):
+            raise ValueError(f'ts is in the future: {created_at.isoformat()}Z')
+        return created_at
+    age = item.get('age_s')
+    if is_number(age) and 0 < age < 10 ** 8:
+        return received_at - timedelta(seconds=int(age))
+    return received_at
+
+def measure_seq(item):
+    """Idempotency key of an ingested item: ('seq', its seq), else ('ts', its ts), else (None, None).
+
+    seq 0 means none, as in binary frames (which cannot leave the field out). Raises ValueError.
+    """
+    for name in ('seq', 'ts'):
+        value = item.get(name)
+        if value in (None, '') or (name == 'seq' and value == 0):
+            continue
+        if not is_number(value) or not 0 <= value <= SEQ_MAX or (name == 'seq' and value != int(value)):
+            raise ValueError(f'Invalid {name}: {value!r} (expected an integer from 0 to {SEQ_MAX})')
+        return name, int(value)
+    return None, None
+
+def ingest_row(item, station, from_token, received_at):
+    """Validated row of one posted measurement (raises PermissionError/ValueError)."""
+    station_id = item_station(item, station, from_token)
+    created_at = measure_time(item, received_at)
+    seq_kind, seq = measure_seq(item)
+    row = parse_measure(item)
+    row.update(created_at=created_at, station_id=station_id, seq=seq, seq_kind=seq_kind)
+    return row
+
+def check_station(value):
+    value = str(value).strip()
+    if not STATION_ID_RE.match(value):
+        raise ValueError(f"Invalid station id: {value!r} (1-64 letters, digits, '_', '-' or '.')")
+    return value
+
+def request_station(headers):
+    """(station, from_token) implied by an ingest request: bearer token, else X-Station-Id, else default.
+
+    Raises PermissionError (unknown or missing token) or ValueError (malformed id).
+    """
+    auth = headers.get('Authorization', '')
+    if STATION_TOKENS and auth.startswith('Bearer '):
+        station = STATION_TOKENS.get(auth[len('Bearer '):].strip())
+        if station is None:
+            raise PermissionError('Unknown station token')
+        return station, True
+    if STATION_TOKENS and STATION_TOKEN_REQUIRED:
+        raise PermissionError('Missing station token')
+    header = headers.get('X-Station-Id')
+    return (check_station(header) if header else DEFAULT_STATION), False
+
+def item_station(item, station, from_token):
+    """Station of one posted measurement: its own station_id if any, else the request's."""
+    claimed = item.get('station_id')
+    if claimed in (None, ''):
+        return station
+    claimed = check_station(claimed)
+    if from_token and claimed != station:
+        raise PermissionError(f'Token not valid for station {claimed!r}')
+    return claimed
+
+def station_filter(args=None):
+    """SQL condition and params for ?station=a[,b], or (None, []). Raises ValueError."""
+    raw = (request.args if args is None else args).get('station')
+    if not raw:
+        return None, []
+    stations = [check_station(s) for s in raw.split(',') if s.strip()]
+    if not stations:
+        return None, []
+    if len(stations) == 1:
+        return 'station_id = %s', stations
+    return f"station_id IN ({', '.join(['%s'] * len(stations))})", stations
+
+def store_rows(rows):
+    """Persist validated rows (each with created_at) and return their ids.
+
+    In write-behind mode the rows are only appended to the WAL and None is returned.
+    Raises if the database insert fails.
+    """
+    if INGEST_QUEUE is not None:
+        # Write-behind: durable in the local WAL, inserted by the flusher thread
+        INGEST_QUEUE.append(rows)
+        return None
+
+    # Ensure DB/table exists (retry each call until success)
+    ensure_db()
+    ids = STORAGE.insert_rows(rows)
+    record_inserted(rows, ids)
+    return ids
+
+@app.route('/add', methods=['POST'])
+def add():
+    received_at = utc_now_seconds()
+    if request.mimetype == binproto.MIMETYPE:
+        # Compact binary frame from the firmware (one or more records)
+        try:
+            items = binproto.decode_frame(request.get_data())
+        except binproto.DecodeError as e:
+            return jsonify(error=f'Invalid binary frame: {e}'), 400
+    elif request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify(error='Expected a JSON object'), 400
+        items = [data]
+    else:
+        return jsonify(error=f'Expected application/json or {binproto.MIMETYPE}'), 400
+
+    try:
+        rows = ingest_rows(items, request.headers, received_at)
+    except PermissionError as e:
+        return jsonify(error=str(e)), 403
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
-    conn = get_conn()
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (
-                row['temperature'], row['humidite'], row['pression'], row['co2'],
-                row['humidite_surface'], row['pluie_detectee'], row['indice_uv']
-            ))
-        return jsonify(status='ok'), 201
+        ids = store_rows(rows)
     except Exception as e:
         # For local LAN, return error message for debugging
         return jsonify(status='error', message=str(e)), 500
-    finally:
-        conn.close()
+    extra = {'count': len(rows)} if len(rows) > 1 else {}
+    if ids is None:
+        return jsonify(status='queued', **extra), 202
+    duplicates = ids.count(None)
+    if duplicates == len(ids):
+        # Already stored (a retry): success, nothing new
+        return jsonify(status='duplicate', duplicates=duplicates, **extra), 200
+    if duplicates:
+        extra['duplicates'] = duplicates
+    return jsonify(status='ok', **extra), 201
+
+
+def ingest_rows(items, headers, received_at):
+    """Validated rows for the measurements posted to /add (raises PermissionError/ValueError)."""
+    station, from_token = request_station(headers)
+    return [ingest_row(data, station, from_token, received_at) for data in items]
+
+def read_batch_body():
+    """Return the list of items posted to /add/batch (JSON array, NDJSON or binary frame), or None if unreadable."""
+    mimetype = request.mimetype
+    if mimetype == binproto.MIMETYPE:
+        try:
+            return binproto.decode_frame(request.get_data())
+        except binproto.DecodeError:
+            return None
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonlines'):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(ValueError(f'invalid JSON: {e}'))
+        return items
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get('rows'), list):
+            data = data['rows']
+        return data if isinstance(data, list) else None
+    return None
+
+def insert_chunks(rows):
+    """(chunk, sql, params) of each multi-row INSERT (BATCH_CHUNK_ROWS rows at most) storing rows.
 
+    Rows carrying a created_at keep it; others get the DB default.
+    """
+    for start in range(0, len(rows), BATCH_CHUNK_ROWS):
+        chunk = rows[start:start + BATCH_CHUNK_ROWS]
+        columns = (('created_at',) if 'created_at' in chunk[0] else ()) + ('station_id',) + MEASURE_FIELDS
+        yield chunk, insert_statement(columns, len(chunk)), [v for row in chunk for v in row_values(row, columns)]
+
+def rollup_statements(chunk, first_id):
+    """Rollup updates for a chunk just inserted with ids first_id.. (see rollups.apply_statements)."""
+    bounds = ()
+    if 'created_at' in chunk[0]:
+        times = [row['created_at'] for row in chunk]
+        bounds = (min(times), max(times))
+    return rollups.apply_statements(AGG_FIELDS, first_id, first_id + len(chunk) - 1, *bounds)
+
+def claim_statements(rows, token):
+    """(claim sql, params, read sql, params) for each chunk of the seq keys of rows (storage.seq_key).
+
+    The claim INSERT IGNOREs the keys into ingest_seq, skipping those already there (a retry,
+    a replay, a concurrent request that committed first); the read returns the keys stored with
+    this token, i.e. the ones this transaction claimed.
+    """
+    keys = list(dict.fromkeys(key for key in map(storage.seq_key, rows) if key is not None))
+    for start in range(0, len(keys), BATCH_CHUNK_ROWS):
+        chunk = keys[start:start + BATCH_CHUNK_ROWS]
+        claim = ("INSERT IGNORE INTO ingest_seq (station_id, kind, seq, token) VALUES "
+                 + ', '.join(['(%s, %s, %s, %s)'] * len(chunk)))
+        read = ("SELECT station_id, kind, seq FROM ingest_seq WHERE token = %s AND (station_id, kind, seq) IN ("
+                + ', '.join(['(%s, %s, %s)'] * len(chunk)) + ")")
+        yield (claim, [v for key in chunk for v in (*key, token)],
+               read, [token] + [v for key in chunk for v in key])
+
+def claimed_rows(rows, claimed):
+    """Indexes of the rows to insert: those without seq, and the first row of each claimed key."""
+    claimed = set(claimed)
+    keep = []
+    for i, row in enumerate(rows):
+        key = storage.seq_key(row)
+        if key is None:
+            keep.append(i)
+        elif key in claimed:
+            claimed.discard(key)
+            keep.append(i)
+    return keep
+
+def claimed_key(row):
+    """seq key of an ingest_seq row read back by a claim_statements() query."""
+    return row['station_id'], row['kind'], row['seq']
+
+def new_claim_token():
+    return random.getrandbits(63)
+
+def insert_rows(cur, rows):
+    """Insert rows with multi-row INSERT statements (and fold them into the rollups).
+
+    Returns the generated ids in row order, None for the rows dropped as duplicates.
+    """
+    claimed = []
+    token = new_claim_token()
+    for claim_sql, claim_params, read_sql, read_params in claim_statements(rows, token):
+        cur.execute(claim_sql, claim_params)
+        cur.execute(read_sql, read_params)
+        claimed += [claimed_key(r) for r in cur.fetchall()]
+    keep = claimed_rows(rows, claimed)
+
+    inserted = []
+    for chunk, sql, params in insert_chunks([rows[i] for i in keep]):
+        cur.execute(sql, params)
+        # InnoDB hands out consecutive ids to a single multi-row INSERT (autoinc lock mode 0/1)
+        first = cur.lastrowid
+        inserted.extend(range(first, first + len(chunk)))
+        for rollup_sql, rollup_params in rollup_statements(chunk, first):
+            cur.execute(rollup_sql, rollup_params)
+    ids = [None] * len(rows)
+    for i, row_id in zip(keep, inserted):
+        ids[i] = row_id
+    return ids
+
+STORAGE = open_storage()
+
+@app.route('/add/batch', methods=['POST'])
+def add_batch():
+    items = read_batch_body()
+    if items is None:
+        return jsonify(error=f'Expected a JSON array, application/x-ndjson or {binproto.MIMETYPE} body'), 400
+    if len(items) > BATCH_MAX_ROWS:
+        return jsonify(error=f'Too many rows (max {BATCH_MAX_ROWS})'), 413
+    try:
+        station, from_token = request_station(request.headers)
+    except PermissionError as e:
+        return jsonify(error=str(e)), 403
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    received_at = utc_now_seconds()
+    results = []
+    rows = []
+    for i, item in enumerate(items):
+        if isinstance(item, Exception):
+            results.append({'index': i, 'status': 'error', 'message': str(item)})
+        elif not isinstance(item, dict):
+            results.append({'index': i, 'status': 'error', 'message': 'expected a JSON object'})
+        else:
+            try:
+                row = ingest_row(item, station, from_token, received_at)
+            except (PermissionError, ValueError) as e:
+                results.append({'index': i, 'status': 'error', 'message': str(e)})
+                continue
+            results.append({'index': i, 'status': 'ok'})
+            rows.append(row)
+
+    if rows:
+        try:
+            ids = store_rows(rows)
+        except Exception as e:
+            # All-or-nothing: the transaction is rolled back when the connection is released
+            return jsonify(status='error', message=str(e)), 500
+        if ids is None:
+            return jsonify(status='queued', queued=len(rows), rejected=len(items) - len(rows),
+                           results=results), 202
+        ok = (r for r in results if r['status'] == 'ok')
+        for res, row_id in zip(ok, ids):
+            if row_id is None:
+                res['status'] = 'duplicate'
+            else:
+                res['id'] = row_id
+
+    duplicates = sum(1 for r in results if r['status'] == 'duplicate')
+    inserted = len(rows) - duplicates
+    return jsonify(status='ok', inserted=inserted, duplicates=duplicates, rejected=len(items) - len(rows),
+                   results=results), 201
+
+
+# Highest mesures.id, tracked on insert so /measures can answer 304 without a query.
+# With several processes, set ETAG_MAX_ID_TTL (seconds) to re-read MAX(id) periodically.
+ETAG_MAX_ID_TTL = float(os.getenv('ETAG_MAX_ID_TTL', '0'))
+MAX_ID = None
+MAX_ID_READ_AT = 0.0
+MAX_ID_LOCK = threading.Lock()
+
+def note_inserted_id(row_id):
+    global MAX_ID
+    with MAX_ID_LOCK:
+        if MAX_ID is not None and row_id > MAX_ID:
+            MAX_ID = row_id
+
+MAX_ID_SQL = "SELECT MAX(id) AS max_id FROM mesures"
+
+def known_max_id():
+    """MAX_ID if it can be trusted without a query, else None."""
+    if MAX_ID is not None and (ETAG_MAX_ID_TTL <= 0 or time.monotonic() - MAX_ID_READ_AT < ETAG_MAX_ID_TTL):
+        return MAX_ID
+    return None
+
+def store_max_id(max_id):
+    """Record a MAX(id) just read from the database; returns the newest id known."""
+    global MAX_ID, MAX_ID_READ_AT
+    with MAX_ID_LOCK:
+        MAX_ID = max(max_id, MAX_ID or 0)
+        MAX_ID_READ_AT = time.monotonic()
+        return MAX_ID
+
+def current_max_id():
+    max_id = known_max_id()
+    if max_id is not None:
+        return max_id
+    max_id = STORAGE.select(MAX_ID_SQL)[0]['max_id'] or 0
+    return store_max_id(max_id)
+
+def measures_etag(max_id, args=None):
+    """Validator for a /measures response: newest id + normalised query string."""
+    args = sorted((request.args if args is None else args).items(multi=True))
+    key = urlencode(args)
+    if any(k in ('from', 'to') and v.startswith('-') for k, v in args):
+        # Relative windows slide even without new rows: let the validator expire every minute
+        key += f'&minute={int(time.time() // 60)}'
+    return f"{max_id}-{hashlib.sha1(key.encode()).hexdigest()[:12]}"
+
+# In-process cache of the newest rows (0 disables it)
+HOT_CACHE_SIZE = int(os.getenv('HOT_CACHE_SIZE', '1000'))
+HOT_CACHE = HotCache(HOT_CACHE_SIZE) if HOT_CACHE_SIZE > 0 else None
+
+HOT_CACHE_SQL = f"SELECT {SELECT_COLUMNS} FROM mesures ORDER BY id DESC LIMIT %s"
+
+def reload_hot_cache():
+    ensure_db()
+    load_hot_cache(STORAGE.select(HOT_CACHE_SQL, (HOT_CACHE_SIZE,)))
+
+def load_hot_cache(rows):
+    HOT_CACHE.load(rows)
+    if rows:
+        note_inserted_id(rows[0]['id'])
+
+# Fan-out of inserted rows to /measures/stream subscribers
+BROADCASTER = Broadcaster(queue_size=int(os.getenv('SSE_QUEUE_SIZE', '256')))
+
+# Rolling per-station statistics served by /summary (see summary.py)
+SUMMARIES = Summaries(MEASURE_FIELDS)
+SUMMARY_SEED_SQL = f"SELECT {SELECT_COLUMNS} FROM mesures WHERE created_at >= %s AND id <= %s ORDER BY id"
+SUMMARY_CATCHUP_ROWS = 5000
+
+def record_inserted(rows, ids):
+    """Bookkeeping after a commit: newest id for ETags, new rows for the hot cache and streams.
+
+    Rows with a None id were duplicates and are skipped.
+    """
+    stored = [
+        {'id': row_id, 'created_at': row['created_at'], 'station_id': row['station_id'],
+         **{f: row[f] for f in MEASURE_FIELDS}}
+        for row, row_id in zip(rows, ids) if row_id is not None
+    ]
+    if len(stored) < len(ids):
+        ROWS_DUPLICATE.inc(len(ids) - len(stored))
+    if not stored:
+        return
+    note_inserted_id(stored[-1]['id'])
+    ROWS_INSERTED.inc(len(stored))
+    if HOT_CACHE is not None:
+        HOT_CACHE.add(stored)
+    SUMMARIES.add(stored)
+    BROADCASTER.publish(stored)
+
+def utc_now_seconds():
+    # created_at is a second-precision TIMESTAMP
+    return datetime.utcnow().replace(microsecond=0)
+
+def flush_rows(rows):
+    """Write-behind flusher callback: insert one batch in a transaction (raises on failure)."""
+    for row in rows:
+        # Entries logged before multi-station support
+        row.setdefault('station_id', DEFAULT_STATION)
+    ensure_db()
+    if not DB_INIT_DONE:
+        raise RuntimeError(f'database not ready: {DB_INIT_ERROR}')
+    ids = STORAGE.insert_rows(rows)
+    record_inserted(rows, ids)
+
+def wal_slot_path(slot):
+    return WAL_PATH if slot == 0 else f'{WAL_PATH}.{slot}'
+
+def wal_slots():
+    """Slots of the logs on disk, WAL_PATH being slot 0."""
+    directory, name = os.path.split(os.path.abspath(WAL_PATH))
+    pattern = re.compile(re.escape(name) + r'\.(\d+)$')
+    try:
+        entries = os.listdir(directory)
+    except OSError:
+        return []
+    slots = [int(m.group(1)) for m in map(pattern.match, entries) if m]
+    return sorted(slots + [0] if name in entries else slots)
+
+def drain_wal_logs(own_path):
+    """Flush the logs no running process holds, e.g. those of workers gone after WEB_CONCURRENCY went down.
+
+    A log that cannot be written to the database now stays on disk for the next start.
+    """
+    for slot in wal_slots():
+        path = wal_slot_path(slot)
+        if path == own_path:
+            continue
+        try:
+            orphan = WriteBehindQueue(path, flush_rows, batch_rows=WAL_FLUSH_ROWS, fsync=WAL_FSYNC)
+        except WALLocked:
+            continue
+        try:
+            while orphan.flush_once():
+                pass
+            if orphan.replayed_rows:
+                print(f'WAL {path} replayed: {orphan.replayed_rows} rows')
+        except Exception as e:
+            print(f'WAL {path} not replayed:', e)
+        finally:
+            orphan.stop()
+
+def start_ingest_queue():
+    """Open the WAL (replaying entries not yet flushed) and start the flusher thread.
+
+    Each process writes its own log: one that finds WAL_PATH open elsewhere (another worker)
+    takes WAL_PATH.1, .2, ... A restarted worker takes the first free one and replays it, then
+    drains the other free ones, which no worker may take again.
+    """
+    slot = 0
+    while True:
+        path = wal_slot_path(slot)
+        try:
+            queue = WriteBehindQueue(path, flush_rows, batch_rows=WAL_FLUSH_ROWS,
+                                     interval=WAL_FLUSH_INTERVAL, fsync=WAL_FSYNC)
+            break
+        except WALLocked:
+            slot += 1
+    drain_wal_logs(path)
+    queue.start()
+    atexit.register(queue.stop)
+    return queue
+
+INGEST_QUEUE = start_ingest_queue() if INGEST_MODE == 'wal' else None
+
+
+# Max rows returned by /measures when a from/to window is requested
+RANGE_MAX_ROWS = int(os.getenv('RANGE_MAX_ROWS', '10000'))
+RELATIVE_TIME_RE = re.compile(r'^-(\d+(?:\.\d+)?)([smhdw])$')
+RELATIVE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+def parse_time(value):
+    """Parse a from/to parameter into a naive UTC datetime.
+
+    Accepts ISO 8601 ('2024-05-01T12:00:00Z', '2024-05-01 12:00:00'), epoch seconds,
+    or a duration relative to now ('-24h', '-7d', '-30m'). Raises ValueError otherwise.
+    """
+    value = value.strip()
+    m = RELATIVE_TIME_RE.match(value)
+    if m:
+        return datetime.utcnow() - timedelta(seconds=float(m.group(1)) * RELATIVE_UNITS[m.group(2)])
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def time_range_args(args=None):
+    """Return (from, to) parsed from the query string; either may be None."""
+    args = request.args if args is None else args
+    bounds = []
+    for name in ('from', 'to'):
+        raw = args.get(name)
+        if raw in (None, ''):
+            bounds.append(None)
+            continue
+        try:
+            bounds.append(parse_time(raw))
+        except (ValueError, OverflowError, OSError):
+            raise ValueError(f"Invalid '{name}' timestamp: {raw!r}")
+    return tuple(bounds)
+
+def key_arg(name, args=None):
+    """A (created_at, id) cursor, '<ISO time>,<id>', or None if absent. Raises ValueError."""
+    raw = (request.args if args is None else args).get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        at, row_id = raw.rsplit(',', 1)
+        return parse_time(at), int(row_id)
+    except (ValueError, OverflowError, OSError):
+        raise ValueError(f"Invalid '{name}' cursor: {raw!r} (expected <created_at>,<id>)")
+
+def int_arg(name, args=None):
+    """Integer query parameter, or None if absent or invalid."""
+    try:
+        return int((request.args if args is None else args)[name])
+    except (KeyError, TypeError, ValueError):
+        return None
 
 @app.route('/measures', methods=['GET'])
 @app.route('/mesures', methods=['GET'])  # alias FR
@@ -155,35 +861,890 @@ def list_measures():
     # Ensure table exists
     ensure_db()
 
-    # Parse query params
+    # Conditional GET: nothing inserted since the client's copy -> 304 without querying rows
+    try:
+        etag = measures_etag(current_max_id())
+    except Exception:
+        etag = None
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag, weak=True)
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+    resp, status = query_measures()
+    if etag is not None and status == 200:
+        resp.set_etag(etag, weak=True)
+        resp.headers['Cache-Control'] = 'no-cache'
+    return resp, status
+
+def plan_measures(args):
+    """Turn /measures query parameters into the SQL to run and how to shape its result.
+
+    Returns a dict; plan['lttb'] is set for ?max_points= requests. Raises ValueError (-> 400).
+    """
+    start, end = time_range_args(args)
+    max_points = int_arg('max_points', args)
+    if max_points is not None:
+        return plan_downsampled(start, end, max_points, args)
+    # Projection (?fields=) is pushed into the SELECT; id, created_at and station_id are always returned
+    columns = list(ID_COLUMNS) + fields_arg(MEASURE_FIELDS, args)
+    station_sql, stations = station_filter(args)
+    fmt = args.get('format', 'rows')
+    if fmt not in ('rows', 'columns'):
+        raise ValueError(f"Unknown format: {fmt!r} (expected rows or columns)")
+    # Keyset pagination: ?before_id=N walks back in history, ?after_id=N fetches newer rows.
+    # Either one replaces OFFSET, so every page is the same primary-key range scan.
+    before_id = int_arg('before_id', args)
+    after_id = int_arg('after_id', args)
+    # Pages of a window are in (created_at, id) order, which is not id order (buffered and
+    # backdated measurements): their cursor is that pair, ?before=<created_at>,<id> (or after=)
+    before_key = key_arg('before', args)
+    after_key = key_arg('after', args)
+    # A from/to window returns every row in range (up to RANGE_MAX_ROWS) unless limit is given
+    windowed = start is not None or end is not None or before_key is not None or after_key is not None
+    max_limit = RANGE_MAX_ROWS if windowed else 1000
+    default_limit = max_limit if windowed else 100
     try:
-        limit = int(request.args.get('limit', '100'))
-        limit = max(1, min(limit, 1000))
+        limit = int(args.get('limit', default_limit))
+        limit = max(1, min(limit, max_limit))
     except Exception:
-        limit = 100
+        limit = default_limit
     try:
-        offset = int(request.args.get('offset', '0'))
+        offset = int(args.get('offset', '0'))
         offset = max(0, offset)
     except Exception:
         offset = 0
 
+    conditions = []
+    params = []
+    order = 'DESC'
+    # With a station, the (station_id, created_at) and (station_id, id) indexes serve the same scans
+    if station_sql is not None:
+        conditions.append(station_sql)
+        params.extend(stations)
+    # Time window, served by idx_mesures_created_at
+    if start is not None:
+        conditions.append('created_at >= %s')
+        params.append(start)
+    if end is not None:
+        conditions.append('created_at < %s')
+        params.append(end)
+    if before_id is not None:
+        conditions.append('id < %s')
+        params.append(before_id)
+    if after_id is not None:
+        conditions.append('id > %s')
+        params.append(after_id)
+        if before_id is None:
+            # Scan upwards from the cursor so LIMIT keeps the rows closest to it
+            order = 'ASC'
+    # Written so the created_at bound is a range on the created_at index
+    if before_key is not None:
+        conditions.append('created_at <= %s AND (created_at < %s OR id < %s)')
+        params.extend([before_key[0], before_key[0], before_key[1]])
+    if after_key is not None:
+        conditions.append('created_at >= %s AND (created_at > %s OR id > %s)')
+        params.extend([after_key[0], after_key[0], after_key[1]])
+        if before_key is None:
+            order = 'ASC'
+    if any(c is not None for c in (before_id, after_id, before_key, after_key)):
+        offset = 0
+
     sql = (
-        "SELECT id, created_at, temperature, humidite, pression, co2, humidite_surface, pluie_detectee, indice_uv "
-        "FROM mesures ORDER BY id DESC LIMIT %s OFFSET %s"
+        f"SELECT {', '.join(columns)} FROM mesures"
+        + (" WHERE " + " AND ".join(conditions) if conditions else "")
+        # Within a window, (created_at, id) order walks the created_at index (which carries the id)
+        + (f" ORDER BY created_at {order}, id {order}" if windowed else f" ORDER BY id {order}")
+        + " LIMIT %s OFFSET %s"
     )
+    params.extend([limit, offset])
+    return {
+        'lttb': False,
+        'sql': sql,
+        'params': params,
+        'columns': columns,
+        'fmt': fmt,
+        'limit': limit,
+        'offset': offset,
+        'order': order,
+        # Sort key of the rows, to merge them with archived ones
+        'sort_keys': ('created_at', 'id') if windowed else ('id',),
+        'where': {'start': start, 'end': end, 'stations': stations,
+                  'after_id': after_id, 'before_id': before_id,
+                  'after_key': after_key, 'before_key': before_key},
+        # Newest rows: may be served from the in-process hot cache
+        'latest': not conditions and offset == 0,
+    }
+
+def query_measures():
+    try:
+        plan = plan_measures(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if plan['lttb']:
+        return downsampled_measures(plan)
+
+    if plan['latest']:
+        rows = cached_latest(plan['limit'])
+        if rows is not None:
+            resp = measures_response(project_rows(rows, plan['columns']), plan['columns'], plan['fmt'])
+            resp.headers['X-Cache'] = 'hit'
+            set_next_cursor(resp, rows, plan)
+            return resp, 200
 
-    conn = get_conn()
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (limit, offset))
-            rows = cur.fetchall()
-        return jsonify(rows), 200
+        rows = select_measures(plan)
     except Exception as e:
         # Provide more debug info (exception type)
         return jsonify(status='error', message=str(e), type=type(e).__name__), 500
+
+    if plan['order'] == 'ASC':
+        # Keep the response newest-first like every other page
+        rows = list(reversed(rows))
+    resp = measures_response(rows, plan['columns'], plan['fmt'])
+    set_next_cursor(resp, rows, plan)
+    return resp, 200
+
+def archive_reaches(where):
+    """Whether archived parts may hold rows matching a plan's 'where' bounds."""
+    return ARCHIVE is not None and bool(ARCHIVE.select_parts(
+        where['start'], where['end'], where.get('after_id'), where.get('before_id'),
+        where.get('after_key'), where.get('before_key')))
+
+def measures_query(plan):
+    """(sql, params, archived) of the hot-table read for a /measures plan.
+
+    When the archive is reached (archived=True) the read returns the first offset + limit rows,
+    for merge_archived() to merge with the archive's and keep the page.
+    """
+    if not archive_reaches(plan['where']):
+        return plan['sql'], plan['params'], False
+    return plan['sql'], plan['params'][:-2] + [plan['offset'] + plan['limit'], 0], True
+
+def select_measures(plan):
+    """Rows of a /measures plan: the hot table's, merged with the archived rows the window reaches."""
+    sql, params, archived = measures_query(plan)
+    rows = STORAGE.select(sql, params)
+    return merge_archived(plan, rows) if archived else rows
+
+def merge_archived(plan, rows):
+    """The page of a /measures plan from the hot rows read by measures_query() and the archive."""
+    where = plan['where']
+    wanted = plan['offset'] + plan['limit']
+    descending = plan['order'] == 'DESC'
+    bounds = dict(where)
+    if len(rows) == wanted:
+        # A full hot page: only archived rows sorting before its last row can make it in
+        last = rows[-1]
+        if plan['sort_keys'][0] == 'id':
+            bounds['after_id' if descending else 'before_id'] = last['id']
+        elif descending:
+            bounds['start'] = last['created_at']
+        else:
+            bounds['end'] = last['created_at'] + timedelta(seconds=1)
+    archived = ARCHIVE.rows(plan['columns'], plan['sort_keys'], descending, wanted, **bounds)
+    return merge_rows(rows, archived, plan['sort_keys'], descending)[plan['offset']:wanted]
+
+def merge_rows(rows, archived, sort_keys, descending):
+    """Rows of both sources in sort_keys order; a row still in both (being archived) counts once."""
+    seen = {r['id'] for r in rows}
+    merged = rows + [r for r in archived if r['id'] not in seen]
+    merged.sort(key=lambda r: tuple(r[k] for k in sort_keys), reverse=descending)
+    return merged
+
+def project_rows(rows, columns):
+    if len(columns) < len(ID_COLUMNS) + len(MEASURE_FIELDS):
+        return [{c: r[c] for c in columns} for r in rows]
+    return rows
+
+def row_key(row):
+    return f"{row['created_at'].strftime('%Y-%m-%dT%H:%M:%S')},{row['id']}"
+
+def next_cursor(rows, plan):
+    """Cursor for the next page in the same direction (None once the end is reached).
+
+    rows are newest-first; windowed pages continue from (created_at, id), others from id.
+    """
+    if len(rows) != plan['limit']:
+        return None
+    if plan['sort_keys'][0] == 'created_at':
+        return f"after={row_key(rows[0])}" if plan['order'] == 'ASC' else f"before={row_key(rows[-1])}"
+    if plan['order'] == 'ASC':
+        return f"after_id={rows[0]['id']}"
+    return f"before_id={rows[-1]['id']}"
+
+def set_next_cursor(resp, rows, plan):
+    cursor = next_cursor(rows, plan)
+    if cursor is not None:
+        resp.headers['X-Next-Cursor'] = cursor
+
+def measures_body(rows, columns, fmt):
+    """A list of row objects, or one array per column (format=columns)."""
+    if fmt == 'columns':
+        # Column names appear once instead of once per row
+        return {c: [r[c] for r in rows] for c in columns}
+    return rows
+
+def measures_response(rows, columns, fmt):
+    """JSON body for /measures."""
+    return jsonify(measures_body(rows, columns, fmt))
+
+def cached_latest(limit):
+    """The newest `limit` rows from HOT_CACHE, brought up to date first; None on a miss."""
+    if HOT_CACHE is None:
+        return None
+    try:
+        max_id = current_max_id()
+        if HOT_CACHE.valid and HOT_CACHE.newest_id < max_id:
+            # Rows committed by another process: read just those, not the whole cache
+            HOT_CACHE.add(rows_after(HOT_CACHE.newest_id, HOT_CACHE_SIZE))
+        # Still behind: an id is missing (uncommitted or rolled back) or more rows than it holds
+        if not HOT_CACHE.valid or HOT_CACHE.newest_id < max_id:
+            reload_hot_cache()
+    except Exception:
+        return None
+    return HOT_CACHE.latest(limit)
+
+@app.route('/latest', methods=['GET'])
+def latest():
+    """Newest measurement, from the hot cache (O(1)) or the primary key when the cache is off.
+
+    With ?station=, the newest row of that station through the (station_id, id) index.
+    """
+    ensure_db()
+    try:
+        station_sql, stations = station_filter()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    rows = cached_latest(1) if station_sql is None else None
+    if rows is None:
+        where = f" WHERE {station_sql}" if station_sql is not None else ""
+        try:
+            rows = STORAGE.select(f"SELECT {SELECT_COLUMNS} FROM mesures{where} ORDER BY id DESC LIMIT 1", stations)
+        except Exception as e:
+            return jsonify(status='error', message=str(e), type=type(e).__name__), 500
+    if not rows:
+        return jsonify(error='No measurement yet'), 404
+    return jsonify(rows[0]), 200
+
+def reload_summaries():
+    """Seed SUMMARIES from the last 24h of rows, streamed rather than loaded at once."""
+    ensure_db()
+    max_id = STORAGE.select(MAX_ID_SQL)[0]['max_id'] or 0
+    start = utc_now_seconds() - timedelta(seconds=SEED_S)
+    stream = STORAGE.export(SUMMARY_SEED_SQL, [start, max_id], EXPORT_FETCH_ROWS)
+    done = False
+    try:
+        SUMMARIES.load((row for rows in stream for row in rows), max_id)
+        done = True
     finally:
-        conn.close()
+        stream.close(aborted=not done)
+
+def refresh_summaries():
+    """Fold the rows SUMMARIES missed (inserted by another process, or out of order) from the DB."""
+    if not SUMMARIES.loaded:
+        reload_summaries()
+        return
+    if SUMMARIES.behind or (ETAG_MAX_ID_TTL > 0 and current_max_id() > SUMMARIES.last_id):
+        while True:
+            rows = rows_after(SUMMARIES.last_id, SUMMARY_CATCHUP_ROWS)
+            # Stopped at a missing id: the next request reads on from there
+            if not SUMMARIES.fold(rows) or len(rows) < SUMMARY_CATCHUP_ROWS:
+                break
+
+@app.route('/summary', methods=['GET'])
+def get_summary():
+    """Dashboard cards: per field the latest value and 1h/24h min/max/mean, plus the pressure trend.
+
+    Served from in-memory accumulators (no scan). ?station= picks a station, else the one that
+    sent the newest measurement.
+    """
+    ensure_db()
+    station = request.args.get('station')
+    try:
+        station = check_station(station) if station else None
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        refresh_summaries()
+    except Exception as e:
+        return jsonify(status='error', message=str(e), type=type(e).__name__), 500
+    body = SUMMARIES.summary(station, time.time())
+    if body is None:
+        return jsonify(error='No measurement yet'), 404
+    return jsonify(body), 200
+
+# Seconds between keepalive comments on idle streams, and rows read per query when a stream
+# reads the database (the rows a resuming client missed)
+SSE_KEEPALIVE = float(os.getenv('SSE_KEEPALIVE', '15'))
+SSE_BACKLOG_ROWS = int(os.getenv('SSE_BACKLOG_ROWS', '1000'))
+# Streams open at once in this process (0: no limit). Each holds a thread under gunicorn's gthread
+# workers, which gunicorn.conf.py keeps below WEB_THREADS so that /add is still served; past it a
+# client gets 503 and retries later, possibly on another worker
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '0'))
+STREAM_SLOTS = threading.BoundedSemaphore(SSE_MAX_STREAMS) if SSE_MAX_STREAMS > 0 else None
+
+def rows_after_query(last_id, limit, station_sql=None, stations=()):
+    where = 'id > %s' + (f' AND {station_sql}' if station_sql is not None else '')
+    return (f"SELECT {SELECT_COLUMNS} FROM mesures WHERE {where} ORDER BY id LIMIT %s",
+            [last_id, *stations, limit])
+
+def rows_after(last_id, limit, station_sql=None, stations=()):
+    return STORAGE.select(*rows_after_query(last_id, limit, station_sql, stations))
+
+def sse_event(row, event_id):
+    # The event id is where a reconnecting client resumes (StreamPosition.floor), not the row id
+    return f"id: {event_id}\nevent: measure\ndata: {app.json.dumps(row)}\n\n"
+
+def sse_poll_interval():
+    # Several processes: look for their rows in the DB as often as MAX(id) is re-read
+    return min(SSE_KEEPALIVE, ETAG_MAX_ID_TTL) if ETAG_MAX_ID_TTL > 0 else SSE_KEEPALIVE
+
+@app.route('/measures/stream', methods=['GET'])
+@app.route('/mesures/stream', methods=['GET'])  # alias FR
+def stream_measures():
+    """Server-Sent Events: one 'measure' event per row accepted by /add.
+
+    A reconnecting client sends Last-Event-ID (or ?last_id=) and first receives what it missed,
+    possibly with rows it already had (see StreamPosition). ?station=a[,b] only sends the rows of
+    those stations.
+    """
+    ensure_db()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_id = None
+    try:
+        _, stations = station_filter()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if STREAM_SLOTS is not None and not STREAM_SLOTS.acquire(blocking=False):
+        return Response('retry: 5000\n\n', status=503, mimetype='text/event-stream',
+                        headers={'Retry-After': '5', 'Cache-Control': 'no-cache'})
+
+    def generate():
+        # Subscribe before reading the backlog so nothing falls in between
+        sub = BROADCASTER.subscribe()
+        # Rows of every station go through it; the station filter only applies to what is sent
+        position = StreamPosition(current_max_id() if last_id is None else last_id, GAP_TIMEOUT_S)
+        # Id after which the DB is read, a page at a time, before live rows (None: live rows only)
+        read_from = last_id
+        written_at = time.monotonic()
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                if read_from is not None:
+                    rows = rows_after(read_from, SSE_BACKLOG_ROWS)
+                    read_from = rows[-1]['id'] if len(rows) >= SSE_BACKLOG_ROWS else None
+                else:
+                    try:
+                        rows = sub.get(timeout=sse_poll_interval())
+                    except queue.Empty:
+                        # A missing id may have waited long enough
+                        position.advance(time.monotonic())
+                        # Rows inserted by another API process are not broadcast here (only with
+                        # ETAG_MAX_ID_TTL, i.e. several processes): read them from the first id not
+                        # seen, so one still uncommitted is read again at the next poll
+                        if ETAG_MAX_ID_TTL > 0 and (position.pending or current_max_id() > position.top):
+                            read_from = position.floor
+                        if time.monotonic() - written_at >= SSE_KEEPALIVE:
+                            yield ': keepalive\n\n'
+                            written_at = time.monotonic()
+                        continue
+                    if rows is None:
+                        # Server shutting down: the browser reconnects (to another worker) and resumes
+                        return
+                    if ETAG_MAX_ID_TTL > 0 and rows[0]['id'] > position.top + 1:
+                        # Ids skipped: another process inserted in between, read them next
+                        read_from = position.floor
+                if sub.overflowed:
+                    # Too slow to keep up: end the stream, the browser resumes with Last-Event-ID
+                    return
+                for row in position.accept(rows, time.monotonic()):
+                    if stations and row['station_id'] not in stations:
+                        continue
+                    yield sse_event(row, position.floor)
+                    written_at = time.monotonic()
+        finally:
+            BROADCASTER.unsubscribe(sub)
+
+    resp = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if STREAM_SLOTS is not None:
+        # Also when the client leaves before the first chunk (the generator never runs)
+        resp.call_on_close(STREAM_SLOTS.release)
+    return resp
+
+# Max raw rows read to build one ?max_points= (LTTB) response; a window holding more is read as
+# min/max per time bucket instead (rollup tables on MariaDB)
+LTTB_MAX_ROWS = int(os.getenv('LTTB_MAX_ROWS', '200000'))
+
+def plan_downsampled(start, end, max_points, args):
+    """/measures?max_points=N: at most N points per field over the window, chosen with LTTB.
+
+    One series per field, of one station: ?station=, else the one that sent the newest
+    measurement of the window (as /summary), named by the X-Station header.
+    """
+    fields = fields_arg(AGG_FIELDS, args)
+    max_points = max(3, min(max_points, 10000))
+    if start is None:
+        start = datetime.utcnow() - timedelta(days=1)
+
+    conditions = ['created_at >= %s']
+    params = [start]
+    if end is not None:
+        conditions.append('created_at < %s')
+        params.append(end)
+    window = list(conditions)
+    window_params = list(params)
+    station_sql, stations = station_filter(args)
+    if len(stations) > 1:
+        raise ValueError('max_points takes a single station')
+    if station_sql is not None:
+        conditions.append(station_sql)
+        params.extend(stations)
+    else:
+        # Served by idx_mesures_created_at: one index entry read
+        conditions.append(f"station_id = (SELECT station_id FROM mesures WHERE {' AND '.join(window)} "
+                          f"ORDER BY created_at DESC, id DESC LIMIT 1)")
+        params.extend(window_params)
+    # One row past LTTB_MAX_ROWS tells that the window is too large for raw rows
+    sql = (
+        f"SELECT id, station_id, {STORAGE.epoch_sql('created_at')} AS ts, {', '.join(fields)} FROM mesures "
+        f"WHERE {' AND '.join(conditions)} ORDER BY created_at DESC, id DESC LIMIT %s"
+    )
+    params.append(LTTB_MAX_ROWS + 1)
+    return {'lttb': True, 'sql': sql, 'params': params, 'fields': fields, 'max_points': max_points,
+            'where': {'start': start, 'end': end, 'stations': tuple(stations)}}
+
+def downsample_rows(rows, plan):
+    """{field: [{t, v}, ...]} from the rows selected by a plan_downsampled() query."""
+    rows = list(reversed(rows))
+    times = [float(r['ts']) for r in rows]
+    series = {}
+    for f in plan['fields']:
+        ts, vs = lttb_series(times, [r[f] for r in rows], plan['max_points'])
+        series[f] = [{'t': datetime.utcfromtimestamp(t).isoformat() + 'Z', 'v': v} for t, v in zip(ts, vs)]
+    return series
+
+def prebucket_seconds(plan):
+    """Bucket width giving at most LTTB_MAX_ROWS points (a min and a max per bucket) over the window.
+
+    Rounded up to whole minutes, hours or days so a rollup table serves it.
+    """
+    span = ((plan['where']['end'] or utc_now_seconds()) - plan['where']['start']).total_seconds()
+    bucket_s = max(1, math.ceil(span / max(1, LTTB_MAX_ROWS // 2)))
+    for unit in (86400, 3600, 60):
+        if bucket_s > unit or unit == 60:
+            return math.ceil(bucket_s / unit) * unit
+    return bucket_s
+
+def downsample_buckets(rows, bucket_s, plan):
+    """Like downsample_rows(), from per-bucket aggregates: the min and the max of each bucket."""
+    series = {}
+    for f in plan['fields']:
+        times, values = [], []
+        for r in rows:
+            if not int(r[f'{f}__count']):
+                continue
+            low, high = float(r[f'{f}__min']), float(r[f'{f}__max'])
+            # Which came first within the bucket is unknown: min, then max half a bucket later
+            times.append(float(r['bucket']))
+            values.append(low)
+            if high != low:
+                times.append(float(r['bucket']) + bucket_s / 2)
+                values.append(high)
+        ts, vs = lttb_series(times, values, plan['max_points'])
+        series[f] = [{'t': datetime.utcfromtimestamp(t).isoformat() + 'Z', 'v': v} for t, v in zip(ts, vs)]
+    return series
+
+def downsampled(plan, rows):
+    """(body, headers) of a max_points response, from the rows select_downsampled() returned.
+
+    When the window holds more than LTTB_MAX_ROWS rows, it is read again as per-bucket
+    aggregates of the same station, and X-Downsample-Bucket gives the bucket width.
+    """
+    headers = downsampled_headers(rows)
+    if len(rows) <= LTTB_MAX_ROWS:
+        return downsample_rows(rows, plan), headers
+    where = plan['where']
+    bucket_s = prebucket_seconds(plan)
+    aggregates, _ = select_aggregates(bucket_s, where['start'], where['end'], plan['fields'],
+                                      (rows[0]['station_id'],))
+    headers['X-Downsample-Bucket'] = str(bucket_s)
+    return downsample_buckets(aggregates, bucket_s, plan), headers
+
+def select_downsampled(plan):
+    """Rows of a plan_downsampled() query, archived ones included."""
+    rows = STORAGE.select(plan['sql'], plan['params'])
+    return merge_downsampled(plan, rows) if archive_reaches(plan['where']) else rows
+
+def merge_downsampled(plan, rows):
+    """Hot rows of a plan_downsampled() query merged with the archived ones, newest first."""
+    bounds = dict(plan['where'])
+    if not bounds['stations']:
+        # The station the hot query picked, or the newest archived one when the window is all archived
+        newest = rows[:1] or ARCHIVE.rows(['station_id'], ('created_at', 'id'), True, 1, **bounds)
+        if not newest:
+            return []
+        bounds['stations'] = (newest[0]['station_id'],)
+    if len(rows) > LTTB_MAX_ROWS:
+        # Too many rows already: downsampled() reads buckets instead
+        return rows
+    archived = ARCHIVE.rows(['id', 'station_id', 'created_at'] + plan['fields'], ('created_at', 'id'), True,
+                            LTTB_MAX_ROWS + 1, **bounds)
+    for r in archived:
+        r['ts'] = archive.epoch(r.pop('created_at'))
+    return merge_rows(list(rows), archived, ('ts', 'id'), True)[:LTTB_MAX_ROWS + 1]
+
+def downsampled_headers(rows):
+    return {'X-Station': rows[0]['station_id']} if rows else {}
+
+def downsampled_measures(plan):
+    try:
+        body, headers = downsampled(plan, select_downsampled(plan))
+    except Exception as e:
+        return jsonify(status='error', message=str(e), type=type(e).__name__), 500
+    resp = jsonify(body)
+    resp.headers.update(headers)
+    return resp, 200
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_FETCH_ROWS = 1000
+
+@app.route('/measures/export', methods=['GET'])
+@app.route('/mesures/export', methods=['GET'])  # alias FR
+def export_measures():
+    """Stream the whole window as CSV or NDJSON through an unbuffered server-side cursor."""
+    ensure_db()
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify(error=f"Unknown format: {fmt!r} (expected csv or ndjson)"), 400
+    try:
+        start, end = time_range_args()
+        fields = fields_arg(MEASURE_FIELDS)
+        station_sql, stations = station_filter()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    conditions = []
+    params = []
+    if station_sql is not None:
+        conditions.append(station_sql)
+        params.extend(stations)
+    if start is not None:
+        conditions.append('created_at >= %s')
+        params.append(start)
+    if end is not None:
+        conditions.append('created_at < %s')
+        params.append(end)
+    columns = list(ID_COLUMNS) + fields
+    sql = (
+        f"SELECT {', '.join(columns)} FROM mesures"
+        + (" WHERE " + " AND ".join(conditions) if conditions else "")
+        + " ORDER BY id"
+    )
+
+    # Open the cursor before streaming so DB errors still produce a proper 500
+    try:
+        stream = STORAGE.export(sql, params, EXPORT_FETCH_ROWS)
+    except Exception as e:
+        return jsonify(status='error', message=str(e), type=type(e).__name__), 500
+    batches = stream
+    if archive_reaches({'start': start, 'end': end}):
+        archived = ARCHIVE.iter_rows(columns, EXPORT_FETCH_ROWS, start, end, stations)
+        batches = merged_batches(stream, archived, EXPORT_FETCH_ROWS)
+
+    def generate():
+        done = False
+        try:
+            if fmt == 'csv':
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(columns)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            for rows in batches:
+                if fmt == 'csv':
+                    for r in rows:
+                        writer.writerow([export_value(r[c]) for c in columns])
+                    chunk = buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+                else:
+                    chunk = ''.join(
+                        json.dumps({c: export_value(r[c]) for c in columns}) + '\n' for r in rows
+                    )
+                yield chunk
+            done = True
+        finally:
+            stream.close(aborted=not done)
+
+    filename = f"mesures.{fmt}"
+    resp = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    # The body is never iterated for HEAD (or if sending fails first): close the cursor anyway.
+    # After generate() ran, the stream is already closed and this is a no-op
+    resp.call_on_close(lambda: stream.close(aborted=True))
+    return resp
+
+def merged_batches(stream, archived, batch_rows):
+    """Batches of the rows of a RowStream and of archived rows, both in id order, merged by id."""
+    batch = []
+    last_id = None
+    for row in heapq.merge(archived, (r for rows in stream for r in rows), key=lambda r: r['id']):
+        if row['id'] == last_id:
+            # Archived but not yet deleted from the hot table
+            continue
+        last_id = row['id']
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    return value
+
+# Columns that /measures/aggregate can summarise (pluie_detectee averages to the rain ratio)
+AGG_FIELDS = ('temperature', 'humidite', 'pression', 'co2', 'humidite_surface', 'pluie_detectee', 'indice_uv')
+AGG_MAX_BUCKETS = int(os.getenv('AGG_MAX_BUCKETS', '20000'))
+BUCKET_RE = re.compile(r'^(\d+)([smhdw])$')
+
+def parse_bucket(value):
+    """Parse a bucket width like '10m', '1h' or '1d' into seconds. Raises ValueError."""
+    m = BUCKET_RE.match(value.strip())
+    if not m or int(m.group(1)) <= 0:
+        raise ValueError(f"Invalid bucket: {value!r} (expected e.g. 30s, 10m, 1h, 1d)")
+    return int(m.group(1)) * RELATIVE_UNITS[m.group(2)]
+
+def fields_arg(allowed, args=None):
+    """Return the requested ?fields= subset of allowed (all of them if absent). Raises ValueError."""
+    raw = (request.args if args is None else args).get('fields')
+    if not raw:
+        return list(allowed)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or raw} (allowed: {', '.join(allowed)})")
+    return fields
+
+def format_aggregate(rows, fields):
+    out = []
+    for r in rows:
+        item = {
+            'bucket': datetime.utcfromtimestamp(int(r['bucket'])).isoformat() + 'Z',
+            'count': int(r['n']),
+        }
+        for f in fields:
+            avg = r[f + '__avg']
+            item[f] = {
+                'avg': float(avg) if avg is not None else None,
+                'min': r[f + '__min'],
+                'max': r[f + '__max'],
+                'count': int(r[f + '__count']),
+            }
+        out.append(item)
+    return out
+
+def select_aggregates(bucket_s, start, end, fields, stations=()):
+    """(rows, source) of per-bucket aggregates, archived rows included."""
+    # MariaDB reads long ranges from the coarsest rollup table that divides the bucket width
+    rows, source = STORAGE.aggregate(bucket_s, start, end, fields, stations)
+    # Rollup tables keep the archived buckets; raw aggregates add the archive's
+    if source == 'mesures' and archive_reaches({'start': start, 'end': end}):
+        rows = archive.merge_aggregates(rows, ARCHIVE.aggregate(bucket_s, start, end, fields, stations), fields)
+        source = 'mesures+archive'
+    return rows, source
+
+@app.route('/measures/aggregate', methods=['GET'])
+@app.route('/mesures/aggregate', methods=['GET'])  # alias FR
+def aggregate_measures():
+    """Per-bucket aggregates computed in SQL, e.g. ?bucket=10m&from=-7d&fields=temperature,co2"""
+    ensure_db()
+    try:
+        bucket_s = parse_bucket(request.args.get('bucket', '10m'))
+        start, end = time_range_args()
+        fields = fields_arg(AGG_FIELDS)
+        _, stations = station_filter()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if start is None:
+        start = datetime.utcnow() - timedelta(days=1)
+    span = ((end or datetime.utcnow()) - start).total_seconds()
+    if span / bucket_s > AGG_MAX_BUCKETS:
+        return jsonify(error=f'Too many buckets (max {AGG_MAX_BUCKETS}): use a wider bucket or a shorter range'), 400
+
+    try:
+        rows, source = select_aggregates(bucket_s, start, end, fields, stations)
+    except Exception as e:
+        return jsonify(status='error', message=str(e), type=type(e).__name__), 500
+    resp = jsonify(format_aggregate(rows, fields))
+    resp.headers['X-Aggregate-Source'] = source
+    return resp, 200
+
+
+# Cold rows are moved to day-partitioned Parquet files (see archive.py, needs pyarrow); reads
+# combine them with the hot table. ARCHIVE_AFTER_DAYS=0 never archives (existing files are still read).
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE = archive.Archive(ARCHIVE_DIR) if archive.pa is not None else None
+ARCHIVE_OLDEST_SQL = "SELECT created_at FROM mesures WHERE created_at < %s ORDER BY created_at LIMIT 1"
+ARCHIVE_DAY_SQL = f"SELECT {SELECT_COLUMNS} FROM mesures WHERE created_at >= %s AND created_at < %s ORDER BY id"
+
+def archive_cold_rows(days):
+    """Move the rows of UTC days ending more than `days` days ago to the archive, a day at a time.
+
+    Returns {day: rows archived}, or None if another process is archiving. Each day is written
+    (and fsynced) before its rows are deleted, by id; after a crash in between, the rows already
+    in the archive are only deleted on the next run.
+    """
+    cutoff = archive.day_start(utc_now_seconds().date() - timedelta(days=days))
+    done = {}
+    with ARCHIVE.lock() as locked:
+        if not locked:
+            return None
+        while True:
+            oldest = STORAGE.select(ARCHIVE_OLDEST_SQL, [cutoff])
+            if not oldest:
+                return done
+            day = oldest[0]['created_at'].date()
+            start = archive.day_start(day)
+            end = start + timedelta(days=1)
+            known = ARCHIVE.archived_ids(day)
+            ids = []
+
+            def batches():
+                stream = STORAGE.export(ARCHIVE_DAY_SQL, [start, end], EXPORT_FETCH_ROWS)
+                done_reading = False
+                try:
+                    for rows in stream:
+                        ids.extend(r['id'] for r in rows)
+                        yield [r for r in rows if r['id'] not in known]
+                    done_reading = True
+                finally:
+                    stream.close(aborted=not done_reading)
+
+            _, written = ARCHIVE.write(day, batches())
+            STORAGE.delete_rows(ids, start, end)
+            done[day] = done.get(day, 0) + written
+
+
+# mesures is partitioned by month (see partitions.py)
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))  # months created in advance
+RETENTION_MONTHS = int(os.getenv('RETENTION_MONTHS', '0'))  # raw rows older than this are dropped; 0 keeps all
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv('PARTITION_MAINTENANCE_INTERVAL', '86400'))  # seconds; 0 disables
+
+def maintain_partitions():
+    return STORAGE.maintain_partitions(PARTITION_MONTHS_AHEAD, RETENTION_MONTHS)
+
+def archiving():
+    return ARCHIVE is not None and ARCHIVE_AFTER_DAYS > 0
+
+def partition_maintenance_loop():
+    while True:
+        try:
+            ensure_db()
+            if DB_INIT_DONE and archiving():
+                archived = archive_cold_rows(ARCHIVE_AFTER_DAYS)
+                if archived:
+                    print('Archived:', ', '.join(f'{day} ({n} rows)' for day, n in sorted(archived.items())))
+            if DB_INIT_DONE and STORAGE.partitioned:
+                created, dropped = maintain_partitions() or ((), ())
+                if created or dropped:
+                    print('Partitions created:', ', '.join(created) or '-', '/ dropped:', ', '.join(dropped) or '-')
+            if DB_INIT_DONE:
+                pruned = STORAGE.prune_sequences(SEQ_RETENTION_DAYS)
+                if pruned:
+                    print(f'Sequence numbers older than {SEQ_RETENTION_DAYS} days forgotten: {pruned}')
+        except Exception as e:
+            print('Partition maintenance failed:', e)
+        time.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+def start_partition_maintenance():
+    if PARTITION_MAINTENANCE_INTERVAL > 0 and (STORAGE.partitioned or archiving()):
+        threading.Thread(target=partition_maintenance_loop, name='partitions', daemon=True).start()
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Backfill mesures_1m/1h/1d from the raw mesures table."""
+    if not STORAGE.partitioned:
+        raise SystemExit(f'No rollup tables with STORAGE_BACKEND={STORAGE.name}')
+    ensure_db()
+    if not DB_INIT_DONE:
+        raise SystemExit(f'Database not ready: {DB_INIT_ERROR}')
+    # Archived rows are no longer in mesures: keep the buckets they were counted in
+    since = ARCHIVE.horizon if ARCHIVE is not None else None
+    STORAGE.rebuild_rollups(AGG_FIELDS, since)
+    print('Rollups rebuilt:', ', '.join(table for table, _ in rollups.ROLLUPS),
+          f'(buckets from {since} on)' if since else '')
+
+@app.cli.command('archive')
+def archive_command():
+    """Move the rows older than ARCHIVE_AFTER_DAYS days to Parquet files under ARCHIVE_DIR."""
+    if ARCHIVE is None:
+        raise SystemExit('Archiving needs pyarrow (pip install pyarrow)')
+    if ARCHIVE_AFTER_DAYS <= 0:
+        raise SystemExit('Set ARCHIVE_AFTER_DAYS to the age (in days) of the rows to archive')
+    ensure_db()
+    if not DB_INIT_DONE:
+        raise SystemExit(f'Database not ready: {DB_INIT_ERROR}')
+    archived = archive_cold_rows(ARCHIVE_AFTER_DAYS)
+    if archived is None:
+        raise SystemExit('Archiving already running in another process')
+    for day, n in sorted(archived.items()):
+        print(f'{day}: {n} rows')
+    print('Archived days:', len(archived))
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations and print the schema version."""
+    ensure_db()
+    if not DB_INIT_DONE:
+        raise SystemExit(f'Migration failed: {DB_INIT_ERROR}')
+    print(f'Schema at version {SCHEMA_VERSION} (latest {STORAGE.latest_version})')
+
+@app.cli.command('partitions')
+def partitions_command():
+    """Pre-create the next monthly partitions and drop those past RETENTION_MONTHS."""
+    if not STORAGE.partitioned:
+        raise SystemExit(f'No partitions with STORAGE_BACKEND={STORAGE.name}')
+    ensure_db()
+    if not DB_INIT_DONE:
+        raise SystemExit(f'Database not ready: {DB_INIT_ERROR}')
+    result = maintain_partitions()
+    if result is None:
+        raise SystemExit('Partition maintenance already running in another process')
+    created, dropped = result
+    print('Created:', ', '.join(created) or '-')
+    print('Dropped:', ', '.join(dropped) or '-')
+
+def warm_up():
+    """Before a process serves: migrate, start the maintenance thread, load the in-memory caches."""
+    # On failure requests retry the migration lazily and /health reports the error
+    ensure_db()
+    if DB_INIT_ERROR:
+        print('Schema migration deferred:', DB_INIT_ERROR)
+    start_partition_maintenance()
+    # A failed warmup is retried on first read
+    if HOT_CACHE is not None:
+        try:
+            reload_hot_cache()
+        except Exception as e:
+            print('Hot cache warmup skipped:', e)
+    try:
+        reload_summaries()
+    except Exception as e:
+        print('Summary warmup skipped:', e)
 
 if __name__ == '__main__':
+    # Development server; production runs gunicorn -c gunicorn.conf.py (several worker processes)
+    warm_up()
     port = int(os.getenv('PORT', '5000'))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,301 @@
+"""Cold mesures rows archived to compressed Parquet files, one directory per UTC day.
+
+    ARCHIVE_DIR/day=2026-01-31/part-0000120000-0000124079.parquet    (first and last id)
+
+A part is written once (under a temporary name, then renamed) and never modified; rows of an
+archived day that reach the hot table later (buffered measurements) go to another part. Parts
+are sorted by id, zstd-compressed and columnar: a scan reads only the columns it returns, only
+the parts whose day and id range can match (from the path, without opening them), and within
+a part the row groups whose created_at statistics overlap the window.
+
+Needs pyarrow; without it there is no archive and reads see the hot table only.
+"""
+import fcntl
+import heapq
+import os
+import re
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FIELDS = ('temperature', 'humidite', 'pression', 'co2', 'humidite_surface', 'pluie_detectee', 'indice_uv')
+DAY_DIR_RE = re.compile(r'^day=(\d{4}-\d{2}-\d{2})$')
+PART_RE = re.compile(r'^part-(\d+)-(\d+)\.parquet$')
+# Rows per row group: the unit a created_at filter can skip
+ROW_GROUP_ROWS = 65536
+COMPRESSION = 'zstd'
+
+Part = namedtuple('Part', 'day first_id last_id path')
+
+
+def schema():
+    return pa.schema(
+        [('id', pa.int64()), ('created_at', pa.timestamp('s')), ('station_id', pa.string())]
+        + [(f, pa.int8() if f == 'pluie_detectee' else pa.float64()) for f in FIELDS]
+    )
+
+
+def day_start(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def epoch(dt):
+    return int((dt - datetime(1970, 1, 1)).total_seconds())
+
+
+class Archive:
+    """The parts under path. The list is re-read when a writer (any process) touches the directory."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._parts = []
+        self._stamp = None
+        self._schema = schema()
+
+    def parts(self):
+        try:
+            stamp = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if stamp != self._stamp:
+                self._parts = self._list_parts()
+                self._stamp = stamp
+            return self._parts
+
+    def _list_parts(self):
+        parts = []
+        for name in os.listdir(self.path):
+            m = DAY_DIR_RE.match(name)
+            if not m:
+                continue
+            day = date.fromisoformat(m.group(1))
+            directory = os.path.join(self.path, name)
+            for part in os.listdir(directory):
+                p = PART_RE.match(part)
+                if p:
+                    parts.append(Part(day, int(p.group(1)), int(p.group(2)), os.path.join(directory, part)))
+        return sorted(parts, key=lambda p: (p.day, p.first_id))
+
+    @property
+    def horizon(self):
+        """End of the newest archived day (rows before it may be archived), or None."""
+        parts = self.parts()
+        return day_start(parts[-1].day) + timedelta(days=1) if parts else None
+
+    def select_parts(self, start=None, end=None, after_id=None, before_id=None, after_key=None, before_key=None):
+        """Parts that may hold rows with start <= created_at < end and after_id < id < before_id.
+
+        after_key/before_key are (created_at, id) cursors, compared as pairs.
+        """
+        if after_key is not None and (start is None or after_key[0] > start):
+            start = after_key[0]
+        if before_key is not None and (end is None or before_key[0] + timedelta(seconds=1) < end):
+            end = before_key[0] + timedelta(seconds=1)
+        return [
+            p for p in self.parts()
+            if (start is None or day_start(p.day) + timedelta(days=1) > start)
+            and (end is None or day_start(p.day) < end)
+            and (after_id is None or p.last_id > after_id)
+            and (before_id is None or p.first_id < before_id)
+        ]
+
+    def _filter(self, start, end, stations, after_id, before_id, after_key=None, before_key=None):
+        conditions = []
+        for key, later in ((after_key, True), (before_key, False)):
+            if key is not None:
+                at = pa.scalar(key[0], pa.timestamp('s'))
+                if later:
+                    conditions.append((ds.field('created_at') > at)
+                                      | ((ds.field('created_at') == at) & (ds.field('id') > key[1])))
+                else:
+                    conditions.append((ds.field('created_at') < at)
+                                      | ((ds.field('created_at') == at) & (ds.field('id') < key[1])))
+        if start is not None:
+            conditions.append(ds.field('created_at') >= pa.scalar(start, pa.timestamp('s')))
+        if end is not None:
+            conditions.append(ds.field('created_at') < pa.scalar(end, pa.timestamp('s')))
+        if stations:
+            conditions.append(ds.field('station_id').isin(list(stations)))
+        if after_id is not None:
+            conditions.append(ds.field('id') > after_id)
+        if before_id is not None:
+            conditions.append(ds.field('id') < before_id)
+        expr = None
+        for c in conditions:
+            expr = c if expr is None else expr & c
+        return expr
+
+    def scan(self, columns, start=None, end=None, stations=(), after_id=None, before_id=None,
+             after_key=None, before_key=None):
+        """pyarrow Table of the matching archived rows (only those columns), or None if no part can match."""
+        parts = self.select_parts(start, end, after_id, before_id, after_key, before_key)
+        if not parts:
+            return None
+        dataset = ds.dataset([p.path for p in parts], schema=self._schema, format='parquet')
+        return dataset.to_table(columns=list(columns),
+                                filter=self._filter(start, end, stations, after_id, before_id, after_key, before_key))
+
+    def rows(self, columns, sort_keys, descending=False, limit=None, **where):
+        """The first `limit` matching rows (dicts) in sort_keys order, e.g. sort_keys=('created_at', 'id')."""
+        table = self.scan(dict.fromkeys(list(columns) + list(sort_keys)), **where)
+        if table is None or table.num_rows == 0:
+            return []
+        order = 'descending' if descending else 'ascending'
+        table = table.sort_by([(k, order) for k in sort_keys])
+        if limit is not None:
+            table = table.slice(0, limit)
+        return table.select(list(columns)).to_pylist()
+
+    def iter_rows(self, columns, batch_rows=1000, start=None, end=None, stations=()):
+        """Every matching row (dict) in id order, reading batch_rows at a time.
+
+        Parts are opened as the merge reaches their first id, so a long export holds a few
+        of them at once, not every day of the range.
+        """
+        parts = sorted(self.select_parts(start, end), key=lambda p: p.first_id)
+        expr = self._filter(start, end, stations, None, None)
+        columns = list(dict.fromkeys(['id'] + list(columns)))
+
+        def part_rows(part):
+            dataset = ds.dataset(part.path, schema=self._schema, format='parquet')
+            for batch in dataset.to_batches(columns=columns, filter=expr, batch_size=batch_rows):
+                yield from batch.to_pylist()
+
+        heap = []
+        i = 0
+        while heap or i < len(parts):
+            # Open every part that may hold an id below the smallest one pending
+            while i < len(parts) and (not heap or parts[i].first_id <= heap[0][0]):
+                it = part_rows(parts[i])
+                row = next(it, None)
+                if row is not None:
+                    heapq.heappush(heap, (row['id'], i, row, it))
+                i += 1
+            if not heap:
+                continue
+            _, n, row, it = heapq.heappop(heap)
+            yield row
+            following = next(it, None)
+            if following is not None:
+                heapq.heappush(heap, (following['id'], n, following, it))
+
+    def aggregate(self, bucket_s, start, end, fields, stations=()):
+        """Per-bucket aggregates of the archived rows, in storage.aggregate_query()'s row format."""
+        table = self.scan(['created_at'] + list(fields), start=start, end=end, stations=stations)
+        if table is None or table.num_rows == 0:
+            return []
+        seconds = pc.cast(table['created_at'], pa.int64())
+        table = table.append_column('bucket', pc.multiply(pc.divide(seconds, bucket_s), bucket_s))
+        specs = [('created_at', 'count')]
+        for f in fields:
+            specs += [(f, 'mean'), (f, 'min'), (f, 'max'), (f, 'count')]
+        grouped = table.group_by('bucket').aggregate(specs).sort_by('bucket')
+        out = []
+        for r in grouped.to_pylist():
+            row = {'bucket': r['bucket'], 'n': r['created_at_count']}
+            for f in fields:
+                row.update({f'{f}__avg': r[f'{f}_mean'], f'{f}__min': r[f'{f}_min'],
+                            f'{f}__max': r[f'{f}_max'], f'{f}__count': r[f'{f}_count']})
+            out.append(row)
+        return out
+
+    def archived_ids(self, day):
+        """Ids already archived for a day (only the id column is read)."""
+        paths = [p.path for p in self.parts() if p.day == day]
+        if not paths:
+            return set()
+        return set(ds.dataset(paths, schema=self._schema, format='parquet').to_table(columns=['id'])['id'].to_pylist())
+
+    def write(self, day, batches):
+        """Write batches of rows (dicts in ascending id order) of one day as a new part.
+
+        Returns (path, rows written); (None, 0) when there was nothing to write.
+        """
+        directory = os.path.join(self.path, f'day={day.isoformat()}')
+        os.makedirs(directory, exist_ok=True)
+        tmp = os.path.join(directory, f'.part-{os.getpid()}-{threading.get_ident()}.tmp')
+        writer = None
+        first_id = last_id = None
+        count = 0
+        try:
+            for rows in batches:
+                if not rows:
+                    continue
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp, self._schema, compression=COMPRESSION)
+                    first_id = rows[0]['id']
+                writer.write_table(pa.Table.from_pylist(rows, schema=self._schema), row_group_size=ROW_GROUP_ROWS)
+                last_id = rows[-1]['id']
+                count += len(rows)
+            if writer is None:
+                return None, 0
+            writer.close()
+            writer = None
+            with open(tmp, 'rb') as f:
+                os.fsync(f.fileno())
+            path = os.path.join(directory, f'part-{first_id:010d}-{last_id:010d}.parquet')
+            os.replace(tmp, path)
+            self._fsync_dir(directory)
+            # Readers re-list the parts when the top directory changes
+            os.utime(self.path)
+            return path, count
+        finally:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    @staticmethod
+    def _fsync_dir(path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def lock(self):
+        """Yield True while holding the archive's writer lock, False if another process holds it."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def merge_aggregates(a, b, fields):
+    """Aggregate rows of two sources combined per bucket (counts add up, averages are weighted)."""
+    merged = {}
+    for row in list(a) + list(b):
+        key = int(row['bucket'])
+        into = merged.get(key)
+        if into is None:
+            merged[key] = dict(row, bucket=key)
+            continue
+        into['n'] = int(into['n']) + int(row['n'])
+        for f in fields:
+            n1, n2 = int(into[f'{f}__count']), int(row[f'{f}__count'])
+            if n2:
+                avg1, avg2 = into[f'{f}__avg'], row[f'{f}__avg']
+                into[f'{f}__avg'] = (float(avg1) * n1 + float(avg2) * n2) / (n1 + n2) if n1 else avg2
+                into[f'{f}__min'] = row[f'{f}__min'] if not n1 else min(into[f'{f}__min'], row[f'{f}__min'])
+                into[f'{f}__max'] = row[f'{f}__max'] if not n1 else max(into[f'{f}__max'], row[f'{f}__max'])
+            into[f'{f}__count'] = n1 + n2
+    return [merged[k] for k in sorted(merged)]
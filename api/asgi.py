@@ -0,0 +1,455 @@
+"""ASGI serving mode: /add, /measures, /measures/stream and /health on asyncio with an async MySQL pool.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    SERVE_APP=asgi gunicorn -c gunicorn.conf.py     # one uvicorn worker per CPU
+
+A waiting request or an idle stream costs a coroutine instead of a thread, so one process can hold
+many thousands of station and SSE connections. Request parsing, SQL, JSON encoding and the
+in-memory state (hot cache, newest id for ETags, stream fan-out, write-behind WAL) are shared with
+app.py, so the JSON contract is the same. Every other route is the Flask app behind a WSGI bridge.
+
+The native routes need the MariaDB backend; with STORAGE_BACKEND=sqlite every route is Flask's.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+import aiomysql
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags, quote_etag
+
+import app as core
+import binproto
+from events import StreamPosition
+
+# Async connection pool, shared by every coroutine of the process
+ASYNC_POOL_MIN = int(os.getenv('ASYNC_POOL_MIN', '0'))  # connections opened at startup
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', '20'))  # max connections; more requests wait
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '10'))  # threads for the routes served by Flask
+ASYNC_NATIVE = core.STORAGE.name == 'mariadb'
+
+POOL = None
+
+
+async def create_pool():
+    return await aiomysql.create_pool(
+        minsize=ASYNC_POOL_MIN,
+        maxsize=ASYNC_POOL_SIZE,
+        pool_recycle=int(core.DB_POOL_RECYCLE),
+        host=core.DB_HOST,
+        port=core.DB_PORT,
+        user=core.DB_USER,
+        password=core.DB_PASS,
+        db=core.DB_NAME,
+        cursorclass=aiomysql.DictCursor,
+        autocommit=True,
+        # Same UTC session as connect_db()
+        init_command="SET time_zone = '+00:00'",
+    )
+
+
+async def execute(cur, sql, params=None):
+    with core.DB_QUERY_SECONDS.time(statement=core.statement_kind(sql)):
+        await cur.execute(sql, params)
+
+
+async def fetch_all(sql, params=None):
+    async with POOL.acquire() as conn:
+        async with conn.cursor() as cur:
+            await execute(cur, sql, params)
+            return await cur.fetchall()
+
+
+async def ensure_db():
+    # Migrations use the blocking driver once per process; afterwards this is a flag check
+    if not core.DB_INIT_DONE:
+        await run_in_threadpool(core.ensure_db)
+
+
+def json_response(body, status=200, headers=None):
+    # Flask's JSON provider: same key order, datetime format and compact separators as jsonify
+    data = core.app.json.dumps(body, separators=(',', ':')) + '\n'
+    return Response(data, status_code=status, headers=headers, media_type='application/json')
+
+
+def error_response(e):
+    return json_response({'status': 'error', 'message': str(e), 'type': type(e).__name__}, 500)
+
+
+async def health(request):
+    db_status = 'ready' if core.DB_INIT_DONE else ('error' if core.DB_INIT_ERROR else 'not-initialized')
+    ingest = {'mode': core.INGEST_MODE}
+    if core.INGEST_QUEUE is not None:
+        ingest.update(core.INGEST_QUEUE.stats())
+    pool = {
+        'size': POOL.maxsize,
+        'open': POOL.size,
+        'idle': POOL.freesize,
+        'in_use': POOL.size - POOL.freesize,
+    }
+    return json_response({
+        'status': 'ok',
+        'db': db_status,
+        'db_error': core.DB_INIT_ERROR,
+        'schema_version': core.SCHEMA_VERSION,
+        'pool': pool,
+        'ingest': ingest,
+        'cache': core.HOT_CACHE.stats() if core.HOT_CACHE is not None else None,
+        'stream': core.BROADCASTER.stats(),
+        'time': datetime.utcnow().isoformat() + 'Z',
+    })
+
+
+# --- ingest -------------------------------------------------------------------------
+
+async def store_rows(rows):
+    """Async counterpart of app.store_rows()."""
+    if core.INGEST_QUEUE is not None:
+        # The WAL append may fsync: keep it off the event loop
+        await run_in_threadpool(core.INGEST_QUEUE.append, rows)
+        return None
+
+    await ensure_db()
+    inserted = []
+    async with POOL.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                claimed = []
+                token = core.new_claim_token()
+                for claim_sql, claim_params, read_sql, read_params in core.claim_statements(rows, token):
+                    await execute(cur, claim_sql, claim_params)
+                    await execute(cur, read_sql, read_params)
+                    claimed += [core.claimed_key(r) for r in await cur.fetchall()]
+                keep = core.claimed_rows(rows, claimed)
+                for chunk, sql, params in core.insert_chunks([rows[i] for i in keep]):
+                    await execute(cur, sql, params)
+                    first = cur.lastrowid
+                    inserted.extend(range(first, first + len(chunk)))
+                    for rollup_sql, rollup_params in core.rollup_statements(chunk, first):
+                        await execute(cur, rollup_sql, rollup_params)
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    ids = [None] * len(rows)
+    for i, row_id in zip(keep, inserted):
+        ids[i] = row_id
+    core.record_inserted(rows, ids)
+    return ids
+
+
+def content_type(request):
+    return request.headers.get('content-type', '').split(';')[0].strip().lower()
+
+
+async def add(request):
+    received_at = core.utc_now_seconds()
+    mimetype = content_type(request)
+    body = await request.body()
+    if mimetype == binproto.MIMETYPE:
+        try:
+            items = binproto.decode_frame(body)
+        except binproto.DecodeError as e:
+            return json_response({'error': f'Invalid binary frame: {e}'}, 400)
+    elif mimetype == 'application/json' or (mimetype.startswith('application/') and mimetype.endswith('+json')):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return json_response({'error': 'Expected a JSON object'}, 400)
+        items = [data]
+    else:
+        return json_response({'error': f'Expected application/json or {binproto.MIMETYPE}'}, 400)
+
+    try:
+        rows = core.ingest_rows(items, request.headers, received_at)
+    except PermissionError as e:
+        return json_response({'error': str(e)}, 403)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    try:
+        ids = await store_rows(rows)
+    except Exception as e:
+        return json_response({'status': 'error', 'message': str(e)}, 500)
+    extra = {'count': len(rows)} if len(rows) > 1 else {}
+    if ids is None:
+        return json_response({'status': 'queued', **extra}, 202)
+    duplicates = ids.count(None)
+    if duplicates == len(ids):
+        return json_response({'status': 'duplicate', 'duplicates': duplicates, **extra}, 200)
+    if duplicates:
+        extra['duplicates'] = duplicates
+    return json_response({'status': 'ok', **extra}, 201)
+
+
+# --- reads --------------------------------------------------------------------------
+
+async def current_max_id():
+    max_id = core.known_max_id()
+    if max_id is not None:
+        return max_id
+    rows = await fetch_all(core.MAX_ID_SQL)
+    return core.store_max_id(rows[0]['max_id'] or 0)
+
+
+async def reload_hot_cache():
+    await ensure_db()
+    core.load_hot_cache(await fetch_all(core.HOT_CACHE_SQL, (core.HOT_CACHE_SIZE,)))
+
+
+async def cached_latest(limit):
+    if core.HOT_CACHE is None:
+        return None
+    try:
+        max_id = await current_max_id()
+        if core.HOT_CACHE.valid and core.HOT_CACHE.newest_id < max_id:
+            core.HOT_CACHE.add(await rows_after(core.HOT_CACHE.newest_id, core.HOT_CACHE_SIZE))
+        if not core.HOT_CACHE.valid or core.HOT_CACHE.newest_id < max_id:
+            await reload_hot_cache()
+    except Exception:
+        return None
+    return core.HOT_CACHE.latest(limit)
+
+
+async def list_measures(request):
+    await ensure_db()
+    args = MultiDict(request.query_params.multi_items())
+    try:
+        etag = core.measures_etag(await current_max_id(), args)
+    except Exception:
+        etag = None
+    if etag is not None and parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+        return Response(status_code=304, headers={'ETag': quote_etag(etag, weak=True), 'Cache-Control': 'no-cache'})
+    resp = await query_measures(args)
+    if etag is not None and resp.status_code == 200:
+        resp.headers['ETag'] = quote_etag(etag, weak=True)
+        resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+def measures_json(rows, plan, cache_hit=False):
+    headers = {'X-Cache': 'hit'} if cache_hit else {}
+    cursor = core.next_cursor(rows, plan)
+    if cursor is not None:
+        headers['X-Next-Cursor'] = cursor
+    if cache_hit:
+        rows = core.project_rows(rows, plan['columns'])
+    return json_response(core.measures_body(rows, plan['columns'], plan['fmt']), headers=headers)
+
+
+async def query_measures(args):
+    try:
+        plan = core.plan_measures(args)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    if plan['lttb']:
+        try:
+            rows = await fetch_all(plan['sql'], plan['params'])
+            if core.archive_reaches(plan['where']):
+                # Parquet reads block: off the event loop
+                rows = await run_in_threadpool(core.merge_downsampled, plan, rows)
+        except Exception as e:
+            return error_response(e)
+        # NumPy work (and the bucket read of a window too large for raw rows): off the event loop
+        try:
+            body, headers = await run_in_threadpool(core.downsampled, plan, rows)
+        except Exception as e:
+            return error_response(e)
+        return json_response(body, headers=headers)
+
+    if plan['latest']:
+        rows = await cached_latest(plan['limit'])
+        if rows is not None:
+            return measures_json(rows, plan, cache_hit=True)
+
+    try:
+        sql, params, archived = core.measures_query(plan)
+        rows = await fetch_all(sql, params)
+        if archived:
+            rows = await run_in_threadpool(core.merge_archived, plan, rows)
+    except Exception as e:
+        return error_response(e)
+    if plan['order'] == 'ASC':
+        rows = list(reversed(rows))
+    return measures_json(rows, plan)
+
+
+async def rows_after(last_id, limit, station_sql=None, stations=()):
+    return await fetch_all(*core.rows_after_query(last_id, limit, station_sql, stations))
+
+
+async def stream_measures(request):
+    """Same events as the Flask stream; an idle subscriber holds no thread."""
+    await ensure_db()
+    last_event_id = request.headers.get('last-event-id') or request.query_params.get('last_id')
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_id = None
+    try:
+        _, stations = core.station_filter(MultiDict(request.query_params.multi_items()))
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    async def generate():
+        sub = core.BROADCASTER.subscribe(loop=asyncio.get_running_loop())
+        position = StreamPosition(await current_max_id() if last_id is None else last_id, core.GAP_TIMEOUT_S)
+        read_from = last_id
+        written_at = time.monotonic()
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                if read_from is not None:
+                    rows = await rows_after(read_from, core.SSE_BACKLOG_ROWS)
+                    read_from = rows[-1]['id'] if len(rows) >= core.SSE_BACKLOG_ROWS else None
+                else:
+                    try:
+                        rows = await sub.get(core.sse_poll_interval())
+                    except asyncio.TimeoutError:
+                        position.advance(time.monotonic())
+                        if core.ETAG_MAX_ID_TTL > 0 and (position.pending or await current_max_id() > position.top):
+                            read_from = position.floor
+                        if time.monotonic() - written_at >= core.SSE_KEEPALIVE:
+                            yield ': keepalive\n\n'
+                            written_at = time.monotonic()
+                        continue
+                    if rows is None:
+                        return
+                    if core.ETAG_MAX_ID_TTL > 0 and rows[0]['id'] > position.top + 1:
+                        read_from = position.floor
+                if sub.overflowed:
+                    return
+                for row in position.accept(rows, time.monotonic()):
+                    if stations and row['station_id'] not in stations:
+                        continue
+                    yield core.sse_event(row, position.floor)
+                    written_at = time.monotonic()
+        finally:
+            core.BROADCASTER.unsubscribe(sub)
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+class RequestMetrics:
+    """ASGI middleware feeding app.py's HTTP metrics for the native routes.
+
+    Routes served through the WSGI bridge are already counted by the Flask request hooks.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in NATIVE_PATHS:
+            await self.app(scope, receive, send)
+            return
+        route, method = scope['path'], scope['method']
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                # Same measure as Flask's: until the response starts, streamed bodies excluded
+                core.HTTP_DURATION.observe(time.perf_counter() - started, route=route, method=method)
+                core.HTTP_REQUESTS.inc(route=route, method=method, status=message['status'])
+            await send(message)
+
+        core.HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            core.HTTP_IN_FLIGHT.dec()
+
+
+@contextlib.contextmanager
+def close_streams_on_exit():
+    """Until the block ends, SIGTERM and SIGINT first end the open streams.
+
+    The server installs its own handlers before the lifespan starts, and only runs the lifespan
+    shutdown once every connection is closed: an open stream would hold the process until it is
+    killed, and the write-behind queue would never be flushed.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)}
+
+    def drain(sig, frame):
+        # From a thread: a signal handler must not wait on a lock
+        threading.Thread(target=core.BROADCASTER.close, daemon=True).start()
+        handlers[sig](sig, frame)
+
+    for sig, handler in handlers.items():
+        if callable(handler):
+            signal.signal(sig, drain)
+    try:
+        yield
+    finally:
+        for sig, handler in handlers.items():
+            if callable(handler):
+                signal.signal(sig, handler)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    global POOL
+    await ensure_db()
+    if core.DB_INIT_ERROR:
+        print('Schema migration deferred:', core.DB_INIT_ERROR)
+    core.start_partition_maintenance()
+    POOL = await create_pool() if ASYNC_NATIVE else None
+    if core.HOT_CACHE is not None:
+        try:
+            await (reload_hot_cache() if ASYNC_NATIVE else run_in_threadpool(core.reload_hot_cache))
+        except Exception as e:
+            print('Hot cache warmup skipped:', e)
+    try:
+        await run_in_threadpool(core.reload_summaries)
+    except Exception as e:
+        print('Summary warmup skipped:', e)
+    try:
+        with close_streams_on_exit():
+            yield
+    finally:
+        if POOL is not None:
+            POOL.close()
+            await POOL.wait_closed()
+
+
+NATIVE_ROUTES = [
+    Route('/health', health, methods=['GET']),
+    Route('/add', add, methods=['POST']),
+    Route('/measures', list_measures, methods=['GET']),
+    Route('/mesures', list_measures, methods=['GET']),  # alias FR
+    Route('/measures/stream', stream_measures, methods=['GET']),
+    Route('/mesures/stream', stream_measures, methods=['GET']),  # alias FR
+]
+NATIVE_PATHS = frozenset(r.path for r in NATIVE_ROUTES) if ASYNC_NATIVE else frozenset()
+
+app = Starlette(
+    routes=(NATIVE_ROUTES if ASYNC_NATIVE else []) + [
+        # Batch, export, aggregates, /latest, /metrics...: the Flask views, run in a thread pool
+        Mount('/', WSGIMiddleware(core.app, workers=WSGI_THREADS)),
+    ],
+    # Outermost first: metrics include compression time, as in Flask.
+    # Flask compresses its own responses (Content-Encoding set, left alone here)
+    middleware=[Middleware(RequestMetrics)]
+    + ([Middleware(GZipMiddleware, minimum_size=core.COMPRESS_MIN_BYTES)] if core.COMPRESS_MIN_BYTES > 0 else []),
+    lifespan=lifespan,
+)
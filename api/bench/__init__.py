@@ -0,0 +1 @@
+"""Load generators for the API (stdlib only). Run from api/: python -m bench.fleet --help"""
@@ -0,0 +1,64 @@
+"""Minimal asyncio HTTP/1.1 client: enough to drive the API without third-party packages."""
+import asyncio
+
+
+class Connection:
+    """One TCP connection, reused for successive requests while the server keeps it alive."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None, keep_alive=True):
+        """Send a request and read the whole response; returns (status, headers with lower-case names)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}', 'Accept-Encoding: identity']
+        if not keep_alive:
+            lines.append('Connection: close')
+        for name, value in (headers or {}).items():
+            lines.append(f'{name}: {value}')
+        if body:
+            lines.append(f'Content-Length: {len(body)}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        try:
+            await self.writer.drain()
+            status, resp_headers = await self._read_response()
+        except BaseException:
+            self.close()
+            raise
+        if not keep_alive or resp_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, resp_headers
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by server')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif status not in (204, 304):
+            await self.reader.read()
+            headers['connection'] = 'close'
+        return status, headers
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
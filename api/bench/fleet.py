@@ -0,0 +1,149 @@
+"""Station-fleet load simulator.
+
+N simulated stations each POST /add every --period seconds (SEND_PERIOD_MS in station_meteo.py),
+with the firmware's payload and encoding and one TCP connection per request like urequests, while
+M dashboards poll /measures the way web/app/data/page.tsx does (latest rows and the 24h LTTB
+charts, with If-None-Match) and --streams viewers hold /measures/stream open like the home page.
+
+Stations follow a fixed schedule (open loop): latency is measured from the time a request was due,
+so a server that falls behind shows it in p99 instead of silently slowing the senders down.
+
+    cd api && python -m bench.fleet http://127.0.0.1:5000 --stations 500 --period 30 --dashboards 20 \\
+        --duration 120 --json results.json [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+from bench.client import Connection
+from bench.payloads import SimulatedStation, encode
+from bench.stats import REQUEST_ERRORS, Recorder, load_summary, print_report, save
+
+TABLE_PATH = '/measures'
+CHARTS_PATH = '/measures?from=-24h&max_points=300&fields=temperature,humidite,pression,indice_uv,co2'
+
+
+async def station(host, port, station_id, args, t_end, recorder, rng):
+    sim = SimulatedStation(station_id, rng)
+    # Stations boot at different times: spread the first send over one period
+    due = time.monotonic() + rng.uniform(0, args.period)
+    while due < t_end:
+        await asyncio.sleep(max(0.0, due - time.monotonic()))
+        headers, body = encode(sim.payload(), args.format)
+        conn = Connection(host, port)
+        try:
+            status, _ = await conn.request('POST', '/add', body, headers, keep_alive=False)
+            ok = status in (200, 201, 202)
+        except REQUEST_ERRORS:
+            ok = False
+        finally:
+            conn.close()
+        recorder.add('POST /add', time.monotonic() - due, ok)
+        due += args.period
+
+
+async def dashboard(host, port, args, t_end, recorder, rng):
+    conn = Connection(host, port)
+    etags = {}
+    due = time.monotonic() + rng.uniform(0, args.poll)
+    while due < t_end:
+        await asyncio.sleep(max(0.0, due - time.monotonic()))
+        for name, path in (('GET /measures', TABLE_PATH), ('GET /measures lttb', CHARTS_PATH)):
+            headers = {'If-None-Match': etags[path]} if path in etags else {}
+            t0 = time.monotonic()
+            status = None
+            try:
+                status, resp_headers = await conn.request('GET', path, headers=headers)
+                ok = status in (200, 304)
+                if 'etag' in resp_headers:
+                    etags[path] = resp_headers['etag']
+            except REQUEST_ERRORS:
+                ok = False
+                conn.close()
+            recorder.add(name, time.monotonic() - t0, ok, not_modified=status == 304)
+        due += args.poll
+    conn.close()
+
+
+async def viewer(host, port, t_end, counts):
+    """An open home page: one SSE stream, counting the events received."""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f'GET /measures/stream HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+        await writer.drain()
+    except OSError:
+        counts['failed'] += 1
+        return
+    counts['open'] += 1
+    try:
+        while time.monotonic() < t_end:
+            try:
+                data = await asyncio.wait_for(reader.read(65536), 1.0)
+            except asyncio.TimeoutError:
+                continue
+            if not data:
+                counts['dropped'] += 1
+                return
+            counts['events'] += data.count(b'\nevent: measure\n')
+    except OSError:
+        counts['dropped'] += 1
+    finally:
+        writer.close()
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    recorder.recording = args.warmup <= 0
+    t_start = time.monotonic()
+    t_end = t_start + args.warmup + args.duration
+    counts = {'open': 0, 'failed': 0, 'dropped': 0, 'events': 0}
+
+    tasks = [station(host, port, f'sim-{i:05d}', args, t_end, recorder, random.Random(rng.random()))
+             for i in range(args.stations)]
+    tasks += [dashboard(host, port, args, t_end, recorder, random.Random(rng.random()))
+              for _ in range(args.dashboards)]
+    tasks += [viewer(host, port, t_end, counts) for _ in range(args.streams)]
+
+    async def end_warmup():
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+
+    await asyncio.gather(end_warmup(), *tasks)
+    summary = recorder.summary(args.duration)
+    offered = args.stations / args.period
+    title = (f'{args.url}  stations={args.stations} period={args.period}s ({offered:.1f} POST/s offered) '
+             f'format={args.format} dashboards={args.dashboards} poll={args.poll}s streams={args.streams} '
+             f'duration={args.duration}s')
+    print_report(title, summary, load_summary(args.baseline) if args.baseline else None)
+    if args.streams:
+        print(f"streams: {counts['open']} opened, {counts['failed']} failed, {counts['dropped']} dropped, "
+              f"{counts['events']} events received")
+    if args.json:
+        config = {k: v for k, v in vars(args).items() if k not in ('json', 'baseline')}
+        save(args.json, {'config': config, 'summary': summary, 'streams': counts})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a station fleet and dashboards against the API.')
+    parser.add_argument('url', help='API base URL, e.g. http://127.0.0.1:5000')
+    parser.add_argument('--stations', type=int, default=100, help='simulated stations')
+    parser.add_argument('--period', type=float, default=30, help='seconds between two posts of a station')
+    parser.add_argument('--format', choices=('binary', 'json'), default='binary', help='firmware encoding')
+    parser.add_argument('--dashboards', type=int, default=5, help='dashboards polling /measures')
+    parser.add_argument('--poll', type=float, default=60, help='seconds between two dashboard refreshes')
+    parser.add_argument('--streams', type=int, default=0, help='open /measures/stream viewers')
+    parser.add_argument('--duration', type=float, default=120, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=10, help='seconds run before measuring')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (payloads, schedule)')
+    parser.add_argument('--json', help='write the configuration and results to this file')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare with')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Measurements shaped like the ones station_meteo.py's main() sends, for simulated stations."""
+import json
+import math
+import random
+
+import binproto
+
+
+class SimulatedStation:
+    """Sensor values drifting slowly around per-station baselines, like a real garden station."""
+
+    def __init__(self, station_id, rng=None):
+        self.station_id = station_id
+        self.rng = rng or random.Random()
+        self.temperature = self.rng.uniform(5, 25)
+        self.humidite = self.rng.uniform(40, 80)
+        self.pression = self.rng.uniform(995, 1030)
+        self.co2 = self.rng.uniform(420, 700)
+        self.humidite_surface = self.rng.uniform(0, 30)
+        self.raining = False
+        # Not from rng: a rerun with the same seed against the same database must not replay seqs
+        self.seq = random.SystemRandom().randrange(binproto.MAX_SEQ // 2)
+
+    def _walk(self, value, step, low, high):
+        return min(high, max(low, value + self.rng.gauss(0, step)))
+
+    def payload(self):
+        """The dict main() builds before each POST (all sensors present)."""
+        self.temperature = self._walk(self.temperature, 0.1, -20, 45)
+        self.humidite = self._walk(self.humidite, 0.3, 5, 100)
+        self.pression = self._walk(self.pression, 0.05, 950, 1050)
+        self.co2 = self._walk(self.co2, 5, 400, 5000)
+        if self.rng.random() < 0.01:
+            self.raining = not self.raining
+        self.humidite_surface = self._walk(self.humidite_surface + (2 if self.raining else -1), 1, 0, 100)
+        self.seq += 1
+        return {
+            'temperature': float(self.temperature),
+            'humidite': float(self.humidite),
+            'pression': float(self.pression),
+            'co2': float(self.co2),
+            'humidite_surface': float(self.humidite_surface),
+            'pluie_detectee': bool(self.raining),
+            'indice_uv': float(max(0.0, 8 * math.sin(self.rng.uniform(0, math.pi)))),
+            'station_id': self.station_id,
+            'seq': self.seq,
+        }
+
+
+def encode(payload, fmt):
+    """(headers, body) of the POST /add the firmware makes for this payload ('binary' or 'json')."""
+    if fmt == 'binary':
+        # The frame has no station field: the firmware sends it as a header
+        return ({'Content-Type': binproto.MIMETYPE, 'X-Station-Id': payload['station_id']},
+                binproto.encode_frame([payload]))
+    return {'Content-Type': 'application/json'}, json.dumps(payload).encode()
@@ -0,0 +1,99 @@
+"""Compare serving modes under concurrent load (closed loop, HTTP/1.1 keep-alive).
+
+Start the two servers on the same database, then point the benchmark at both:
+
+    python app.py                                        # Flask, port 5000
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+    cd api && python -m bench.serving http://127.0.0.1:5000 http://127.0.0.1:8000 --concurrency 200 --idle 1000
+
+Each of --concurrency clients loops over the request mix (POST /add, GET /measures, GET /health)
+for --duration seconds; --idle extra connections sit on /measures/stream meanwhile, like open
+dashboards. Reports req/s and latency percentiles per endpoint.
+"""
+import argparse
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+from bench.client import Connection
+from bench.payloads import SimulatedStation, encode
+from bench.stats import REQUEST_ERRORS, Recorder, print_report
+
+MIX = (
+    # (weight, name, method, path)
+    (5, 'POST /add', 'POST', '/add'),
+    (4, 'GET /measures', 'GET', '/measures?limit=100'),
+    (1, 'GET /health', 'GET', '/health'),
+)
+
+
+async def client(host, port, deadline, recorder, index):
+    weights = [w for w, *_ in MIX]
+    sim = SimulatedStation(f'bench-{index:04d}')
+    conn = Connection(host, port)
+    while time.monotonic() < deadline:
+        _, name, method, path = random.choices(MIX, weights)[0]
+        headers, body = encode(sim.payload(), 'json') if method == 'POST' else ({}, b'')
+        t0 = time.perf_counter()
+        try:
+            status, _ = await conn.request(method, path, body, headers)
+            ok = status < 400
+        except REQUEST_ERRORS:
+            ok = False
+        recorder.add(name, time.perf_counter() - t0, ok)
+    conn.close()
+
+
+async def idle_stream(host, port, stop):
+    """Hold a /measures/stream connection open, draining events, until stop is set."""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f'GET /measures/stream HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+        await writer.drain()
+    except OSError:
+        return False
+    try:
+        while not stop.is_set():
+            try:
+                if not await asyncio.wait_for(reader.read(4096), 0.5):
+                    return False
+            except asyncio.TimeoutError:
+                pass
+        return True
+    except OSError:
+        return False
+    finally:
+        writer.close()
+
+
+async def run(url, concurrency, duration, idle):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    stop = asyncio.Event()
+    streams = [asyncio.create_task(idle_stream(host, port, stop)) for _ in range(idle)]
+    if idle:
+        await asyncio.sleep(1)
+    recorder = Recorder()
+    t0 = time.monotonic()
+    await asyncio.gather(*(client(host, port, t0 + duration, recorder, i) for i in range(concurrency)))
+    elapsed = time.monotonic() - t0
+    stop.set()
+    streams_ok = sum(await asyncio.gather(*streams)) if streams else 0
+    print_report(f'{url}  concurrency={concurrency} idle_streams={idle} ({streams_ok} held) duration={elapsed:.1f}s',
+                 recorder.summary(elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare serving modes under concurrent load.')
+    parser.add_argument('urls', nargs='+', help='base URL of each server to measure, one after the other')
+    parser.add_argument('--concurrency', type=int, default=50, help='concurrent request loops')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per server')
+    parser.add_argument('--idle', type=int, default=0, help='idle SSE connections held during the run')
+    args = parser.parse_args()
+    for url in args.urls:
+        asyncio.run(run(url, args.concurrency, args.duration, args.idle))
+
+
+if __name__ == '__main__':
+    main()
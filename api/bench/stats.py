@@ -0,0 +1,75 @@
+"""Latency samples per endpoint, and the report printed (or saved as JSON) by the benchmarks."""
+import json
+import math
+
+REQUEST_ERRORS = (OSError, ConnectionError, ValueError, EOFError)
+
+
+class Recorder:
+
+    def __init__(self):
+        self.samples = {}  # name -> [(latency_s, ok, not_modified)]
+        self.recording = True
+
+    def add(self, name, latency_s, ok, not_modified=False):
+        """One request; not_modified for a 304 answer to a conditional GET (counted apart, same latency)."""
+        if self.recording:
+            self.samples.setdefault(name, []).append((latency_s, ok, not_modified))
+
+    def summary(self, elapsed_s):
+        out = {}
+        for name, samples in sorted(self.samples.items()):
+            lat = sorted(t * 1000 for t, ok, _ in samples if ok)
+            out[name] = {
+                'requests': len(samples),
+                'errors': sum(1 for _, ok, _ in samples if not ok),
+                'not_modified': sum(1 for _, _, not_modified in samples if not_modified),
+                'rps': round(len(samples) / elapsed_s, 2),
+                'p50_ms': percentile(lat, 50),
+                'p95_ms': percentile(lat, 95),
+                'p99_ms': percentile(lat, 99),
+                'max_ms': round(lat[-1], 2) if lat else None,
+            }
+        return out
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, int(math.ceil(p / 100 * len(sorted_values))) - 1)
+    return round(sorted_values[max(k, 0)], 2)
+
+
+def fmt_ms(value):
+    return f'{value:.1f}' if value is not None else '-'
+
+
+def print_report(title, summary, baseline=None):
+    """Table of the summary; with a baseline summary, the change of req/s and p95/p99 in percent."""
+    print(f'\n{title}')
+    print(f"{'endpoint':<20} {'requests':>9} {'errors':>7} {'304':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    for name, s in summary.items():
+        line = (f"{name:<20} {s['requests']:>9} {s['errors']:>7} {s['not_modified']:>7} {s['rps']:>9.1f} "
+                f"{fmt_ms(s['p50_ms']):>8} {fmt_ms(s['p95_ms']):>8} {fmt_ms(s['p99_ms']):>8} {fmt_ms(s['max_ms']):>8}")
+        base = (baseline or {}).get(name)
+        if base:
+            line += '   vs baseline: ' + ', '.join(
+                f'{key} {change(base[key], s[key])}' for key in ('rps', 'p95_ms', 'p99_ms'))
+        print(line)
+
+
+def change(before, after):
+    if not before or after is None:
+        return 'n/a'
+    return f'{(after - before) / before * 100:+.0f}%'
+
+
+def save(path, result):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+
+def load_summary(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['summary']
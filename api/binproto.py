@@ -0,0 +1,86 @@
+"""Compact binary ingest protocol (Content-Type: application/x-stationmeteo).
+
+Frame, little-endian, no padding:
+
+    header   '<2sBB'   magic b'SM', version (1 or 2), record count (1..255)
+    record   '<6fBH'   temperature, humidite, pression, co2, humidite_surface, indice_uv (float32,
+                       NaN = missing), flags (bit 0: pluie_detectee), age_s (seconds since the
+                       measurement was taken, saturating at 65535)
+    v2 adds  'I'       seq, the station's sequence number of the measurement (0 = none)
+
+A record is 27 bytes (31 in v2) instead of ~170 for the JSON payload. The firmware (station_meteo.py)
+packs the same layout with MicroPython's struct module; keep both in sync (tests/test_binproto.py
+decodes the frames of both encoders).
+"""
+import math
+import struct
+
+MIMETYPE = 'application/x-stationmeteo'
+MAGIC = b'SM'
+VERSION = 2
+HEADER = struct.Struct('<2sBB')
+RECORD_V1 = struct.Struct('<6fBH')
+RECORD_V2 = struct.Struct('<6fBHI')
+RECORDS = {1: RECORD_V1, 2: RECORD_V2}
+FLOAT_FIELDS = ('temperature', 'humidite', 'pression', 'co2', 'humidite_surface', 'indice_uv')
+FLAG_RAIN = 0x01
+MAX_RECORDS = 255
+MAX_AGE_S = 0xFFFF
+MAX_SEQ = 0xFFFFFFFF
+
+
+class DecodeError(ValueError):
+    """The body is not a valid binary frame."""
+
+
+def _f32(value):
+    if value is None:
+        return math.nan
+    return float(value)
+
+
+def encode_frame(records):
+    """Pack measurement dicts (the /add JSON fields, plus optional age_s and seq) into one frame.
+
+    The frame is version 1 unless a record has a seq.
+    """
+    if not 1 <= len(records) <= MAX_RECORDS:
+        raise ValueError(f'a frame holds 1..{MAX_RECORDS} records')
+    version = 2 if any(rec.get('seq') is not None for rec in records) else 1
+    parts = [HEADER.pack(MAGIC, version, len(records))]
+    for rec in records:
+        flags = FLAG_RAIN if rec.get('pluie_detectee') else 0
+        age = max(0, min(int(rec.get('age_s') or 0), MAX_AGE_S))
+        values = [_f32(rec.get(f)) for f in FLOAT_FIELDS] + [flags, age]
+        if version == 2:
+            seq = rec.get('seq') or 0
+            if not 0 <= seq <= MAX_SEQ:
+                raise ValueError(f'seq out of range: {seq}')
+            values.append(seq)
+        parts.append(RECORDS[version].pack(*values))
+    return b''.join(parts)
+
+
+def decode_frame(data):
+    """Unpack a frame into measurement dicts (NaN -> None) with their age_s (and seq in v2)."""
+    if len(data) < HEADER.size:
+        raise DecodeError('frame too short')
+    magic, version, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise DecodeError('bad magic')
+    record = RECORDS.get(version)
+    if record is None:
+        raise DecodeError(f'unsupported version {version}')
+    expected = HEADER.size + count * record.size
+    if count == 0 or len(data) != expected:
+        raise DecodeError(f'expected {expected} bytes for {count} records, got {len(data)}')
+    records = []
+    for values in record.iter_unpack(memoryview(data)[HEADER.size:]):
+        rec = {f: (None if math.isnan(v) else v) for f, v in zip(FLOAT_FIELDS, values[:6])}
+        rec['pluie_detectee'] = bool(values[6] & FLAG_RAIN)
+        rec['age_s'] = values[7]
+        if version == 2 and values[8]:
+            rec['seq'] = values[8]
+        records.append(rec)
+    return records
+
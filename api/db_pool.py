@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque
+
+from pymysql.constants import SERVER_STATUS
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be borrowed within the pool timeout."""
+
+
+class PooledConnection:
+    """Thin proxy around a pymysql connection: close() gives it back to the pool."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def discard(self):
+        """Drop the underlying connection instead of returning it (e.g. unread streaming result)."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            try:
+                raw.close()
+            except Exception:
+                pass
+            self._pool.release(raw)
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of pymysql connections.
+
+    Connections are opened lazily up to ``size``. When a connection is borrowed it is
+    recycled if older than ``recycle`` seconds, and pinged if it has been idle for more
+    than ``ping_interval`` seconds (a dead one is replaced transparently).
+    """
+
+    def __init__(self, connect, size=5, timeout=10.0, recycle=3600, ping_interval=1.0):
+        self._connect = connect
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._cond = threading.Condition()
+        self._idle = deque()  # (raw, created_at, last_used)
+        self._created_at = {}  # id(raw) -> creation time
+        self._opened = 0
+        self._in_use = 0
+        # Stats
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._connects = 0
+        self._connect_errors = 0
+        self._recycled = 0
+        self._ping_failures = 0
+
+    def get(self):
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created, last_used = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    raw = created = last_used = None
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._record_wait(time.monotonic() - started)
+                    raise PoolTimeout(f'no DB connection available after {self.timeout}s (pool size {self.size})')
+                self._cond.wait(remaining)
+            self._in_use += 1
+            if waited:
+                self._record_wait(time.monotonic() - started)
+        try:
+            raw = self._checkout(raw, created, last_used)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._opened -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw)
+
+    def _checkout(self, raw, created, last_used):
+        # Runs outside the lock (ping and connect wait on the network); counters are taken under it
+        now = time.monotonic()
+        if raw is not None and self.recycle and now - created > self.recycle:
+            with self._cond:
+                self._recycled += 1
+            self._close_quietly(raw)
+            raw = None
+        if raw is not None and now - last_used > self.ping_interval:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._ping_failures += 1
+                self._close_quietly(raw)
+                raw = None
+        if raw is None:
+            try:
+                raw = self._connect()
+            except Exception:
+                with self._cond:
+                    self._connect_errors += 1
+                raise
+            with self._cond:
+                self._connects += 1
+                self._created_at[id(raw)] = time.monotonic()
+        return raw
+
+    def release(self, raw):
+        # Never hand out a connection with a half-finished transaction
+        healthy = raw.open
+        if healthy and raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                raw.rollback()
+            except Exception:
+                healthy = False
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                created = self._created_at.get(id(raw), time.monotonic())
+                self._idle.append((raw, created, time.monotonic()))
+            else:
+                self._opened -= 1
+                self._created_at.pop(id(raw), None)
+            self._cond.notify()
+        if not healthy:
+            self._close_quietly(raw)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._opened -= len(idle)
+        for raw, _, _ in idle:
+            self._close_quietly(raw)
+
+    def _close_quietly(self, raw):
+        with self._cond:
+            self._created_at.pop(id(raw), None)
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _record_wait(self, elapsed):
+        self._waits += 1
+        self._wait_total += elapsed
+        self._wait_max = max(self._wait_max, elapsed)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._opened,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waits': self._waits,
+                'wait_ms_total': round(self._wait_total * 1000, 3),
+                'wait_ms_max': round(self._wait_max * 1000, 3),
+                'connects': self._connects,
+                'connect_errors': self._connect_errors,
+                'recycled': self._recycled,
+                'ping_failures': self._ping_failures,
+            }
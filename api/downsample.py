@@ -0,0 +1,51 @@
+import numpy as np
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indices of the n_out points that best keep the shape of (x, y).
+
+    x must be sorted ascending. The first and last points are always kept; each bucket in
+    between keeps the point forming the largest triangle with the previously kept point and
+    the average of the next bucket, so isolated peaks survive where averaging would flatten them.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    n_out = max(n_out, 3)
+
+    # Bucket i covers [edges[i], edges[i + 1]) over the points strictly between first and last
+    edges = np.floor(np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    sizes = np.diff(edges)
+
+    # Average point of every bucket in one pass; the "next bucket" of the last one is the last point
+    avg_x = np.add.reduceat(x[:-1], edges[:-1]) / sizes
+    avg_y = np.add.reduceat(y[:-1], edges[:-1]) / sizes
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        # Twice the triangle area, for every candidate of the bucket at once
+        areas = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(areas))
+        out[i + 1] = a
+    return out
+
+
+def lttb_series(times, values, n_out):
+    """Downsample one series, skipping missing values. Returns (times, values) lists."""
+    keep = [i for i, v in enumerate(values) if v is not None]
+    if not keep:
+        return [], []
+    x = np.fromiter((times[i] for i in keep), dtype=float, count=len(keep))
+    y = np.fromiter((values[i] for i in keep), dtype=float, count=len(keep))
+    idx = lttb_indices(x, y, n_out)
+    return x[idx].tolist(), y[idx].tolist()
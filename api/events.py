@@ -0,0 +1,161 @@
+import asyncio
+import queue
+import threading
+from collections import deque
+
+
+class Subscription:
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        # Set when the subscriber fell too far behind and lost events
+        self.overflowed = False
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+    def put(self, rows):
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            # Never block inserts on a slow client: it resumes later with Last-Event-ID
+            self.overflowed = True
+
+
+class AsyncSubscription:
+    """Subscription read from an asyncio event loop (ASGI streams); publish may run in any thread."""
+
+    def __init__(self, maxsize, loop):
+        self.maxsize = maxsize
+        self.queue = asyncio.Queue()
+        self.loop = loop
+        self.overflowed = False
+
+    async def get(self, timeout):
+        """Next list of rows; raises asyncio.TimeoutError after timeout seconds."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def put(self, rows):
+        # qsize() is read outside the loop, so the bound is approximate
+        if self.queue.qsize() >= self.maxsize:
+            self.overflowed = True
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, rows)
+        except RuntimeError:
+            # Event loop closed
+            self.overflowed = True
+
+
+class StreamPosition:
+    """Which rows a stream has sent, when they do not arrive in id order.
+
+    Inserts are published in the order their transactions finish, so a row may show up after one
+    with a higher id; another process's rows are read from the database later still. `floor` is
+    the id up to which every row has been sent: it is the event id a client resumes from, so a
+    resume may repeat rows but never skips one. Ids above it are either seen or missing; a
+    missing id is waited for gap_timeout seconds, then taken for rolled back and passed over.
+    """
+
+    def __init__(self, floor, gap_timeout, skipped_ranges=64):
+        self.floor = floor
+        self.gap_timeout = gap_timeout
+        self._seen = set()  # ids above floor already sent
+        self._gap = None  # (floor, monotonic time) when the id after floor was first found missing
+        # Ids at or below floor never sent: those before the stream started, and the gaps passed
+        # over. A row published later with such an id is new, not a repeat.
+        self._skipped = deque([(0, floor)], maxlen=skipped_ranges)
+
+    @property
+    def pending(self):
+        """True while an id below the newest one seen is missing."""
+        return bool(self._seen)
+
+    @property
+    def top(self):
+        """Newest id seen."""
+        return max(self._seen) if self._seen else self.floor
+
+    def accept(self, rows, now):
+        """The rows not sent yet, in the given order; they count as sent from now on."""
+        new = []
+        for row in rows:
+            row_id = row['id']
+            if row_id > self.floor:
+                if row_id in self._seen:
+                    continue
+                self._seen.add(row_id)
+            elif not self._take_skipped(row_id):
+                continue
+            new.append(row)
+        self.advance(now)
+        return new
+
+    def _take_skipped(self, row_id):
+        for i, (lo, hi) in enumerate(self._skipped):
+            if lo <= row_id <= hi:
+                del self._skipped[i]
+                self._skipped.extend(r for r in ((lo, row_id - 1), (row_id + 1, hi)) if r[0] <= r[1])
+                return True
+        return False
+
+    def advance(self, now):
+        """Move floor over the ids seen, and over a gap older than gap_timeout."""
+        while True:
+            while self.floor + 1 in self._seen:
+                self.floor += 1
+                self._seen.discard(self.floor)
+            if not self._seen:
+                self._gap = None
+                return
+            if self._gap is None or self._gap[0] != self.floor:
+                self._gap = (self.floor, now)
+            if now - self._gap[1] < self.gap_timeout:
+                return
+            first = min(self._seen)
+            self._skipped.append((self.floor + 1, first - 1))
+            self.floor = first - 1
+
+
+class Broadcaster:
+    """In-process fan-out of newly inserted rows to every open stream."""
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subs = set()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.closed = False
+
+    def subscribe(self, loop=None):
+        """Subscribe a blocking reader, or an asyncio one when loop is given."""
+        sub = Subscription(self.queue_size) if loop is None else AsyncSubscription(self.queue_size, loop)
+        with self._lock:
+            self._subs.add(sub)
+            closed = self.closed
+        if closed:
+            sub.put(None)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, rows):
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            sub.put(rows)
+        self.published += len(rows)
+
+    def close(self):
+        """Send None to every subscriber, now and on subscribe: the process is shutting down."""
+        with self._lock:
+            self.closed = True
+            subs = list(self._subs)
+        for sub in subs:
+            sub.put(None)
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subs), 'published': self.published}
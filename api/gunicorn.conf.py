@@ -0,0 +1,92 @@
+"""Production server: several worker processes forked by gunicorn.
+
+    gunicorn -c gunicorn.conf.py                     # Flask app, threaded workers
+    SERVE_APP=asgi gunicorn -c gunicorn.conf.py      # asgi.py on uvicorn workers
+
+The master never imports app.py: the pool, the WAL and the background threads it creates at
+import must not be shared by forked processes. The master runs the schema migrations once (as
+`flask migrate` in a child process) before forking; each worker then imports the app, opens its
+own connections, and warms its caches before accepting requests.
+
+On SIGTERM a worker stops accepting connections, ends its open streams (browsers reconnect to
+another worker) and finishes the requests in flight, /add included, within GRACEFUL_TIMEOUT.
+"""
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def cpu_count():
+    try:
+        # CPUs this process may run on (a container's cpuset), not those of the host
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS
+        return os.cpu_count() or 1
+
+
+SERVE_APP = os.getenv('SERVE_APP', 'wsgi')  # 'wsgi' (app.py) or 'asgi' (asgi.py)
+if SERVE_APP not in ('wsgi', 'asgi'):
+    raise ValueError(f'Unknown SERVE_APP: {SERVE_APP!r} (expected wsgi or asgi)')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+chdir = HERE
+wsgi_app = 'app:app' if SERVE_APP == 'wsgi' else 'asgi:app'
+worker_class = 'gthread' if SERVE_APP == 'wsgi' else 'uvicorn_worker.UvicornWorker'
+workers = int(os.getenv('WEB_CONCURRENCY', '0')) or cpu_count()
+# gthread only: requests served at once per worker (an open /measures/stream holds one)
+threads = int(os.getenv('WEB_THREADS', '32'))
+if SERVE_APP == 'wsgi':
+    # Streams per worker: the other threads stay free for /add. Read by app.py, imported after fork.
+    # Many viewers: SERVE_APP=asgi, where an idle stream costs no thread
+    os.environ.setdefault('SSE_MAX_STREAMS', str(max(1, threads // 2)))
+# Seconds for a worker to finish its requests after SIGTERM, then it is killed
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+# Seconds without a heartbeat before a worker is restarted; covers the warmup (24h of summaries)
+timeout = int(os.getenv('WORKER_TIMEOUT', '120'))
+keepalive = int(os.getenv('KEEPALIVE', '5'))
+preload_app = False
+accesslog = os.getenv('ACCESS_LOG') or None  # '-' for stdout
+errorlog = '-'
+
+# Each worker only sees its own inserts: re-read MAX(id) so ETags, the hot cache, /summary and
+# the streams pick up the rows of the other workers. Read by app.py, imported after fork.
+if workers > 1:
+    os.environ.setdefault('ETAG_MAX_ID_TTL', '1')
+
+
+def on_starting(server):
+    """Master, before forking: apply pending migrations once instead of racing them in every worker."""
+    env = dict(os.environ, FLASK_APP='app', INGEST_MODE='direct')  # no WAL replay from here
+    result = subprocess.run([sys.executable, '-m', 'flask', 'migrate'], cwd=HERE, env=env)
+    if result.returncode:
+        # Same as `python app.py`: workers retry lazily and /health reports the error
+        server.log.warning('Schema migration deferred (exit status %s)', result.returncode)
+
+
+def post_worker_init(worker):
+    if SERVE_APP == 'asgi':
+        # asgi.py warms up and ends its streams on SIGTERM in its lifespan: uvicorn installs its
+        # signal handlers after this hook
+        return
+    import app
+    app.warm_up()
+    handle_exit = worker.handle_exit
+
+    def drain(sig, frame):
+        # End the streams, which would otherwise hold the worker until graceful_timeout
+        # (from a thread: a signal handler must not wait on a lock)
+        threading.Thread(target=app.BROADCASTER.close, daemon=True).start()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    # Requests are done: flush the write-behind queue before the process ends
+    app = sys.modules.get('app')
+    if app is not None and app.INGEST_QUEUE is not None:
+        app.INGEST_QUEUE.stop()
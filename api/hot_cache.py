@@ -0,0 +1,72 @@
+import threading
+from collections import deque
+
+
+class HotCache:
+    """In-memory ring buffer of the newest mesures rows, oldest first.
+
+    It only trusts itself while ids arrive contiguously: a row that skips an id (another
+    process wrote in between, a rolled-back insert, out-of-order commits) is not appended. The
+    cache is then behind MAX(id) and the next read catches up with the rows after newest_id,
+    or reloads it when an id is still missing.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._rows = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._valid = False
+        # The whole table fits in the buffer, so short tables can still be served
+        self._complete = False
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def load(self, rows_newest_first):
+        with self._lock:
+            self._rows.clear()
+            self._rows.extend(reversed(rows_newest_first))
+            self._complete = len(self._rows) < self.size
+            self._valid = True
+            self.reloads += 1
+
+    def add(self, rows):
+        """Append rows just committed (ascending id order) that follow the newest one."""
+        with self._lock:
+            for row in rows:
+                if self._valid and self._rows and row['id'] != self._rows[-1]['id'] + 1:
+                    continue
+                if self._complete and len(self._rows) == self.size:
+                    self._complete = False
+                self._rows.append(row)
+
+    @property
+    def valid(self):
+        return self._valid
+
+    @property
+    def newest_id(self):
+        with self._lock:
+            return self._rows[-1]['id'] if self._rows else 0
+
+    def latest(self, limit):
+        """The newest `limit` rows, newest first, or None if the cache cannot answer."""
+        with self._lock:
+            if not self._valid or limit > self.size or (limit > len(self._rows) and not self._complete):
+                self.misses += 1
+                return None
+            self.hits += 1
+            n = min(limit, len(self._rows))
+            return [self._rows[-1 - i] for i in range(n)]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': self.size,
+            'rows': len(self._rows),
+            'valid': self._valid,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+            'reloads': self.reloads,
+        }
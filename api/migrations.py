@@ -0,0 +1,180 @@
+"""Versioned schema migrations.
+
+Each step runs once per database, in order, and is recorded in schema_version. Steps are
+written to be idempotent so that databases created by older releases (tables present but
+no schema_version yet) converge to the same schema. A MariaDB advisory lock makes
+concurrent API processes wait for the one that migrates instead of migrating twice.
+
+Never edit a released step: append a new one.
+"""
+import partitions
+import rollups
+
+LOCK_NAME = 'stationmeteo.migrations'
+LOCK_TIMEOUT_S = 120
+
+VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+  version INT NOT NULL PRIMARY KEY,
+  name VARCHAR(128) NOT NULL,
+  applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS mesures (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  temperature DOUBLE,
+  humidite DOUBLE,
+  pression DOUBLE,
+  co2 DOUBLE,
+  humidite_surface DOUBLE,
+  pluie_detectee TINYINT(1),
+  indice_uv DOUBLE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# Sequence numbers already stored per station (see app.claim_statements). A unique key of the
+# partitioned mesures table must include created_at, which a retried measurement does not
+# reproduce to the second: the keys live in this unpartitioned table instead.
+INGEST_SEQ_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_seq (
+  station_id VARCHAR(64) NOT NULL,
+  seq BIGINT UNSIGNED NOT NULL,
+  token BIGINT UNSIGNED NOT NULL,
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (station_id, seq),
+  KEY idx_ingest_seq_created_at (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+# Columns of the original table (older databases may lack some of them)
+EXPECTED_COLUMNS = {
+    'created_at': 'TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP',
+    'temperature': 'DOUBLE',
+    'humidite': 'DOUBLE',
+    'pression': 'DOUBLE',
+    'co2': 'DOUBLE',
+    'humidite_surface': 'DOUBLE',
+    'pluie_detectee': 'TINYINT(1)',
+    'indice_uv': 'DOUBLE'
+}
+
+
+def existing_columns(cur, table):
+    cur.execute(f"SHOW COLUMNS FROM {table}")
+    return {row['Field'] for row in cur.fetchall()}
+
+
+def existing_indexes(cur, table):
+    cur.execute(f"SHOW INDEX FROM {table}")
+    return {row['Key_name'] for row in cur.fetchall()}
+
+
+def m001_mesures(cur):
+    cur.execute(TABLE_DDL)
+    existing = existing_columns(cur, 'mesures')
+    for col, ddl in EXPECTED_COLUMNS.items():
+        if col not in existing:
+            cur.execute(f"ALTER TABLE mesures ADD COLUMN {col} {ddl}")
+
+
+def m002_created_at_index(cur):
+    if 'idx_mesures_created_at' not in existing_indexes(cur, 'mesures'):
+        cur.execute("CREATE INDEX idx_mesures_created_at ON mesures (created_at)")
+
+
+def m003_rollup_tables(cur):
+    fields = ('temperature', 'humidite', 'pression', 'co2', 'humidite_surface', 'pluie_detectee', 'indice_uv')
+    for table, _ in rollups.ROLLUPS:
+        cur.execute(rollups.rollup_ddl(table, fields))
+
+
+def m004_station_id(cur):
+    # Rows stored before multi-station support belong to the 'default' station
+    if 'station_id' not in existing_columns(cur, 'mesures'):
+        cur.execute("ALTER TABLE mesures ADD COLUMN station_id VARCHAR(64) NOT NULL DEFAULT 'default' AFTER created_at")
+    indexes = existing_indexes(cur, 'mesures')
+    # Per-station time windows, and per-station newest rows / keyset pages
+    if 'idx_mesures_station_created_at' not in indexes:
+        cur.execute("CREATE INDEX idx_mesures_station_created_at ON mesures (station_id, created_at)")
+    if 'idx_mesures_station_id' not in indexes:
+        cur.execute("CREATE INDEX idx_mesures_station_id ON mesures (station_id, id)")
+    # Rollup buckets become per station; global aggregates sum the stations of a bucket
+    for table, _ in rollups.ROLLUPS:
+        if 'station_id' not in existing_columns(cur, table):
+            cur.execute(
+                f"ALTER TABLE {table} ADD COLUMN station_id VARCHAR(64) NOT NULL DEFAULT 'default' FIRST, "
+                "DROP PRIMARY KEY, ADD PRIMARY KEY (station_id, bucket)"
+            )
+
+
+def m005_partition_mesures(cur):
+    if not partitions.list_partitions(cur):
+        partitions.partition_table(cur, ahead=3)
+
+
+def m006_ingest_seq(cur):
+    cur.execute(INGEST_SEQ_DDL)
+
+
+def m007_ingest_seq_kind(cur):
+    # A ts and a sequence number with the same value are different keys
+    if 'kind' in existing_columns(cur, 'ingest_seq'):
+        return
+    cur.execute("ALTER TABLE ingest_seq ADD COLUMN kind ENUM('seq', 'ts') NOT NULL DEFAULT 'seq' AFTER station_id, "
+                "DROP PRIMARY KEY, ADD PRIMARY KEY (station_id, kind, seq)")
+    # The kind of the keys stored before is unknown: each is kept as both until pruned
+    cur.execute("INSERT IGNORE INTO ingest_seq (station_id, kind, seq, token, created_at) "
+                "SELECT station_id, 'ts', seq, token, created_at FROM ingest_seq WHERE kind = 'seq'")
+
+
+# (version, name, step) in application order
+MIGRATIONS = [
+    (1, 'create mesures', m001_mesures),
+    (2, 'index mesures.created_at', m002_created_at_index),
+    (3, 'rollup tables mesures_1m/1h/1d', m003_rollup_tables),
+    (4, 'station_id column and per-station indexes', m004_station_id),
+    (5, 'monthly RANGE partitions on mesures.created_at', m005_partition_mesures),
+    (6, 'ingest_seq table for idempotent ingest', m006_ingest_seq),
+    (7, 'ingest_seq.kind', m007_ingest_seq_kind),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def applied_versions(cur):
+    cur.execute("SELECT version FROM schema_version")
+    return {row['version'] for row in cur.fetchall()}
+
+
+def migrate(conn, log=None):
+    """Apply pending migrations; return the list of versions applied by this call."""
+    applied_now = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT GET_LOCK(%s, %s) AS got", (LOCK_NAME, LOCK_TIMEOUT_S))
+        if cur.fetchone()['got'] != 1:
+            raise RuntimeError(f'could not acquire migration lock within {LOCK_TIMEOUT_S}s')
+        try:
+            cur.execute(VERSION_DDL)
+            # Read under the lock: another process may just have finished migrating
+            done = applied_versions(cur)
+            for version, name, step in MIGRATIONS:
+                if version in done:
+                    continue
+                if log:
+                    log(f'Applying migration {version:03d}: {name}')
+                step(cur)
+                cur.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+                applied_now.append(version)
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    return applied_now
+
+
+def current_version(conn):
+    with conn.cursor() as cur:
+        cur.execute(VERSION_DDL)
+        cur.execute("SELECT MAX(version) AS v FROM schema_version")
+        return cur.fetchone()['v'] or 0
@@ -0,0 +1,103 @@
+"""Monthly RANGE partitions of mesures on created_at.
+
+Partition pYYYYMM holds the rows of that UTC month and pmax (MAXVALUE) catches anything past the
+last monthly partition, so an insert never fails for lack of a partition. Bounds are stored as epoch
+seconds (RANGE on UNIX_TIMESTAMP(created_at), the form MariaDB can prune for a TIMESTAMP column):
+a created_at window only reads the months it overlaps.
+
+maintain() keeps the coming months pre-created (splitting an empty pmax is instant) and drops the
+months older than the retention period: DROP PARTITION removes a month at once instead of a DELETE
+over millions of rows that leaves the table fragmented.
+"""
+import calendar
+from datetime import datetime
+
+TABLE = 'mesures'
+CATCH_ALL = 'pmax'
+LOCK_NAME = 'stationmeteo.partitions'
+
+
+def month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, n):
+    year, index = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return month.replace(year=year, month=index + 1)
+
+
+def epoch(dt):
+    return calendar.timegm(dt.timetuple())
+
+
+def partition_def(month):
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN ({epoch(add_months(month, 1))})"
+
+
+def months_between(first, stop):
+    """Month starts from first's month up to, excluding, stop."""
+    month = month_start(first)
+    while month < stop:
+        yield month
+        month = add_months(month, 1)
+
+
+def list_partitions(cur):
+    """[(name, upper bound in epoch seconds or None for MAXVALUE)] in order; [] if not partitioned."""
+    cur.execute(
+        "SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS upper FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        (TABLE,),
+    )
+    return [(r['name'], None if r['upper'] == 'MAXVALUE' else int(r['upper'])) for r in cur.fetchall()]
+
+
+def partition_table(cur, ahead, now=None):
+    """Convert mesures to monthly partitions, from its oldest row's month to `ahead` months from now.
+
+    Rebuilds the table: instant on a new install, a one-off copy on an existing one.
+    """
+    now = now or datetime.utcnow()
+    cur.execute(f"SELECT MIN(created_at) AS first FROM {TABLE}")
+    first = cur.fetchone()['first'] or now
+    months = list(months_between(min(first, now), add_months(month_start(now), ahead + 1)))
+    # Every unique key of a partitioned table must contain the partitioning column
+    cur.execute(f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)")
+    cur.execute(
+        f"ALTER TABLE {TABLE} PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) ("
+        + ', '.join([partition_def(m) for m in months] + [f"PARTITION {CATCH_ALL} VALUES LESS THAN MAXVALUE"])
+        + ")"
+    )
+
+
+def maintain(cur, ahead, retention_months, now=None):
+    """Pre-create the next `ahead` months and drop those past retention (0 keeps everything).
+
+    Returns (created, dropped) partition names.
+    """
+    now = now or datetime.utcnow()
+    parts = list_partitions(cur)
+    if not parts:
+        raise RuntimeError(f'{TABLE} is not partitioned (run the migrations first)')
+    bounded = [(name, upper) for name, upper in parts if upper is not None]
+
+    created = []
+    last_upper = datetime.utcfromtimestamp(max(upper for _, upper in bounded))
+    months = list(months_between(last_upper, add_months(month_start(now), ahead + 1)))
+    if months:
+        cur.execute(
+            f"ALTER TABLE {TABLE} REORGANIZE PARTITION {CATCH_ALL} INTO ("
+            + ', '.join([partition_def(m) for m in months] + [f"PARTITION {CATCH_ALL} VALUES LESS THAN MAXVALUE"])
+            + ")"
+        )
+        created = [f"p{m:%Y%m}" for m in months]
+
+    dropped = []
+    if retention_months > 0:
+        # Whole months only: a partition goes once its newest possible row is past retention
+        cutoff = epoch(add_months(month_start(now), -retention_months))
+        dropped = [name for name, upper in bounded if upper <= cutoff]
+        if dropped:
+            cur.execute(f"ALTER TABLE {TABLE} DROP PARTITION {', '.join(dropped)}")
+    return created, dropped
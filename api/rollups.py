@@ -0,0 +1,146 @@
+"""Rollup tables: per-minute/hour/day count, sum, min and max of each measurement column.
+
+They are kept up to date on insert (see apply_rows) so long-range aggregates read one row
+per bucket instead of scanning mesures. Buckets are UTC (connections use a UTC session) and
+per station: the primary key is (station_id, bucket), added by migration 4.
+"""
+
+# (table, granularity in seconds), finest first
+ROLLUPS = (
+    ('mesures_1m', 60),
+    ('mesures_1h', 3600),
+    ('mesures_1d', 86400),
+)
+
+
+def rollup_ddl(table, fields):
+    # Used by migration 3: the table as first released, without station_id
+    cols = []
+    for f in fields:
+        cols += [f"  {f}_count INT NOT NULL DEFAULT 0", f"  {f}_sum DOUBLE",
+                 f"  {f}_min DOUBLE", f"  {f}_max DOUBLE"]
+    # DATETIME rather than TIMESTAMP: no implicit ON UPDATE CURRENT_TIMESTAMP on the key
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table} (\n"
+        "  bucket DATETIME NOT NULL PRIMARY KEY,\n"
+        "  n INT NOT NULL DEFAULT 0,\n"
+        + ",\n".join(cols)
+        + "\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+    )
+
+
+def _columns(fields):
+    cols = ['station_id', 'bucket', 'n']
+    for f in fields:
+        cols += [f'{f}_count', f'{f}_sum', f'{f}_min', f'{f}_max']
+    return cols
+
+
+def _merge_sql(table, fields, select_sql):
+    """INSERT ... SELECT that merges partial aggregates into existing buckets."""
+    updates = ['n = n + VALUES(n)']
+    for f in fields:
+        updates += [
+            f'{f}_count = {f}_count + VALUES({f}_count)',
+            f'{f}_sum = COALESCE({f}_sum + VALUES({f}_sum), {f}_sum, VALUES({f}_sum))',
+            f'{f}_min = COALESCE(LEAST({f}_min, VALUES({f}_min)), {f}_min, VALUES({f}_min))',
+            f'{f}_max = COALESCE(GREATEST({f}_max, VALUES({f}_max)), {f}_max, VALUES({f}_max))',
+        ]
+    return (
+        f"INSERT INTO {table} ({', '.join(_columns(fields))}) {select_sql} "
+        f"ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+    )
+
+
+def _select_from_raw(fields, granularity, where):
+    select = ["station_id",
+              f"FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(created_at) / {granularity}) * {granularity}) AS b",
+              "COUNT(*)"]
+    for f in fields:
+        select += [f"COUNT({f})", f"SUM({f})", f"MIN({f})", f"MAX({f})"]
+    return f"SELECT {', '.join(select)} FROM mesures WHERE {where} GROUP BY station_id, b"
+
+
+def _select_from_rollup(fields, source, granularity, where='1=1'):
+    select = ["station_id",
+              f"FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(bucket) / {granularity}) * {granularity}) AS b",
+              "SUM(n)"]
+    for f in fields:
+        select += [f"SUM({f}_count)", f"SUM({f}_sum)", f"MIN({f}_min)", f"MAX({f}_max)"]
+    return f"SELECT {', '.join(select)} FROM {source} WHERE {where} GROUP BY station_id, b"
+
+
+def apply_statements(fields, first_id, last_id, first_at=None, last_at=None):
+    """(sql, params) folding the mesures rows with first_id <= id <= last_id into every rollup table.
+
+    first_at/last_at, the created_at range of those rows when known, let MariaDB read only the
+    partitions holding them.
+    """
+    where = 'id BETWEEN %s AND %s'
+    params = (first_id, last_id)
+    if first_at is not None:
+        where += ' AND created_at BETWEEN %s AND %s'
+        params += (first_at, last_at)
+    for table, granularity in ROLLUPS:
+        select_sql = _select_from_raw(fields, granularity, where)
+        yield _merge_sql(table, fields, select_sql), params
+
+
+def apply_rows(cur, fields, first_id, last_id, first_at=None, last_at=None):
+    for sql, params in apply_statements(fields, first_id, last_id, first_at, last_at):
+        cur.execute(sql, params)
+
+
+def rebuild(cur, fields, since=None):
+    """Recompute every rollup table from mesures (each level from the finer one).
+
+    With since (a UTC day boundary), only the buckets from since on are recomputed: older ones
+    are kept, e.g. for rows since moved to the archive. Rows inserted while this runs may be
+    missed or counted twice; run it with ingest paused.
+    """
+    where, params = ('1=1', ()) if since is None else ('created_at >= %s', (since,))
+    bucket_where = '1=1' if since is None else 'bucket >= %s'
+    previous = None
+    for table, granularity in ROLLUPS:
+        cur.execute(f"DELETE FROM {table} WHERE {bucket_where}", params)
+        if previous is None:
+            select_sql = _select_from_raw(fields, granularity, where)
+        else:
+            select_sql = _select_from_rollup(fields, previous, granularity, bucket_where)
+        cur.execute(_merge_sql(table, fields, select_sql), params)
+        previous = table
+
+
+def pick_rollup(bucket_s):
+    """Coarsest rollup whose granularity divides bucket_s, as (table, granularity), or None."""
+    for table, granularity in reversed(ROLLUPS):
+        if bucket_s % granularity == 0:
+            return table, granularity
+    return None
+
+
+def query(cur, table, granularity, bucket_s, start, end, fields, stations=None):
+    """Same result rows as a GROUP BY over mesures, read from a rollup table.
+
+    The window is widened to whole rollup units (at most one granularity at each edge).
+    Buckets of every station (or of the given ones) are merged.
+    """
+    select = [f"FLOOR(UNIX_TIMESTAMP(bucket) / {bucket_s}) * {bucket_s} AS bucket", "SUM(n) AS n"]
+    for f in fields:
+        select += [f"SUM({f}_sum) / NULLIF(SUM({f}_count), 0) AS {f}__avg",
+                   f"MIN({f}_min) AS {f}__min", f"MAX({f}_max) AS {f}__max",
+                   f"SUM({f}_count) AS {f}__count"]
+    conditions = [f"bucket >= FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(%s) / {granularity}) * {granularity})"]
+    params = [start]
+    if end is not None:
+        conditions.append('bucket < %s')
+        params.append(end)
+    if stations:
+        conditions.append(f"station_id IN ({', '.join(['%s'] * len(stations))})")
+        params.extend(stations)
+    cur.execute(
+        f"SELECT {', '.join(select)} FROM {table} WHERE {' AND '.join(conditions)} "
+        "GROUP BY 1 ORDER BY 1",
+        params,
+    )
+    return cur.fetchall()
@@ -0,0 +1,487 @@
+"""Storage backends for the mesures table, selected with STORAGE_BACKEND.
+
+- MariaDBStorage: the pooled MariaDB server, with versioned migrations, rollup tables and
+  monthly partitions.
+- SQLiteStorage: one local database file, for single-node installs and benchmarks where a
+  network database is pure overhead. It runs in WAL mode (readers never block the writer)
+  and reuses prepared statements: each connection keeps the statements it compiled, keyed by
+  SQL text, so a repeated query or INSERT is only parsed once.
+
+Both backends run the row queries built by app.py (a portable subset of SQL with %s
+placeholders, created_at compared as naive UTC datetimes) and return rows as dicts.
+Aggregates and the epoch expression used by LTTB are backend-specific.
+
+Rows carrying a seq are inserted at most once per key (station_id, seq_kind, seq): seq_kind is
+'seq' for the station's sequence number, 'ts' for its clock (epoch seconds), so the two never match
+each other. Both backends claim the keys in an ingest_seq table of their own, so a key outlives its
+row once archived, until prune_sequences(). A duplicate is skipped, not an error, and uses up no id.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import migrations
+import partitions
+import rollups
+
+
+def station_condition(stations):
+    """SQL condition and params restricting rows to stations ('' and [] when there is none)."""
+    if not stations:
+        return '', []
+    if len(stations) == 1:
+        return 'station_id = %s', list(stations)
+    return f"station_id IN ({', '.join(['%s'] * len(stations))})", list(stations)
+
+
+def seq_key(row):
+    """Idempotency key (station_id, kind, seq) of a row, or None."""
+    if row.get('seq') is None:
+        return None
+    return row['station_id'], row.get('seq_kind') or 'seq', row['seq']
+
+
+def aggregate_query(bucket_sql, start, end, fields, stations=()):
+    """avg/min/max/count of each field per bucket (bucket_sql: epoch seconds of the bucket start)."""
+    select = [f"{bucket_sql} AS bucket", "COUNT(*) AS n"]
+    for f in fields:
+        select += [f"AVG({f}) AS {f}__avg", f"MIN({f}) AS {f}__min",
+                   f"MAX({f}) AS {f}__max", f"COUNT({f}) AS {f}__count"]
+    conditions = ['created_at >= %s']
+    params = [start]
+    if end is not None:
+        conditions.append('created_at < %s')
+        params.append(end)
+    station_sql, station_params = station_condition(stations)
+    if station_sql:
+        conditions.append(station_sql)
+        params.extend(station_params)
+    sql = (
+        f"SELECT {', '.join(select)} FROM mesures WHERE {' AND '.join(conditions)} "
+        "GROUP BY bucket ORDER BY bucket"
+    )
+    return sql, params
+
+
+def insert_sql(columns, placeholder='%s', n_rows=1):
+    values = '(' + ', '.join([placeholder] * len(columns)) + ')'
+    return f"INSERT INTO mesures ({', '.join(columns)}) VALUES " + ', '.join([values] * n_rows)
+
+
+class RowStream:
+    """Batches of rows from an open read (see Storage.export).
+
+    close(aborted) releases it; aborted=True when the reader stopped before the end.
+    """
+
+    def __init__(self, fetch, close):
+        self._fetch = fetch
+        self._close = close
+
+    def __iter__(self):
+        while True:
+            rows = self._fetch()
+            if not rows:
+                return
+            yield rows
+
+    def close(self, aborted=False):
+        close, self._close = self._close, None
+        if close is not None:
+            close(aborted)
+
+
+class Storage:
+    """Operations app.py needs from a backend."""
+
+    name = None
+    # Monthly partitions and rollup tables (maintenance commands and threads)
+    partitioned = False
+
+    def migrate(self, log=None):
+        """Create or upgrade the schema; returns (applied steps, schema version)."""
+        raise NotImplementedError
+
+    def insert_rows(self, rows):
+        """Insert rows (dicts with station_id, the measurement fields, usually created_at and
+        maybe seq and seq_kind) in one transaction; returns their ids in order, None for each row dropped as
+        a duplicate. A single insert is a list of one."""
+        raise NotImplementedError
+
+    def prune_sequences(self, days):
+        """Forget the sequence numbers stored more than days ago; returns how many were dropped."""
+        raise NotImplementedError
+
+    def delete_rows(self, ids, start, end):
+        """Delete the rows with these ids (all with start <= created_at < end, e.g. just archived)."""
+        raise NotImplementedError
+
+    def select(self, sql, params=()):
+        """Rows of a read query (range reads, newest rows, stream catch-up) as a list of dicts."""
+        raise NotImplementedError
+
+    def aggregate(self, bucket_s, start, end, fields, stations=()):
+        """(rows, source) of per-bucket aggregates in the aggregate_query() row format."""
+        raise NotImplementedError
+
+    def export(self, sql, params, batch_rows):
+        """Open a streaming read for sql and return a RowStream. Raises before the first row on errors."""
+        raise NotImplementedError
+
+    def epoch_sql(self, column):
+        """SQL expression of a created_at column as epoch seconds."""
+        raise NotImplementedError
+
+
+class MariaDBStorage(Storage):
+    """MariaDB through app.py's connection pool.
+
+    insert_rows(cur, rows) is app.py's multi-row INSERT (rollups included), stream_cursor the
+    unbuffered cursor class used by exports and connect() opens the connection an export holds.
+    """
+
+    name = 'mariadb'
+    partitioned = True
+    latest_version = migrations.LATEST_VERSION
+
+    def __init__(self, pool, insert_rows, stream_cursor, connect):
+        self.pool = pool
+        self._insert_rows = insert_rows
+        self._stream_cursor = stream_cursor
+        self._connect = connect
+
+    @contextmanager
+    def cursor(self):
+        conn = self.pool.get()
+        try:
+            with conn.cursor() as cur:
+                yield cur
+        finally:
+            conn.close()
+
+    def migrate(self, log=None):
+        conn = self.pool.get()
+        try:
+            applied = migrations.migrate(conn, log=log)
+            return applied, migrations.current_version(conn)
+        finally:
+            conn.close()
+
+    def insert_rows(self, rows):
+        conn = self.pool.get()
+        try:
+            # Raw rows and rollup buckets are committed together
+            conn.begin()
+            with conn.cursor() as cur:
+                ids = self._insert_rows(cur, rows)
+            conn.commit()
+        finally:
+            conn.close()
+        return ids
+
+    def select(self, sql, params=()):
+        with self.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def aggregate(self, bucket_s, start, end, fields, stations=()):
+        # Long ranges read the coarsest rollup table that divides the bucket width
+        rollup = rollups.pick_rollup(bucket_s)
+        with self.cursor() as cur:
+            if rollup is not None:
+                return rollups.query(cur, rollup[0], rollup[1], bucket_s, start, end, fields, stations), rollup[0]
+            bucket_sql = f"FLOOR({self.epoch_sql('created_at')} / {bucket_s}) * {bucket_s}"
+            cur.execute(*aggregate_query(bucket_sql, start, end, fields, stations))
+            return cur.fetchall(), 'mesures'
+
+    def export(self, sql, params, batch_rows):
+        # A connection of its own, outside the pool: a download holds it for minutes, and the
+        # session setting below must not outlive it
+        conn = self._connect()
+        try:
+            cur = conn.cursor(self._stream_cursor)
+            # Rows are pulled as the client reads: give slow downloads time before the server gives up
+            cur.execute("SET SESSION net_write_timeout = 600")
+            cur.execute(sql, params)
+        except Exception:
+            conn.close()
+            raise
+
+        def close(aborted):
+            # Client went away mid-stream: closing the connection is cheaper than draining the cursor
+            if not aborted:
+                cur.close()
+            conn.close()
+
+        return RowStream(lambda: cur.fetchmany(batch_rows), close)
+
+    def epoch_sql(self, column):
+        return f"UNIX_TIMESTAMP({column})"
+
+    def maintain_partitions(self, ahead, retention_months):
+        """partitions.maintain() under a DB lock; (created, dropped), or None if another process holds it."""
+        with self.cursor() as cur:
+            cur.execute("SELECT GET_LOCK(%s, 0) AS got", (partitions.LOCK_NAME,))
+            if cur.fetchone()['got'] != 1:
+                return None
+            try:
+                return partitions.maintain(cur, ahead, retention_months)
+            finally:
+                cur.execute("SELECT RELEASE_LOCK(%s)", (partitions.LOCK_NAME,))
+
+    def prune_sequences(self, days, batch_rows=10000):
+        cutoff = datetime.utcnow().replace(microsecond=0) - timedelta(days=days)
+        dropped = 0
+        with self.cursor() as cur:
+            # Autocommit: small deletes, each its own transaction, so ingest never waits long
+            while True:
+                cur.execute("DELETE FROM ingest_seq WHERE created_at < %s LIMIT %s", (cutoff, batch_rows))
+                dropped += cur.rowcount
+                if cur.rowcount < batch_rows:
+                    return dropped
+
+    def delete_rows(self, ids, start, end, chunk_rows=1000):
+        with self.cursor() as cur:
+            # Autocommit per chunk; the created_at range confines each DELETE to its partition
+            for i in range(0, len(ids), chunk_rows):
+                chunk = ids[i:i + chunk_rows]
+                cur.execute(f"DELETE FROM mesures WHERE created_at >= %s AND created_at < %s "
+                            f"AND id IN ({', '.join(['%s'] * len(chunk))})", [start, end, *chunk])
+
+    def rebuild_rollups(self, fields, since=None):
+        conn = self.pool.get()
+        try:
+            conn.begin()
+            with conn.cursor() as cur:
+                rollups.rebuild(cur, fields, since)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# created_at is stored as 'YYYY-MM-DD HH:MM:SS' UTC text (CURRENT_TIMESTAMP's format), which
+# sorts and compares like the datetime it stands for
+sqlite3.register_adapter(datetime, lambda dt: dt.isoformat(sep=' '))
+sqlite3.register_converter('TIMESTAMP', lambda raw: datetime.fromisoformat(raw.decode()))
+
+SQLITE_MIGRATIONS = [
+    (1, 'mesures', [
+        """CREATE TABLE IF NOT EXISTS mesures (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  station_id TEXT NOT NULL DEFAULT 'default',
+  temperature REAL,
+  humidite REAL,
+  pression REAL,
+  co2 REAL,
+  humidite_surface REAL,
+  pluie_detectee INTEGER,
+  indice_uv REAL
+)""",
+        "CREATE INDEX IF NOT EXISTS idx_mesures_created_at ON mesures (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_mesures_station_created_at ON mesures (station_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_mesures_station_id ON mesures (station_id, id)",
+    ]),
+    (2, 'mesures.seq for idempotent ingest', [
+        "ALTER TABLE mesures ADD COLUMN seq INTEGER",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_mesures_station_seq ON mesures (station_id, seq) WHERE seq IS NOT NULL",
+    ]),
+    # Archiving deletes rows, and the keys held in mesures.seq with them. The column stays (SQLite
+    # before 3.35 cannot drop it) but is no longer written.
+    (3, 'ingest_seq table for idempotent ingest', [
+        """CREATE TABLE IF NOT EXISTS ingest_seq (
+  station_id TEXT NOT NULL,
+  seq INTEGER NOT NULL,
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (station_id, seq)
+)""",
+        "CREATE INDEX IF NOT EXISTS idx_ingest_seq_created_at ON ingest_seq (created_at)",
+        "INSERT OR IGNORE INTO ingest_seq (station_id, seq, created_at) "
+        "SELECT station_id, seq, created_at FROM mesures WHERE seq IS NOT NULL",
+        "DROP INDEX IF EXISTS idx_mesures_station_seq",
+    ]),
+    # A ts and a sequence number with the same value are different keys. The kind of the keys
+    # stored before is unknown: each is kept as both until pruned.
+    (4, 'ingest_seq.kind', [
+        """CREATE TABLE ingest_seq_kind (
+  station_id TEXT NOT NULL,
+  kind TEXT NOT NULL DEFAULT 'seq',
+  seq INTEGER NOT NULL,
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (station_id, kind, seq)
+)""",
+        "INSERT INTO ingest_seq_kind (station_id, kind, seq, created_at) "
+        "SELECT station_id, kind, seq, created_at FROM ingest_seq, (SELECT 'seq' AS kind UNION ALL SELECT 'ts')",
+        "DROP TABLE ingest_seq",
+        "ALTER TABLE ingest_seq_kind RENAME TO ingest_seq",
+        "CREATE INDEX IF NOT EXISTS idx_ingest_seq_created_at ON ingest_seq (created_at)",
+    ]),
+]
+
+# Columns an inserted row may carry (anything else, e.g. id, is ignored)
+INSERT_COLUMNS = frozenset(
+    ('created_at', 'station_id', 'temperature', 'humidite', 'pression', 'co2', 'humidite_surface',
+     'pluie_detectee', 'indice_uv')
+)
+
+
+def dict_row(cur, row):
+    return {d[0]: v for d, v in zip(cur.description, row)}
+
+
+def connect_sqlite(path, busy_timeout=5.0, cached_statements=256):
+    """Open the database file in WAL mode, returning rows as dicts and created_at as datetime."""
+    conn = sqlite3.connect(
+        path,
+        timeout=busy_timeout,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        # Transactions are explicit (BEGIN IMMEDIATE around inserts)
+        isolation_level=None,
+        # Exports are read by whichever thread the server uses to send the body
+        check_same_thread=False,
+        cached_statements=cached_statements,
+    )
+    conn.row_factory = dict_row
+    conn.execute("PRAGMA journal_mode = WAL")
+    # Durable at each checkpoint; a power cut may lose the last transactions, never corrupt the file
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+class SQLiteStorage(Storage):
+    """Embedded SQLite file: one connection per thread (connect() from app.py), no rollups.
+
+    Statements are written with %s placeholders like the MariaDB ones and run with '?'.
+    """
+
+    name = 'sqlite'
+    latest_version = SQLITE_MIGRATIONS[-1][0]
+    # Epoch seconds of a TIMESTAMP text column (julianday of 1970-01-01 is 2440587.5)
+    EPOCH_SQL = "CAST((julianday({column}) - 2440587.5) * 86400 + 0.5 AS INTEGER)"
+    SEQ_CLAIM_SQL = "INSERT OR IGNORE INTO ingest_seq (station_id, kind, seq) VALUES (?, ?, ?)"
+
+    def __init__(self, connect, cursor_class=sqlite3.Cursor):
+        self._connect = connect
+        self._cursor_class = cursor_class
+        self._local = threading.local()
+        self._sql = {}
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def cursor(self, conn=None):
+        return (conn or self.connection()).cursor(self._cursor_class)
+
+    def qmark(self, sql):
+        # Same SQL text -> same string -> the connection's cached prepared statement
+        converted = self._sql.get(sql)
+        if converted is None:
+            converted = self._sql[sql] = sql.replace('%s', '?')
+        return converted
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        cur = self.cursor(conn)
+        # Take the write lock up front instead of failing to upgrade a read lock midway
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            yield cur
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            cur.execute("COMMIT")
+        finally:
+            cur.close()
+
+    def migrate(self, log=None):
+        applied = []
+        with self.transaction() as cur:
+            cur.execute("PRAGMA user_version")
+            current = cur.fetchone()['user_version']
+            for version, name, statements in SQLITE_MIGRATIONS:
+                if version <= current:
+                    continue
+                if log is not None:
+                    log(f'Applying migration {version}: {name}')
+                for sql in statements:
+                    cur.execute(sql)
+                cur.execute(f"PRAGMA user_version = {version}")
+                applied.append(version)
+            cur.execute("PRAGMA user_version")
+            return applied, cur.fetchone()['user_version']
+
+    def insert_rows(self, rows):
+        ids = []
+        with self.transaction() as cur:
+            for row in rows:
+                key = seq_key(row)
+                if key is not None:
+                    # Claimed before the row is inserted, so a duplicate burns no AUTOINCREMENT id
+                    cur.execute(self.SEQ_CLAIM_SQL, key)
+                    if cur.rowcount == 0:
+                        ids.append(None)
+                        continue
+                columns = [c for c in row if c in INSERT_COLUMNS]
+                # One prepared statement per column set, re-bound for each row
+                cur.execute(insert_sql(columns, '?'), [row[c] for c in columns])
+                ids.append(cur.lastrowid)
+        return ids
+
+    def prune_sequences(self, days, batch_rows=10000):
+        cutoff = datetime.utcnow().replace(microsecond=0) - timedelta(days=days)
+        dropped = 0
+        # Small transactions, so ingest never waits long for the write lock
+        while True:
+            with self.transaction() as cur:
+                cur.execute("DELETE FROM ingest_seq WHERE rowid IN "
+                            "(SELECT rowid FROM ingest_seq WHERE created_at < ? LIMIT ?)", (cutoff, batch_rows))
+                count = cur.rowcount
+            dropped += count
+            if count < batch_rows:
+                return dropped
+
+    def delete_rows(self, ids, start, end, chunk_rows=500):
+        for i in range(0, len(ids), chunk_rows):
+            chunk = ids[i:i + chunk_rows]
+            with self.transaction() as cur:
+                cur.execute(f"DELETE FROM mesures WHERE created_at >= ? AND created_at < ? "
+                            f"AND id IN ({', '.join(['?'] * len(chunk))})", [start, end, *chunk])
+
+    def select(self, sql, params=()):
+        cur = self.cursor()
+        try:
+            cur.execute(self.qmark(sql), list(params))
+            return cur.fetchall()
+        finally:
+            cur.close()
+
+    def aggregate(self, bucket_s, start, end, fields, stations=()):
+        # Integer division of the epoch: bucket start in seconds
+        bucket_sql = f"{self.epoch_sql('created_at')} / {bucket_s} * {bucket_s}"
+        return self.select(*aggregate_query(bucket_sql, start, end, fields, stations)), 'mesures'
+
+    def export(self, sql, params, batch_rows):
+        # A connection of its own: the stream may be read from another thread, for minutes
+        conn = self._connect()
+        try:
+            cur = self.cursor(conn)
+            cur.execute(self.qmark(sql), list(params))
+        except Exception:
+            conn.close()
+            raise
+
+        def close(aborted):
+            cur.close()
+            conn.close()
+
+        return RowStream(lambda: cur.fetchmany(batch_rows), close)
+
+    def epoch_sql(self, column):
+        return self.EPOCH_SQL.format(column=column)
+
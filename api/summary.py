@@ -0,0 +1,252 @@
+"""Rolling per-station statistics for /summary, maintained as rows are inserted.
+
+For each field and window (1h, 24h), per-minute buckets keep a running sum and count for the
+mean, and two monotonic deques keep the candidates for min and max: folding a row in and reading
+a window are O(1) amortised, however many rows the window holds. Windows are exact to the minute.
+
+Rows are folded in id order. A station that sends buffered measurements (age_s) delivers them
+after newer ones: such a row counts as if measured at the newest time already seen, so it may
+stay in a window up to its delay longer than it should.
+"""
+import calendar
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+RESOLUTION_S = 60
+WINDOWS = (('1h', 3600), ('24h', 86400))
+# History Summaries.load() needs: the longest window, to the minute
+SEED_S = WINDOWS[-1][1] + RESOLUTION_S
+
+# Barometric tendency over 3 hours, in hPa (Met Office wording): below each bound, that label
+TREND_SPAN_S = 3 * 3600
+TREND_LEVELS = ((0.1, 'steady'), (1.6, '{}_slowly'), (3.6, '{}'), (6.1, '{}_quickly'), (float('inf'), '{}_very_rapidly'))
+
+# Seconds Summaries.fold() waits for a missing id (its transaction may still be open) before it
+# takes the id for rolled back and folds the rows after it
+GAP_TIMEOUT_S = 30
+
+
+def epoch(dt):
+    return calendar.timegm(dt.timetuple())
+
+
+def iso(t):
+    return datetime.utcfromtimestamp(t).isoformat() + 'Z'
+
+
+class RollingWindow:
+    """min/max/mean/count of the values of the last window_s seconds."""
+
+    def __init__(self, window_s, resolution_s=RESOLUTION_S):
+        self.window_s = window_s
+        self.resolution_s = resolution_s
+        self._buckets = deque()  # [bucket start, sum, count], oldest first
+        self._sum = 0.0
+        self._count = 0
+        self._min = deque()  # (bucket start, value), values increasing
+        self._max = deque()  # (bucket start, value), values decreasing
+
+    def add(self, t, value):
+        b = t - t % self.resolution_s
+        if self._buckets and self._buckets[-1][0] == b:
+            self._buckets[-1][1] += value
+            self._buckets[-1][2] += 1
+        else:
+            self._buckets.append([b, value, 1])
+        self._sum += value
+        self._count += 1
+        # A candidate is useless once a later value is at least as small (min) / large (max)
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((b, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((b, value))
+
+    def expire(self, now):
+        # Keep a bucket while any part of its minute is inside the window
+        cutoff = now - self.window_s - self.resolution_s
+        while self._buckets and self._buckets[0][0] <= cutoff:
+            _, s, n = self._buckets.popleft()
+            self._sum -= s
+            self._count -= n
+        while self._min and self._min[0][0] <= cutoff:
+            self._min.popleft()
+        while self._max and self._max[0][0] <= cutoff:
+            self._max.popleft()
+        if not self._buckets:
+            # Drop accumulated float error with the last bucket
+            self._sum = 0.0
+
+    def stats(self, now):
+        self.expire(now)
+        if not self._count:
+            return {'min': None, 'max': None, 'mean': None, 'count': 0}
+        return {'min': self._min[0][1], 'max': self._max[0][1], 'mean': self._sum / self._count,
+                'count': self._count}
+
+
+class Trend:
+    """Change of a value over the last span_s seconds, from the last value of each minute."""
+
+    def __init__(self, span_s=TREND_SPAN_S, resolution_s=RESOLUTION_S):
+        self.span_s = span_s
+        self.resolution_s = resolution_s
+        self._samples = deque()  # [bucket start, value], oldest first
+
+    def add(self, t, value):
+        b = t - t % self.resolution_s
+        if self._samples and self._samples[-1][0] == b:
+            self._samples[-1][1] = value
+        else:
+            self._samples.append([b, value])
+
+    def stats(self, now):
+        cutoff = now - self.span_s
+        # Keep one sample at or before the cutoff as the reference
+        while len(self._samples) > 1 and self._samples[1][0] <= cutoff:
+            self._samples.popleft()
+        if self._samples and self._samples[-1][0] <= cutoff - self.resolution_s:
+            self._samples.clear()
+        if len(self._samples) < 2:
+            return None
+        (t0, v0), (t1, v1) = self._samples[0], self._samples[-1]
+        delta = v1 - v0
+        for bound, label in TREND_LEVELS:
+            if abs(delta) < bound:
+                break
+        return {'delta': round(delta, 2), 'span_s': t1 - t0, 'since': iso(t0),
+                'trend': label.format('rising' if delta > 0 else 'falling')}
+
+
+class StationSummary:
+
+    def __init__(self, fields, trend_field):
+        self.fields = fields
+        self.trend_field = trend_field
+        self.windows = {f: [(name, RollingWindow(seconds)) for name, seconds in WINDOWS] for f in fields}
+        self.latest = {}  # field -> (t, value)
+        self.trend = Trend()
+        self.newest = None
+
+    def add(self, row):
+        t = epoch(row['created_at'])
+        if self.newest is not None and t < self.newest:
+            if t <= self.newest - WINDOWS[-1][1]:
+                return
+            t = self.newest
+        self.newest = t
+        for f in self.fields:
+            value = row.get(f)
+            if value is None:
+                continue
+            value = float(value)
+            self.latest[f] = (t, value)
+            for _, window in self.windows[f]:
+                window.add(t, value)
+            if f == self.trend_field:
+                self.trend.add(t, value)
+
+    def stats(self, now):
+        fields = {}
+        for f in self.fields:
+            latest = self.latest.get(f)
+            fields[f] = {
+                'latest': latest[1] if latest else None,
+                'latest_at': iso(latest[0]) if latest else None,
+                **{name: window.stats(now) for name, window in self.windows[f]},
+            }
+        return {'updated_at': iso(self.newest) if self.newest is not None else None, 'fields': fields,
+                f'{self.trend_field}_trend': self.trend.stats(now)}
+
+
+class Summaries:
+    """StationSummary of every station, covering exactly the rows with id <= last_id.
+
+    Like HotCache, add() only folds rows whose ids follow last_id; after a gap (another
+    process inserted, a rollback) `behind` is set and the caller catches up with fold().
+    fold() does not step over a missing id either, until GAP_TIMEOUT_S have passed.
+    """
+
+    def __init__(self, fields, trend_field='pression'):
+        self.fields = tuple(fields)
+        self.trend_field = trend_field
+        self._lock = threading.Lock()
+        self._stations = {}
+        self._newest_station = None
+        self.last_id = None
+        self.behind = False
+        self._gap = None  # (last_id, monotonic time) when fold() first found the next id missing
+
+    @property
+    def loaded(self):
+        return self.last_id is not None
+
+    def load(self, rows, last_id):
+        """Replace the state with rows (id order), which must be every row up to last_id in the windows."""
+        stations = {}
+        newest_station = None
+        for row in rows:
+            self._fold_into(stations, row)
+            newest_station = row['station_id']
+        with self._lock:
+            self._stations = stations
+            self._newest_station = newest_station
+            self.last_id = last_id
+            self.behind = False
+            self._gap = None
+
+    def add(self, rows):
+        """Fold rows just committed (ascending id order)."""
+        with self._lock:
+            if self.last_id is None:
+                return
+            for row in rows:
+                if row['id'] != self.last_id + 1:
+                    self.behind = True
+                    return
+                self._fold(row)
+
+    def fold(self, rows, now=None):
+        """Fold rows read from the database after last_id (ascending id order).
+
+        Stops before a missing id, which the next call reads again once committed; returns
+        False then (`behind` stays set), True once every row is folded.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for row in rows:
+                if row['id'] <= self.last_id:
+                    continue
+                if row['id'] != self.last_id + 1:
+                    if self._gap is None or self._gap[0] != self.last_id:
+                        self._gap = (self.last_id, now)
+                    if now - self._gap[1] < GAP_TIMEOUT_S:
+                        self.behind = True
+                        return False
+                self._fold(row)
+            self._gap = None
+            self.behind = False
+            return True
+
+    def _fold(self, row):
+        self._fold_into(self._stations, row)
+        self._newest_station = row['station_id']
+        self.last_id = row['id']
+
+    def _fold_into(self, stations, row):
+        summary = stations.get(row['station_id'])
+        if summary is None:
+            summary = stations[row['station_id']] = StationSummary(self.fields, self.trend_field)
+        summary.add(row)
+
+    def summary(self, station, now):
+        """Summary of a station (the one that sent the newest row if None), or None if unknown."""
+        with self._lock:
+            station = station or self._newest_station
+            summary = self._stations.get(station)
+            if summary is None:
+                return None
+            return {'station_id': station, **summary.stats(now)}
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The API modules are flat files next to app.py, imported by name
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+# app.py reads its settings at import: tests that import it get a throwaway SQLite database
+APP_DATA = tempfile.mkdtemp(prefix='stationmeteo-tests-')
+os.environ.update(
+    STORAGE_BACKEND='sqlite',
+    SQLITE_PATH=os.path.join(APP_DATA, 'stationmeteo.db'),
+    WAL_PATH=os.path.join(APP_DATA, 'ingest.wal'),
+    ARCHIVE_DIR=os.path.join(APP_DATA, 'archive'),
+    INGEST_MODE='direct',
+    PARTITION_MAINTENANCE_INTERVAL='0',
+)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    app.ensure_db()
+    assert app.DB_INIT_DONE, app.DB_INIT_ERROR
+    return app
@@ -0,0 +1,117 @@
+"""Binary frames: binproto.encode_frame and the firmware's encode_binary_frame, read back by decode_frame."""
+import ast
+import math
+import os
+import struct
+
+import pytest
+
+import binproto
+
+FIRMWARE = os.path.join(os.path.dirname(binproto.__file__), os.pardir, 'station_meteo.py')
+FIRMWARE_NAMES = ('BINARY_VERSION', 'BINARY_FLOAT_FIELDS', 'encode_binary_frame')
+
+SAMPLE = [
+    {'temperature': 22.5, 'humidite': 44.0, 'pression': 1012.75, 'co2': 530.0,
+     'humidite_surface': 12.5, 'pluie_detectee': True, 'indice_uv': 2.25, 'age_s': 30},
+    {'temperature': -3.25, 'humidite': None, 'pression': 998.5, 'co2': None,
+     'humidite_surface': 0.0, 'pluie_detectee': False, 'indice_uv': 0.0},
+]
+
+
+@pytest.fixture(scope='module')
+def firmware_encode():
+    """encode_binary_frame from station_meteo.py.
+
+    The firmware imports MicroPython-only modules (machine, network), so only the encoder and its
+    constants are taken from the source and run on CPython's struct.
+    """
+    with open(FIRMWARE, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), FIRMWARE)
+    body = [node for node in tree.body
+            if isinstance(node, ast.FunctionDef) and node.name in FIRMWARE_NAMES
+            or isinstance(node, ast.Assign) and getattr(node.targets[0], 'id', None) in FIRMWARE_NAMES]
+    assert len(body) == len(FIRMWARE_NAMES)
+    namespace = {'struct': struct, 'const': lambda value: value}
+    exec(compile(ast.Module(body=body, type_ignores=[]), FIRMWARE, 'exec'), namespace)
+    return namespace['encode_binary_frame']
+
+
+def assert_same(original, rec):
+    for f in binproto.FLOAT_FIELDS:
+        if original[f] is None:
+            assert rec[f] is None, f
+        else:
+            # Sample values are exact in float32
+            assert rec[f] == original[f], f
+    assert rec['pluie_detectee'] == original['pluie_detectee']
+    assert rec['age_s'] == original.get('age_s', 0)
+
+
+def test_round_trip_v1():
+    frame = binproto.encode_frame(SAMPLE)
+    assert frame[2] == 1
+    assert len(frame) == binproto.HEADER.size + 2 * binproto.RECORD_V1.size == 58
+    decoded = binproto.decode_frame(frame)
+    for original, rec in zip(SAMPLE, decoded):
+        assert_same(original, rec)
+        assert 'seq' not in rec
+
+
+def test_round_trip_v2():
+    frame = binproto.encode_frame([dict(SAMPLE[0], seq=7), SAMPLE[1]])
+    assert frame[2] == 2
+    assert len(frame) == binproto.HEADER.size + 2 * binproto.RECORD_V2.size
+    decoded = binproto.decode_frame(frame)
+    for original, rec in zip(SAMPLE, decoded):
+        assert_same(original, rec)
+    assert [rec.get('seq') for rec in decoded] == [7, None]
+
+
+def test_encode_limits():
+    assert binproto.encode_frame([{'age_s': 10 ** 6}])[-2:] == b'\xff\xff'
+    assert binproto.decode_frame(binproto.encode_frame([{'age_s': -5}]))[0]['age_s'] == 0
+    with pytest.raises(ValueError):
+        binproto.encode_frame([])
+    with pytest.raises(ValueError):
+        binproto.encode_frame([{}] * (binproto.MAX_RECORDS + 1))
+    with pytest.raises(ValueError):
+        binproto.encode_frame([{'seq': binproto.MAX_SEQ + 1}])
+
+
+def test_decode_nan_as_none():
+    frame = binproto.encode_frame([{'temperature': math.nan}])
+    rec = binproto.decode_frame(frame)[0]
+    assert all(rec[f] is None for f in binproto.FLOAT_FIELDS)
+
+
+@pytest.mark.parametrize('mangle', [
+    lambda frame: b'',
+    lambda frame: b'XX' + frame[2:],
+    lambda frame: frame[:-1],
+    lambda frame: frame + b'\x00',
+    lambda frame: frame[:2] + b'\x03' + frame[3:],
+    lambda frame: frame[:3] + b'\x00',
+    lambda frame: frame[:2] + b'\x02' + frame[3:],  # v1 records read as v2
+], ids=['empty', 'magic', 'short', 'long', 'version', 'no-records', 'wrong-version'])
+def test_decode_rejects(mangle):
+    with pytest.raises(binproto.DecodeError):
+        binproto.decode_frame(mangle(binproto.encode_frame([SAMPLE[0]])))
+
+
+def test_firmware_frame(firmware_encode):
+    payloads = [dict(SAMPLE[0], seq=1001), dict(SAMPLE[1], station_id='jardin', seq=1002)]
+    frame = bytes(firmware_encode(payloads))
+    assert frame == binproto.encode_frame(payloads)
+    decoded = binproto.decode_frame(frame)
+    for original, rec in zip(payloads, decoded):
+        assert_same(original, rec)
+        assert rec['seq'] == original['seq']
+
+
+def test_firmware_frame_without_seq(firmware_encode):
+    # A station that has not numbered its readings sends seq 0, read as none
+    frame = bytes(firmware_encode([dict(SAMPLE[0], age_s=10 ** 6)]))
+    rec = binproto.decode_frame(frame)[0]
+    assert 'seq' not in rec
+    assert rec['age_s'] == binproto.MAX_AGE_S
@@ -0,0 +1,147 @@
+"""The MariaDB connection pool, with fake connections (no server needed)."""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+from pymysql.constants import SERVER_STATUS  # noqa: E402
+
+from db_pool import ConnectionPool, PoolTimeout  # noqa: E402
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.open = True
+        self.server_status = 0
+        self.alive = True
+        self.pings = 0
+        self.rollbacks = 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+        if not self.alive:
+            raise ConnectionError('gone away')
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.server_status = 0
+
+    def close(self):
+        self.open = False
+
+
+@pytest.fixture
+def opened():
+    return []
+
+
+def make_pool(opened, **kwargs):
+    def connect():
+        raw = FakeConnection()
+        opened.append(raw)
+        return raw
+    return ConnectionPool(connect, **kwargs)
+
+
+def test_checkout_reuses_connection(opened):
+    pool = make_pool(opened, size=2)
+    with pool.get() as conn:
+        first = conn._raw
+    with pool.get() as conn:
+        assert conn._raw is first
+    assert len(opened) == 1
+    stats = pool.stats()
+    assert stats['open'] == 1 and stats['idle'] == 1 and stats['in_use'] == 0 and stats['connects'] == 1
+
+
+def test_open_transaction_rolled_back(opened):
+    pool = make_pool(opened)
+    conn = pool.get()
+    # Left mid-transaction by the caller
+    opened[0].server_status = SERVER_STATUS.SERVER_STATUS_IN_TRANS
+    conn.close()
+    assert opened[0].rollbacks == 1 and pool.stats()['idle'] == 1
+
+
+def test_discarded_connection_replaced(opened):
+    pool = make_pool(opened)
+    pool.get().discard()
+    assert not opened[0].open and pool.stats()['open'] == 0
+    with pool.get():
+        pass
+    assert len(opened) == 2
+
+
+def test_recycle(opened):
+    pool = make_pool(opened, recycle=0.05, ping_interval=60)
+    pool.get().close()
+    time.sleep(0.06)
+    with pool.get() as conn:
+        assert conn._raw is opened[1]
+    assert not opened[0].open
+    assert pool.stats()['recycled'] == 1 and pool.stats()['open'] == 1
+
+
+def test_ping_after_idle(opened):
+    pool = make_pool(opened, ping_interval=0)
+    pool.get().close()
+    opened[0].alive = False
+    # The dead connection is replaced without the caller noticing
+    with pool.get() as conn:
+        assert conn._raw is opened[1]
+    assert opened[0].pings == 1 and pool.stats()['ping_failures'] == 1
+
+
+def test_timeout_when_exhausted(opened):
+    pool = make_pool(opened, size=1, timeout=0.05)
+    held = pool.get()
+    with pytest.raises(PoolTimeout):
+        pool.get()
+    stats = pool.stats()
+    assert stats['waits'] == 1 and stats['wait_ms_max'] >= 50
+    held.close()
+    pool.get().close()
+
+
+def test_waiter_gets_released_connection(opened):
+    pool = make_pool(opened, size=1, timeout=5)
+    held = pool.get()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.get()))
+    waiter.start()
+    time.sleep(0.05)
+    held.close()
+    waiter.join(5)
+    assert got and got[0]._raw is opened[0] and len(opened) == 1
+
+
+def test_connect_error_frees_slot(opened):
+    def connect():
+        raise ConnectionError('refused')
+
+    pool = ConnectionPool(connect, size=1, timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            pool.get()
+    stats = pool.stats()
+    # Not PoolTimeout: the failed attempt gave its slot back
+    assert stats['connect_errors'] == 2 and stats['open'] == 0 and stats['in_use'] == 0
+
+
+def test_concurrent_counters(opened):
+    pool = make_pool(opened, size=4, ping_interval=0)
+
+    def borrow():
+        for _ in range(200):
+            pool.get().close()
+
+    threads = [threading.Thread(target=borrow) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = pool.stats()
+    assert stats['in_use'] == 0 and stats['connects'] == len(opened) <= 4
@@ -0,0 +1,70 @@
+"""LTTB downsampling for /measures?max_points=."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from downsample import lttb_indices, lttb_series
+
+
+def series(n):
+    x = np.arange(n, dtype=float)
+    return x, np.sin(x / 5)
+
+
+@pytest.mark.parametrize('n, n_out', [(10, 3), (100, 7), (1000, 50), (1001, 1000)])
+def test_keeps_endpoints_and_size(n, n_out):
+    x, y = series(n)
+    idx = lttb_indices(x, y, n_out)
+    assert len(idx) == n_out
+    assert idx[0] == 0 and idx[-1] == n - 1
+    # One point per bucket, in order
+    assert np.all(np.diff(idx) > 0)
+
+
+@pytest.mark.parametrize('n_out', [5, 6, 100])
+def test_as_many_points_as_asked_or_more(n_out):
+    x, y = series(5)
+    assert lttb_indices(x, y, n_out).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_short_series():
+    assert lttb_indices([1.0], [2.0], 3).tolist() == [0]
+    assert lttb_indices([1.0, 2.0], [2.0, 3.0], 3).tolist() == [0, 1]
+    assert lttb_indices([], [], 3).tolist() == []
+
+
+def test_at_least_three_points():
+    x, y = series(10)
+    assert len(lttb_indices(x, y, 1)) == 3
+
+
+def test_keeps_isolated_peak():
+    x = np.arange(200, dtype=float)
+    y = np.zeros(200)
+    y[123] = 50.0
+    assert 123 in lttb_indices(x, y, 10).tolist()
+
+
+def test_series_skips_missing_values():
+    times = [0.0, 1.0, 2.0, 3.0, 4.0]
+    values = [1.0, None, 3.0, None, 5.0]
+    assert lttb_series(times, values, 10) == ([0.0, 2.0, 4.0], [1.0, 3.0, 5.0])
+    assert lttb_series(times, [None] * 5, 10) == ([], [])
+
+
+def test_measures_max_points(app_module):
+    station = 'downsample-test'
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=2)
+    app_module.STORAGE.insert_rows([
+        {'station_id': station, 'created_at': start + timedelta(minutes=i), 'temperature': 40.0 if i == 33 else 20.0}
+        for i in range(100)])
+    resp = app_module.app.test_client().get(
+        '/measures', query_string={'max_points': 10, 'station': station, 'fields': 'temperature',
+                                   'from': (start - timedelta(minutes=1)).isoformat() + 'Z'})
+    assert resp.status_code == 200 and resp.headers['X-Station'] == station
+    points = resp.get_json()['temperature']
+    assert len(points) == 10
+    assert points[0]['t'] == start.isoformat() + 'Z'
+    assert points[-1]['t'] == (start + timedelta(minutes=99)).isoformat() + 'Z'
+    assert max(p['v'] for p in points) == 40.0
@@ -0,0 +1,85 @@
+"""The in-memory ring of the newest rows behind /latest and /measures."""
+from hot_cache import HotCache
+
+
+def rows(*ids):
+    return [{'id': i} for i in ids]
+
+
+def ids(rows):
+    return [row['id'] for row in rows]
+
+
+def test_empty_until_loaded():
+    cache = HotCache(3)
+    assert cache.latest(1) is None
+    cache.load([])
+    # An empty table is answered from the cache
+    assert cache.latest(1) == []
+
+
+def test_ring_evicts_oldest():
+    cache = HotCache(3)
+    cache.load(rows(2, 1))
+    cache.add(rows(3, 4, 5))
+    assert ids(cache.latest(3)) == [5, 4, 3]
+    assert cache.newest_id == 5
+    # More than it holds: not answered
+    assert cache.latest(4) is None
+
+
+def test_short_table_complete():
+    cache = HotCache(3)
+    cache.load(rows(2, 1))
+    # Every row of the table is there: a larger limit gets them all
+    assert ids(cache.latest(3)) == [2, 1]
+    cache.add(rows(3, 4))
+    # Filled up and evicted: rows may exist beyond the ring
+    assert ids(cache.latest(3)) == [4, 3, 2]
+    assert cache.latest(4) is None
+
+
+def test_add_skips_non_contiguous_rows():
+    cache = HotCache(5)
+    cache.load(rows(2, 1))
+    cache.add(rows(4))
+    # 3 is missing: 4 is not appended, the reader catches up from newest_id
+    assert cache.newest_id == 2
+    cache.add(rows(3, 4))
+    assert ids(cache.latest(5)) == [4, 3, 2, 1]
+
+
+def test_stats():
+    cache = HotCache(2)
+    cache.load(rows(1))
+    cache.latest(1)
+    cache.latest(3)
+    assert cache.stats() == {'size': 2, 'rows': 1, 'valid': True, 'hits': 1, 'misses': 1,
+                             'hit_ratio': 0.5, 'reloads': 1}
+
+
+def test_catch_up_with_other_process(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'ETAG_MAX_ID_TTL', 0.01)
+    app_module.reload_hot_cache()
+    cache = app_module.HOT_CACHE
+    reloads = cache.reloads
+
+    def insert_elsewhere(n):
+        # Another process inserted: not added to this cache, seen through MAX(id)
+        rows = [{'station_id': 'cache-test', 'temperature': float(i)} for i in range(n)]
+        inserted = app_module.STORAGE.insert_rows(rows)
+        app_module.store_max_id(inserted[-1])
+        return inserted
+
+    inserted = insert_elsewhere(2)
+    assert ids(app_module.cached_latest(2)) == inserted[::-1]
+    # Read the two new rows, not the whole cache
+    assert cache.reloads == reloads
+
+    # One of them still uncommitted when read: the cache reloads instead of skipping it
+    low, high = insert_elsewhere(2)
+    rows_after = app_module.rows_after
+    monkeypatch.setattr(app_module, 'rows_after',
+                        lambda *args: [r for r in rows_after(*args) if r['id'] != low])
+    assert ids(app_module.cached_latest(2)) == [high, low]
+    assert cache.reloads == reloads + 1
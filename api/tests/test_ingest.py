@@ -0,0 +1,48 @@
+"""/add idempotency keys: seq and ts, in JSON and in binary frames."""
+import time
+import uuid
+
+import pytest
+
+import binproto
+
+
+@pytest.fixture
+def post(app_module):
+    client = app_module.app.test_client()
+    station = f'ingest-{uuid.uuid4().hex[:12]}'
+
+    def post(**fields):
+        return client.post('/add', json={'station_id': station, 'temperature': 20.0, **fields})
+
+    post.binary = lambda **fields: client.post(
+        '/add', data=binproto.encode_frame([{'temperature': 20.0, **fields}]),
+        headers={'Content-Type': binproto.MIMETYPE, 'X-Station-Id': station})
+    return post
+
+
+def test_seq_dedup(post):
+    assert post(seq=5).status_code == 201
+    resp = post(seq=5)
+    assert resp.status_code == 200 and resp.get_json()['status'] == 'duplicate'
+    # Same key whichever encoding carried it
+    assert post.binary(seq=5).get_json()['status'] == 'duplicate'
+
+
+def test_seq_zero_is_none(post):
+    # As in a binary frame, which has no way to leave seq out
+    for send in (post, post.binary):
+        assert send(seq=0).status_code == 201
+        assert send(seq=0).status_code == 201
+
+
+def test_ts_and_seq_apart(post):
+    ts = int(time.time()) - 60
+    assert post(seq=ts).status_code == 201
+    assert post(ts=ts).status_code == 201
+    assert post(ts=ts).get_json()['status'] == 'duplicate'
+
+
+def test_invalid_seq(post):
+    assert post(seq=-1).status_code == 400
+    assert post(seq=1.5).status_code == 400
@@ -0,0 +1,66 @@
+"""gunicorn.conf.py: on SIGTERM a worker ends its open streams instead of waiting for graceful_timeout."""
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('gunicorn')
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GRACEFUL_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(server, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        assert server.poll() is None, 'gunicorn exited'
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise AssertionError('gunicorn not ready')
+
+
+@pytest.mark.parametrize('serve_app', ['wsgi', 'asgi'])
+def test_open_stream_does_not_hold_shutdown(serve_app, tmp_path):
+    if serve_app == 'asgi':
+        pytest.importorskip('uvicorn_worker')
+    port = free_port()
+    env = dict(os.environ, SERVE_APP=serve_app, PORT=str(port), WEB_CONCURRENCY='1',
+               GRACEFUL_TIMEOUT=str(GRACEFUL_TIMEOUT), SQLITE_PATH=str(tmp_path / 'test.db'),
+               WAL_PATH=str(tmp_path / 'ingest.wal'), ARCHIVE_DIR=str(tmp_path / 'archive'))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], cwd=API_DIR,
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(server, port)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=GRACEFUL_TIMEOUT)
+        conn.request('GET', '/measures/stream')
+        stream = conn.getresponse()
+        assert stream.status == 200
+        assert stream.readline().startswith(b'retry')
+
+        started = time.monotonic()
+        server.send_signal(signal.SIGTERM)
+        # The worker ends the stream (the browser would reconnect elsewhere), then exits
+        stream.read()
+        server.wait(GRACEFUL_TIMEOUT)
+        assert time.monotonic() - started < GRACEFUL_TIMEOUT / 3
+    finally:
+        if server.poll() is None:
+            server.kill()
+            server.wait()
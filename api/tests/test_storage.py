@@ -0,0 +1,198 @@
+"""The Storage interface, run against each backend.
+
+SQLite runs on a temporary file. MariaDB runs when TEST_MARIADB_HOST is set, with app.py's INSERT
+statements (DB_PORT, DB_NAME, DB_USER and DB_PASS as for the app); use a throwaway database: each
+test writes rows under a station id of its own and leaves them there.
+"""
+import math
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import storage
+
+FIELDS = ('temperature', 'humidite', 'pluie_detectee')
+COLUMNS = 'id, created_at, station_id, temperature, humidite, pression, co2, humidite_surface, pluie_detectee, indice_uv'
+# On the hour, far enough back for the rows below to be in the past
+HOUR = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+
+
+def mariadb_storage():
+    # app.py itself runs on SQLite in the tests (conftest.py): only its INSERT path is borrowed
+    import pymysql
+    from pymysql.cursors import DictCursor, SSDictCursor
+
+    import app
+    from db_pool import ConnectionPool
+
+    def connect():
+        return pymysql.connect(
+            host=os.environ['TEST_MARIADB_HOST'],
+            port=int(os.getenv('DB_PORT', '3306')),
+            user=os.getenv('DB_USER', 'pico'),
+            password=os.getenv('DB_PASS', 'motdepassepico'),
+            database=os.getenv('DB_NAME', 'stationmeteo'),
+            cursorclass=DictCursor,
+            autocommit=True,
+            init_command="SET time_zone = '+00:00'",
+        )
+
+    return storage.MariaDBStorage(ConnectionPool(connect, size=2), app.insert_rows, SSDictCursor, connect)
+
+
+@pytest.fixture(params=[
+    'sqlite',
+    pytest.param('mariadb', marks=pytest.mark.skipif(not os.getenv('TEST_MARIADB_HOST'),
+                                                     reason='TEST_MARIADB_HOST not set')),
+])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        backend = storage.SQLiteStorage(lambda: storage.connect_sqlite(str(tmp_path / 'test.db')))
+    else:
+        backend = mariadb_storage()
+    applied, version = backend.migrate()
+    assert version == backend.latest_version
+    yield backend
+    if request.param == 'sqlite':
+        backend.connection().close()
+
+
+@pytest.fixture
+def station():
+    return f'test-{uuid.uuid4().hex[:12]}'
+
+
+def measure(station, minutes, temperature, **extra):
+    row = dict(station_id=station, created_at=HOUR + timedelta(minutes=minutes), temperature=temperature,
+               humidite=50.0, pluie_detectee=0)
+    row.update(extra)
+    return row
+
+
+def rows_of(store, station):
+    return store.select(f"SELECT {COLUMNS} FROM mesures WHERE station_id = %s ORDER BY id", [station])
+
+
+def test_insert_and_select(store, station):
+    ids = store.insert_rows([measure(station, 0, 20.5), measure(station, 30, 21.0, pluie_detectee=1)])
+    assert ids[1] == ids[0] + 1
+    rows = rows_of(store, station)
+    assert [r['id'] for r in rows] == ids
+    assert [r['created_at'] for r in rows] == [HOUR, HOUR + timedelta(minutes=30)]
+    assert [r['temperature'] for r in rows] == [20.5, 21.0]
+    assert [r['pluie_detectee'] for r in rows] == [0, 1]
+    assert rows[0]['pression'] is None
+
+    window = store.select(
+        f"SELECT {COLUMNS} FROM mesures WHERE station_id = %s AND created_at >= %s AND created_at < %s",
+        [station, HOUR + timedelta(minutes=10), HOUR + timedelta(hours=1)])
+    assert [r['id'] for r in window] == ids[1:]
+
+
+def test_insert_default_created_at(store, station):
+    before = datetime.utcnow().replace(microsecond=0)
+    store.insert_rows([{'station_id': station, 'temperature': 1.0}])
+    created_at = rows_of(store, station)[0]['created_at']
+    assert before - timedelta(seconds=1) <= created_at <= datetime.utcnow() + timedelta(seconds=1)
+
+
+def test_seq_dedup(store, station):
+    first = store.insert_rows([measure(station, 0, 20.0, seq=1), measure(station, 1, 20.1, seq=2)])
+    assert None not in first
+    # A retry of seq 2, a new seq 3 and seq 3 again within the same batch
+    again = store.insert_rows([measure(station, 1, 20.1, seq=2), measure(station, 2, 20.2, seq=3),
+                               measure(station, 2, 99.0, seq=3)])
+    assert again[0] is None and again[2] is None
+    # A duplicate uses up no id
+    assert again[1] == first[1] + 1
+    assert [r['temperature'] for r in rows_of(store, station)] == [20.0, 20.1, 20.2]
+    # Keys are per station; rows without seq are never deduplicated
+    other = f'{station}-b'
+    assert None not in store.insert_rows([measure(other, 0, 5.0, seq=1)])
+    assert None not in store.insert_rows([measure(station, 3, 20.3), measure(station, 3, 20.3)])
+
+
+def test_seq_kinds_apart(store, station):
+    # A station clock reading (ts) never matches a sequence number of the same value
+    ts = 1700000000
+    assert None not in store.insert_rows([measure(station, 0, 1.0, seq=ts),
+                                          measure(station, 1, 2.0, seq=ts, seq_kind='ts')])
+    assert store.insert_rows([measure(station, 1, 2.0, seq=ts, seq_kind='ts')]) == [None]
+
+
+def test_seq_outlives_deleted_rows(store, station):
+    # Archiving deletes the rows; their keys still reject a replay
+    ids = store.insert_rows([measure(station, 0, 20.0, seq=1)])
+    store.delete_rows(ids, HOUR, HOUR + timedelta(hours=1))
+    assert store.insert_rows([measure(station, 0, 20.0, seq=1)]) == [None]
+    # Until they are pruned (a negative age prunes every key)
+    assert store.prune_sequences(-1) >= 1
+    assert None not in store.insert_rows([measure(station, 0, 20.0, seq=1)])
+
+
+def test_aggregate(store, station):
+    store.insert_rows([
+        measure(station, 0, 10.0), measure(station, 20, 20.0, pluie_detectee=1), measure(station, 40, None),
+        measure(station, 70, 30.0),
+    ])
+    store.insert_rows([measure(f'{station}-b', 10, 100.0)])
+    end = HOUR + timedelta(hours=2)
+    # 3600 s reads the hourly rollup on MariaDB, 1800 s the minute rollup: same rows as the raw table
+    for bucket_s in (3600, 1800):
+        rows, source = store.aggregate(bucket_s, HOUR, end, FIELDS, [station])
+        buckets = {int(r['bucket']): r for r in rows}
+        epoch = int((HOUR - datetime(1970, 1, 1)).total_seconds())
+        assert sorted(buckets) == sorted({epoch + (m * 60 // bucket_s) * bucket_s for m in (0, 20, 40, 70)})
+        first = buckets[epoch]
+        if bucket_s == 3600:
+            assert int(first['n']) == 3
+            assert int(first['temperature__count']) == 2
+            assert math.isclose(float(first['temperature__avg']), 15.0)
+            assert float(first['temperature__min']) == 10.0 and float(first['temperature__max']) == 20.0
+            assert int(first['pluie_detectee__max']) == 1
+            assert int(buckets[epoch + 3600]['n']) == 1
+    # Every station merged
+    rows, source = store.aggregate(3600, HOUR, end, FIELDS)
+    assert sum(int(r['n']) for r in rows) >= 5
+
+
+def test_export(store, station):
+    ids = store.insert_rows([measure(station, i, float(i)) for i in range(7)])
+    stream = store.export(f"SELECT {COLUMNS} FROM mesures WHERE station_id = %s ORDER BY id", [station], 3)
+    try:
+        batches = [[r['id'] for r in rows] for rows in stream]
+    finally:
+        stream.close()
+    assert batches == [ids[:3], ids[3:6], ids[6:]]
+    # Closed again (as the server does after a complete response): no error
+    stream.close()
+
+
+def test_export_aborted(store, station):
+    store.insert_rows([measure(station, i, float(i)) for i in range(7)])
+    stream = store.export(f"SELECT {COLUMNS} FROM mesures WHERE station_id = %s ORDER BY id", [station], 2)
+    assert len(next(iter(stream))) == 2
+    stream.close(aborted=True)
+    # The backend is still usable after a stream left mid-way
+    assert len(rows_of(store, station)) == 7
+
+
+def test_export_error_before_first_row(store):
+    with pytest.raises(Exception):
+        store.export("SELECT no_such_column FROM mesures", [], 10)
+
+
+def test_delete_rows(store, station):
+    ids = store.insert_rows([measure(station, i * 30, float(i)) for i in range(4)])
+    # Only ids inside the created_at range go
+    store.delete_rows(ids, HOUR, HOUR + timedelta(hours=1))
+    assert [r['id'] for r in rows_of(store, station)] == ids[2:]
+
+
+def test_epoch_sql(store, station):
+    store.insert_rows([measure(station, 0, 1.0)])
+    row = store.select(f"SELECT {store.epoch_sql('created_at')} AS ts FROM mesures WHERE station_id = %s",
+                       [station])[0]
+    assert int(row['ts']) == int((HOUR - datetime(1970, 1, 1)).total_seconds())
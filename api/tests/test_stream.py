@@ -0,0 +1,165 @@
+"""/measures/stream: rows published out of id order, and where a client resumes."""
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+from events import StreamPosition
+
+TIMEOUT = 30
+
+
+def rows(*ids):
+    return [{'id': i} for i in ids]
+
+
+def ids(rows):
+    return [row['id'] for row in rows]
+
+
+def test_position_in_order():
+    position = StreamPosition(10, TIMEOUT)
+    assert ids(position.accept(rows(11, 12), 0)) == [11, 12]
+    assert position.floor == 12 and not position.pending
+
+
+def test_position_out_of_order():
+    position = StreamPosition(10, TIMEOUT)
+    assert ids(position.accept(rows(12), 0)) == [12]
+    # 11 is still missing: a client resuming from floor is sent 12 again, never misses 11
+    assert position.floor == 10 and position.pending and position.top == 12
+    assert ids(position.accept(rows(11), 1)) == [11]
+    assert position.floor == 12 and not position.pending
+
+
+def test_position_skips_repeats():
+    # A database read after rows already published
+    position = StreamPosition(10, TIMEOUT)
+    position.accept(rows(11, 13), 0)
+    assert ids(position.accept(rows(11, 12, 13, 14), 1)) == [12, 14]
+    assert position.floor == 14
+    assert position.accept(rows(12, 14), 2) == []
+
+
+def test_position_gap_timeout():
+    position = StreamPosition(10, TIMEOUT)
+    position.accept(rows(11, 13, 14), 0)
+    position.advance(TIMEOUT - 1)
+    assert position.floor == 11
+    # 12 rolled back: passed over once it has been missing for the timeout
+    position.advance(TIMEOUT)
+    assert position.floor == 14 and not position.pending
+    # ...unless it commits after all: still sent, once
+    assert ids(position.accept(rows(12), TIMEOUT + 1)) == [12]
+    assert position.accept(rows(12), TIMEOUT + 2) == []
+
+
+def test_position_gap_timer_per_gap():
+    position = StreamPosition(10, TIMEOUT)
+    position.accept(rows(12), 0)
+    position.accept(rows(11, 14), TIMEOUT - 1)
+    # The gap at 13 was found at TIMEOUT - 1, not at 0
+    position.advance(TIMEOUT + 1)
+    assert position.floor == 12
+    position.advance(2 * TIMEOUT - 1)
+    assert position.floor == 14
+
+
+def test_position_rows_before_start():
+    # A row committed before the stream started but published after it subscribed is new
+    position = StreamPosition(10, TIMEOUT)
+    assert ids(position.accept(rows(9), 0)) == [9]
+    assert position.floor == 10
+
+
+def measure(app, temperature):
+    return {'created_at': datetime.utcnow().replace(microsecond=0), 'station_id': 'stream-test',
+            **{f: None for f in app.MEASURE_FIELDS}, 'temperature': temperature}
+
+
+def read_events(chunks, n):
+    """(event id, row id) of the next n measure events."""
+    events = []
+    while len(events) < n:
+        chunk = next(chunks)
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode()
+        assert not chunk.startswith(': keepalive'), 'event not sent'
+        if 'event: measure' in chunk:
+            lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            events.append((int(lines['id']), json.loads(lines['data'])['id']))
+    return events
+
+
+@pytest.fixture
+def stream(app_module, monkeypatch):
+    # A missing event shows up as a keepalive instead of a hang
+    monkeypatch.setattr(app_module, 'SSE_KEEPALIVE', 0.5)
+    monkeypatch.setattr(app_module, 'ETAG_MAX_ID_TTL', 0)
+    responses = []
+
+    def open_stream(headers=None):
+        # One open stream at a time: each holds a request context of this thread
+        while responses:
+            responses.pop().close()
+        resp = app_module.app.test_client().get('/measures/stream', headers=headers or {}, buffered=False)
+        responses.append(resp)
+        assert resp.status_code == 200
+        chunks = iter(resp.response)
+        assert next(chunks).startswith(b'retry')
+        return chunks
+
+    yield open_stream
+    while responses:
+        responses.pop().close()
+
+
+def test_stream_sends_rows_published_out_of_order(app_module, stream):
+    chunks = stream()
+    first, second = (measure(app_module, 1.0), measure(app_module, 2.0))
+    low, high = app_module.STORAGE.insert_rows([first, second])
+    # The transaction of the higher id finished first
+    app_module.record_inserted([second], [high])
+    app_module.record_inserted([first], [low])
+    events = read_events(chunks, 2)
+    assert [row_id for _, row_id in events] == [high, low]
+    # The first event id stays below the missing row, the second covers both
+    assert events[0][0] == low - 1 and events[1][0] == high
+
+
+def test_stream_resume_from_event_id(app_module, stream):
+    chunks = stream()
+    first, second = (measure(app_module, 3.0), measure(app_module, 4.0))
+    low, high = app_module.STORAGE.insert_rows([first, second])
+    app_module.record_inserted([second], [high])
+    (event_id, row_id), = read_events(chunks, 1)
+    assert row_id == high
+    # The client drops before `low` is published: resuming from its last event id sends both
+    resumed = stream({'Last-Event-ID': str(event_id)})
+    assert sorted(row_id for _, row_id in read_events(resumed, 2)) == [low, high]
+
+
+def test_stream_rows_of_another_process(app_module, stream, monkeypatch):
+    # Several processes: rows inserted elsewhere are not published here, they are read from the DB
+    monkeypatch.setattr(app_module, 'ETAG_MAX_ID_TTL', 0.05)
+    chunks = stream()
+    low, high = app_module.STORAGE.insert_rows([measure(app_module, 5.0), measure(app_module, 6.0)])
+    # The other process has not committed `low` yet when this one reads
+    hidden = {low}
+    rows_after = app_module.rows_after
+    monkeypatch.setattr(app_module, 'rows_after',
+                        lambda *args: [row for row in rows_after(*args) if row['id'] not in hidden])
+    assert read_events(chunks, 1) == [(low - 1, high)]
+    hidden.clear()
+    assert read_events(chunks, 1) == [(high, low)]
+
+
+def test_stream_limit(app_module, stream, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_SLOTS', threading.BoundedSemaphore(1))
+    stream()
+    busy = app_module.app.test_client().get('/measures/stream')
+    assert busy.status_code == 503 and busy.headers['Retry-After'] == '5'
+    assert busy.get_data(as_text=True).startswith('retry:')
+    # Closing the open stream frees its slot
+    stream()
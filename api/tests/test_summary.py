@@ -0,0 +1,115 @@
+"""/summary accumulators: rolling windows, and folding rows that arrive out of id order."""
+import calendar
+from datetime import datetime, timedelta
+
+from summary import GAP_TIMEOUT_S, RollingWindow, Summaries
+
+T0 = datetime(2024, 5, 1, 12, 0, 0)
+NOW = calendar.timegm(T0.timetuple()) + 60
+
+
+def row(row_id, temperature, station='summary-test', minutes=0):
+    return {'id': row_id, 'station_id': station, 'created_at': T0 + timedelta(minutes=minutes),
+            'temperature': temperature}
+
+
+def summaries(last_id=10):
+    s = Summaries(['temperature'])
+    s.load([], last_id)
+    return s
+
+
+def count(s, station='summary-test'):
+    body = s.summary(station, NOW)
+    return body['fields']['temperature']['1h']['count'] if body else 0
+
+
+def test_rolling_window():
+    window = RollingWindow(3600)
+    for t, value in ((0, 5.0), (30, 1.0), (1800, 3.0)):
+        window.add(t, value)
+    assert window.stats(1800) == {'min': 1.0, 'max': 5.0, 'mean': 3.0, 'count': 3}
+    # The first minute leaves the window, the rest stays
+    assert window.stats(3600 + 60) == {'min': 3.0, 'max': 3.0, 'mean': 3.0, 'count': 1}
+    assert window.stats(2 * 3600 + 3600)['count'] == 0
+
+
+def test_add_in_order():
+    s = summaries()
+    s.add([row(11, 20.0), row(12, 22.0)])
+    assert s.last_id == 12 and not s.behind
+    assert s.summary(None, NOW)['fields']['temperature']['1h']['mean'] == 21.0
+
+
+def test_add_after_gap_sets_behind():
+    s = summaries()
+    s.add([row(12, 20.0)])
+    # Nothing folded past the missing id: the caller reads the DB with fold()
+    assert s.behind and s.last_id == 10 and count(s) == 0
+
+
+def test_fold_stops_at_missing_id():
+    s = summaries()
+    assert not s.fold([row(11, 1.0), row(13, 3.0)], now=0)
+    assert s.last_id == 11 and s.behind
+    # Still missing a little later: 13 is not read past
+    assert not s.fold([row(13, 3.0)], now=GAP_TIMEOUT_S - 1)
+    assert s.last_id == 11
+    # 12 committed: both folded, in order, once
+    assert s.fold([row(12, 2.0), row(13, 3.0)], now=GAP_TIMEOUT_S - 1)
+    assert s.last_id == 13 and not s.behind and count(s) == 3
+
+
+def test_fold_skips_rolled_back_id():
+    s = summaries()
+    s.fold([row(12, 2.0)], now=0)
+    assert s.last_id == 10
+    # Missing for GAP_TIMEOUT_S: taken for rolled back
+    assert s.fold([row(12, 2.0)], now=GAP_TIMEOUT_S)
+    assert s.last_id == 12 and count(s) == 1
+
+
+def test_fold_gap_timer_restarts_per_gap():
+    s = summaries()
+    s.fold([row(12, 2.0)], now=0)
+    s.fold([row(11, 1.0), row(12, 2.0), row(14, 4.0)], now=GAP_TIMEOUT_S - 1)
+    # The gap at 13 was found at GAP_TIMEOUT_S - 1, not at 0
+    assert not s.fold([row(14, 4.0)], now=GAP_TIMEOUT_S + 1)
+    assert s.last_id == 12
+    assert s.fold([row(14, 4.0)], now=2 * GAP_TIMEOUT_S - 1)
+    assert s.last_id == 14
+
+
+def test_fold_ignores_rows_already_folded():
+    s = summaries()
+    s.add([row(11, 1.0)])
+    assert s.fold([row(10, 0.0), row(11, 1.0), row(12, 2.0)], now=0)
+    assert s.last_id == 12 and count(s) == 2
+
+
+def test_stations_apart():
+    s = summaries()
+    s.add([row(11, 1.0, 'a'), row(12, 5.0, 'b')])
+    assert s.summary('a', NOW)['fields']['temperature']['latest'] == 1.0
+    # No station: the one that sent the newest row
+    assert s.summary(None, NOW)['station_id'] == 'b'
+    assert s.summary('c', NOW) is None
+
+
+def test_refresh_waits_for_uncommitted_row(app_module, monkeypatch):
+    app_module.reload_summaries()
+    rows = [{'station_id': 'summary-test', 'created_at': datetime.utcnow().replace(microsecond=0),
+             'temperature': t} for t in (1.0, 2.0)]
+    # Inserted by another process, which has not committed `low` yet
+    low, high = app_module.STORAGE.insert_rows(rows)
+    hidden = {low}
+    rows_after = app_module.rows_after
+    monkeypatch.setattr(app_module, 'rows_after',
+                        lambda *args: [r for r in rows_after(*args) if r['id'] not in hidden])
+    monkeypatch.setattr(app_module, 'ETAG_MAX_ID_TTL', 0.01)
+    app_module.store_max_id(high)
+    app_module.refresh_summaries()
+    assert app_module.SUMMARIES.last_id == low - 1 and app_module.SUMMARIES.behind
+    hidden.clear()
+    app_module.refresh_summaries()
+    assert app_module.SUMMARIES.last_id == high and not app_module.SUMMARIES.behind
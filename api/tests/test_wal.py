@@ -0,0 +1,121 @@
+"""The write-behind queue: replay after a restart, torn last line, checkpoint, one writer per log."""
+import json
+from datetime import datetime
+
+import pytest
+
+from wal import WALLocked, WriteBehindQueue
+
+T0 = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def rows(*temperatures):
+    return [{'station_id': 'wal-test', 'created_at': T0, 'temperature': t} for t in temperatures]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'ingest.wal')
+
+
+def open_queue(path, flushed=None, **kwargs):
+    return WriteBehindQueue(path, (flushed if flushed is not None else []).extend, batch_rows=2, **kwargs)
+
+
+def test_flush_in_batches(path):
+    flushed = []
+    queue = open_queue(path, flushed)
+    queue.append(rows(1.0, 2.0, 3.0))
+    assert queue.flush_once() and queue.flush_once() and not queue.flush_once()
+    assert [r['temperature'] for r in flushed] == [1.0, 2.0, 3.0]
+    assert queue.stats()['flushed_seq'] == 3 and queue.stats()['pending'] == 0
+    # Everything committed: the log starts over
+    with open(path) as f:
+        assert f.read() == ''
+    queue.stop()
+
+
+def test_replay_after_restart(path):
+    queue = open_queue(path)
+    queue.append(rows(1.0, 2.0, 3.0))
+    queue.flush_once()
+    queue.stop()
+
+    flushed = []
+    queue = open_queue(path, flushed)
+    # Only what is above the checkpoint, with its datetime back
+    assert queue.replayed_rows == 1
+    queue.flush_once()
+    assert flushed == rows(3.0)
+    # New entries continue the sequence
+    queue.append(rows(4.0))
+    assert queue.stats()['last_seq'] == 4
+    queue.stop()
+
+
+def test_failed_flush_keeps_rows(path):
+    def down(batch):
+        raise ConnectionError('database unavailable')
+
+    queue = WriteBehindQueue(path, down)
+    queue.append(rows(1.0))
+    with pytest.raises(ConnectionError):
+        queue.flush_once()
+    assert queue.stats()['pending'] == 1
+    queue.stop()
+    assert open_queue(path).replayed_rows == 1
+
+
+def test_torn_line_truncated(path):
+    queue = open_queue(path)
+    queue.append(rows(1.0, 2.0))
+    queue.stop()
+    with open(path, 'a') as f:
+        # Crash halfway through an append
+        f.write('{"seq": 3, "row": {"stat')
+
+    flushed = []
+    queue = open_queue(path, flushed)
+    assert queue.replayed_rows == 2
+    queue.append(rows(3.0))
+    queue.stop()
+    # The garbage is gone and the new entry is readable after the old ones
+    with open(path) as f:
+        assert [json.loads(line)['seq'] for line in f] == [1, 2, 3]
+    queue = open_queue(path, flushed)
+    while queue.flush_once():
+        pass
+    assert [r['temperature'] for r in flushed] == [1.0, 2.0, 3.0]
+    queue.stop()
+
+
+def test_one_writer_per_log(path):
+    queue = open_queue(path)
+    with pytest.raises(WALLocked):
+        open_queue(path)
+    queue.stop()
+    open_queue(path).stop()
+
+
+def test_drain_orphaned_logs(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'WAL_PATH', str(tmp_path / 'ingest.wal'))
+    station = 'wal-drain-test'
+
+    def log(slot, temperature):
+        queue = WriteBehindQueue(app_module.wal_slot_path(slot), [].append)
+        queue.append([{'station_id': station, 'created_at': T0, **dict.fromkeys(app_module.MEASURE_FIELDS),
+                       'temperature': temperature}])
+        return queue
+
+    # Slot 1 belonged to a worker gone since; slot 2 is open in a running one
+    log(1, 1.0).stop()
+    running = log(2, 2.0)
+    own = log(0, 0.0)
+    own.stop()
+    try:
+        app_module.drain_wal_logs(app_module.wal_slot_path(0))
+    finally:
+        running.stop()
+    stored = app_module.STORAGE.select('SELECT temperature FROM mesures WHERE station_id = %s', [station])
+    assert [r['temperature'] for r in stored] == [1.0]
+    assert open_queue(app_module.wal_slot_path(1)).replayed_rows == 0
@@ -0,0 +1,202 @@
+"""Write-behind ingest: rows are appended to a local write-ahead log and flushed to the DB in batches.
+
+Each WAL line is a JSON object {"seq": n, "row": {...}}. The highest seq known to be committed
+to the database is kept in a checkpoint file next to the log; on startup every entry above the
+checkpoint is replayed. Delivery is at-least-once: a crash between the DB commit and the
+checkpoint write replays that batch.
+
+A log has one writer: a second process opening it gets WALLocked (a lock file next to the log is
+held while the queue is open) instead of replaying and flushing the same entries.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class WALLocked(Exception):
+    """The log is open in another process."""
+
+
+class WriteBehindQueue:
+
+    def __init__(self, path, flush, batch_rows=500, interval=1.0, fsync='always'):
+        self.path = path
+        self.checkpoint_path = path + '.ckpt'
+        self._flush = flush
+        self.batch_rows = batch_rows
+        self.interval = interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._pending = deque()  # (seq, row)
+        self._seq = 0
+        self._flushed_seq = 0
+        self._thread = None
+        # Stats
+        self.flushed_rows = 0
+        self.flush_batches = 0
+        self.replayed_rows = 0
+        self.last_error = None
+        self.last_flush_at = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock_file = self._acquire(path + '.lock')
+        self._replay()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    # --- WAL file -----------------------------------------------------------------
+
+    @staticmethod
+    def _acquire(path):
+        # Released when the process exits, however it exits
+        f = open(path, 'w')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            raise WALLocked(path) from None
+        return f
+
+    def _replay(self):
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                self._flushed_seq = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            self._flushed_seq = 0
+        self._seq = self._flushed_seq
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return
+        good = 0
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                good += len(line)
+                seq = entry['seq']
+                self._seq = max(self._seq, seq)
+                if seq > self._flushed_seq:
+                    self._pending.append((seq, decode_row(entry['row'])))
+            torn = f.tell() != good
+        if torn:
+            # Torn last line after a crash: drop it so new entries are not appended after garbage
+            os.truncate(self.path, good)
+        self.replayed_rows = len(self._pending)
+
+    def _write_checkpoint(self, seq):
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def append(self, rows):
+        """Durably log rows (dicts of column values) and queue them for the flusher."""
+        with self._lock:
+            lines = []
+            entries = []
+            for row in rows:
+                self._seq += 1
+                lines.append(json.dumps({'seq': self._seq, 'row': encode_row(row)}) + '\n')
+                entries.append((self._seq, row))
+            self._file.write(''.join(lines))
+            self._file.flush()
+            if self.fsync == 'always':
+                os.fsync(self._file.fileno())
+            self._pending.extend(entries)
+        if len(self._pending) >= self.batch_rows:
+            self._wakeup.set()
+
+    def _compact(self):
+        # Called with the lock held once everything logged is committed: start a fresh file
+        self._file.truncate(0)
+        self._file.seek(0)
+
+    # --- flusher ------------------------------------------------------------------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='wal-flusher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the flusher after a last attempt to drain the queue."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            self._file.close()
+        self._lock_file.close()
+
+    def _run(self):
+        backoff = self.interval
+        while True:
+            self._wakeup.wait(backoff)
+            self._wakeup.clear()
+            stopping = self._stopping.is_set()
+            try:
+                while self.flush_once():
+                    pass
+                backoff = self.interval
+            except Exception as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+                # DB unavailable: keep the rows (they are in the WAL) and retry less often
+                backoff = min(backoff * 2, 30.0)
+            if stopping:
+                return
+
+    def flush_once(self):
+        """Flush one batch; return True if rows were written."""
+        with self._lock:
+            if self.fsync == 'interval' and not self._file.closed:
+                os.fsync(self._file.fileno())
+            batch = [self._pending[i] for i in range(min(self.batch_rows, len(self._pending)))]
+        if not batch:
+            return False
+        self._flush([row for _, row in batch])
+        last_seq = batch[-1][0]
+        self._write_checkpoint(last_seq)
+        with self._lock:
+            for _ in batch:
+                self._pending.popleft()
+            self._flushed_seq = last_seq
+            if not self._pending:
+                self._compact()
+        self.flushed_rows += len(batch)
+        self.flush_batches += 1
+        self.last_flush_at = time.time()
+        self.last_error = None
+        return True
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'last_seq': self._seq,
+            'flushed_seq': self._flushed_seq,
+            'flushed_rows': self.flushed_rows,
+            'flush_batches': self.flush_batches,
+            'replayed_rows': self.replayed_rows,
+            'last_flush_at': (datetime.utcfromtimestamp(self.last_flush_at).isoformat() + 'Z'
+                              if self.last_flush_at else None),
+            'last_error': self.last_error,
+        }
+
+
+def encode_row(row):
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()}
+
+
+def decode_row(data):
+    row = dict(data)
+    if isinstance(row.get('created_at'), str):
+        row['created_at'] = datetime.fromisoformat(row['created_at'])
+    return row
@@ -3,6 +3,10 @@ import utime
 from micropython import const
 import network
 import ujson
+try:
+    import ustruct as struct
+except Exception:
+    import struct
 try:
     import rp2
 except Exception:
@@ -19,6 +23,10 @@ try:
     import urequests as requests
 except Exception:
     requests = None
+try:
+    import urandom as random
+except Exception:
+    random = None
 
 # BME280 - Constantes d'adresse
 BME280_I2C_ADDR_PRIM = const(0x76)
@@ -969,11 +977,13 @@ def build_health_url(api_add_url: str) -> str:
     return api_add_url + '/health'
 
 
-def post_json(url: str, payload: dict, timeout_s: int = 5):
+def post_json(url: str, payload: dict, timeout_s: int = 5, token: str = None):
     if requests is None:
         raise RuntimeError('urequests non disponible sur ce firmware')
     try:
         headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
         resp = requests.post(url, data=ujson.dumps(payload), headers=headers, timeout=timeout_s)
         code = resp.status_code
         txt = resp.text
@@ -983,6 +993,97 @@ def post_json(url: str, payload: dict, timeout_s: int = 5):
         return None, str(e)
 
 
+# Protocole binaire compact (voir api/binproto.py, garder les deux identiques):
+# en-tete '<2sBB' (magic b'SM', version 2, nombre d'enregistrements) puis par enregistrement
+# '<6fBHI': temperature, humidite, pression, co2, humidite_surface, indice_uv (float32, NaN = absent),
+# flags (bit 0 = pluie), age en secondes, numero de sequence. 31 octets par mesure au lieu de ~170 en JSON.
+BINARY_CONTENT_TYPE = 'application/x-stationmeteo'
+BINARY_VERSION = const(2)
+BINARY_FLOAT_FIELDS = ('temperature', 'humidite', 'pression', 'co2', 'humidite_surface', 'indice_uv')
+
+
+def encode_binary_frame(payloads):
+    frame = bytearray(struct.pack('<2sBB', b'SM', BINARY_VERSION, len(payloads)))
+    for p in payloads:
+        values = []
+        for key in BINARY_FLOAT_FIELDS:
+            v = p.get(key)
+            values.append(float('nan') if v is None else float(v))
+        flags = 1 if p.get('pluie_detectee') else 0
+        age = min(max(int(p.get('age_s', 0)), 0), 0xFFFF)
+        frame.extend(struct.pack('<6fBHI', values[0], values[1], values[2], values[3],
+                                 values[4], values[5], flags, age, int(p.get('seq', 0))))
+    return frame
+
+
+def post_binary(url: str, payload: dict, timeout_s: int = 5, token: str = None):
+    if requests is None:
+        raise RuntimeError('urequests non disponible sur ce firmware')
+    try:
+        headers = {'Content-Type': BINARY_CONTENT_TYPE}
+        # La trame ne porte pas l'identifiant de station: il passe dans un en-tete
+        if payload.get('station_id'):
+            headers['X-Station-Id'] = payload['station_id']
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
+        resp = requests.post(url, data=encode_binary_frame([payload]), headers=headers, timeout=timeout_s)
+        code = resp.status_code
+        txt = resp.text
+        resp.close()
+        return code, txt
+    except Exception as e:
+        return None, str(e)
+
+
+# Blocs de depart possibles: au plus 2^30 avec des blocs de 1000, des siecles de marge avant 2^32
+SEQ_RANDOM_BLOCKS = const(1 << 20)
+
+
+class SequenceCounter:
+    """Numero de sequence croissant des mesures, qui survit aux redemarrages.
+
+    L'API ignore une mesure dont la station a deja envoye le numero: un POST renvoye apres un
+    timeout (alors que le serveur avait enregistre) ne cree pas de doublon. Pour ne pas user la
+    flash, on reserve les numeros par blocs: le fichier contient le debut du prochain bloc et
+    n'est reecrit qu'une fois par bloc (un redemarrage saute au plus la fin du bloc en cours).
+
+    Sans fichier (premiere mise en service, flash effacee), le compteur part d'un bloc tire au
+    hasard: repartir de 1 redonnerait des numeros deja recus, que l'API ecarterait comme doublons.
+    """
+
+    def __init__(self, path='seq.json', block=1000):
+        self.path = path
+        self.block = block
+        try:
+            with open(self.path, 'r') as f:
+                self.next = self.limit = int(ujson.loads(f.read())['next'])
+        except Exception:
+            self.reseed()
+
+    def reseed(self):
+        """Repartir d'un bloc tire au hasard (fichier perdu, ou numero deja connu de l'API)."""
+        if random is not None:
+            n = random.getrandbits(20)
+        else:
+            n = utime.ticks_cpu() & 0xFFFFF
+        self.next = self.limit = 1 + (n % SEQ_RANDOM_BLOCKS) * self.block
+
+    def _reserve(self):
+        self.limit = self.next + self.block
+        try:
+            with open(self.path, 'w') as f:
+                f.write(ujson.dumps({'next': self.limit}))
+        except Exception as e:
+            print('Sequence: echec sauvegarde:', e)
+
+    def take(self):
+        if self.next >= self.limit:
+            self._reserve()
+        seq = self.next
+        self.next += 1
+        return seq
+
+
 def print_env_info():
     try:
         print('Firmware:', sys.implementation if sys else 'inconnu')
@@ -1001,6 +1102,9 @@ def main():
     # Initialisation du module WiFi (CYW43) mais desactivation pour economiser l'energie
     # Parametres API (adapter SERVER_IP ou nom DNS)
     API_URL = 'http://51.91.141.222:5000/add'
+    # Identifiant de cette station (unique dans la flotte) et jeton optionnel (STATION_TOKENS cote API)
+    STATION_ID = 'station-1'
+    STATION_TOKEN = ''
     WIFI_SSID = 'Kanto MK16'
     WIFI_PASS = 'partagedeco'
 
@@ -1054,8 +1158,14 @@ def main():
 
     # Période d'envoi des données réduite pour un quasi temps réel
     SEND_PERIOD_MS = 30 * 1000  # 30 secondes
+    # Envoi au format binaire compact; repli automatique en JSON si l'API ne le supporte pas
+    use_binary = True
     # Forcer un premier envoi immediat en antidatant le dernier envoi
     last_send_ms = utime.ticks_ms() - SEND_PERIOD_MS
+    # Mesure non confirmee par l'API (payload, instant de mesure, deja tentee): renvoyee telle quelle,
+    # avec le meme numero de sequence, jusqu'au succes; l'API ecarte le doublon si un envoi avait abouti
+    sequence = SequenceCounter()
+    pending = None
     
     warned_no_bme = False
     while True:
@@ -1119,22 +1229,50 @@ def main():
                     print('Echec reconnexion WiFi:', e)
 
                 # Construire le payload en toutes circonstances (avec mesures ou valeurs fictives)
-                payload = {
-                    'temperature': float(temperature),
-                    'humidite': float(humidity),
-                    'pression': float(pressure),
-                    'co2': float(co2_ppm),
-                    'humidite_surface': float(surface_hum),
-                    'pluie_detectee': bool(is_raining),
-                    'indice_uv': float(uv_index),
-                }
+                if pending is None:
+                    pending = ({
+                        'temperature': float(temperature),
+                        'humidite': float(humidity),
+                        'pression': float(pressure),
+                        'co2': float(co2_ppm),
+                        'humidite_surface': float(surface_hum),
+                        'pluie_detectee': bool(is_raining),
+                        'indice_uv': float(uv_index),
+                        'station_id': STATION_ID,
+                        'seq': sequence.take(),
+                    }, now_ms, False)
+                payload, measured_ms, retried = pending
+                # Age de la mesure: l'API la date de son instant de mesure, pas de son envoi
+                payload['age_s'] = utime.ticks_diff(now_ms, measured_ms) // 1000
                 print('Envoi vers API (POST) toutes les 30 secondes:', API_URL)
-                code, msg = post_json(API_URL, payload)
-                if code is not None and 200 <= code < 300:
+                if use_binary:
+                    code, msg = post_binary(API_URL, payload, token=STATION_TOKEN)
+                    if code in (400, 415):
+                        print('Format binaire refuse par l\'API, repli en JSON ->', code, msg)
+                        use_binary = False
+                        code, msg = post_json(API_URL, payload, token=STATION_TOKEN)
+                else:
+                    code, msg = post_json(API_URL, payload, token=STATION_TOKEN)
+                if code == 200 and not retried and 'duplicate' in (msg or ''):
+                    # Numero deja connu de l'API alors que la mesure n'avait jamais ete envoyee:
+                    # compteur reparti en arriere (seq.json restaure), on change de bloc et on renvoie
+                    print('Numero de sequence deja utilise, nouveau bloc')
+                    sequence.reseed()
+                    payload['seq'] = sequence.take()
+                elif code is not None and 200 <= code < 300:
+                    # 200 'duplicate' apres une nouvelle tentative: un envoi precedent avait abouti
                     print('POST reussi OK ->', code)
                     last_send_ms = now_ms
+                    pending = None
+                elif code is not None and 400 <= code < 500 and code not in (408, 429):
+                    # Refus definitif (jeton inconnu, station invalide...): renvoyer ne changera rien,
+                    # on abandonne cette mesure pour continuer a mesurer
+                    print('POST refuse, mesure abandonnee ->', code, msg)
+                    last_send_ms = now_ms
+                    pending = None
                 else:
                     print('POST echoue ->', code, msg)
+                    pending = (payload, measured_ms, True)
 
             # Ligne de separation pour la lisibilite
             print("-" * 50)
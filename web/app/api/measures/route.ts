@@ -1,30 +1,70 @@
 export const dynamic = 'force-dynamic';
 
-async function fetchFromBackend() {
+type BackendResult =
+  | { status: 200; data: unknown; etag: string | null; headers: Record<string, string> }
+  | { status: 304; etag: string | null };
+
+// Response headers of the API passed on to the browser: next page cursor, series station and bucket
+const FORWARDED_HEADERS = ['x-next-cursor', 'x-station', 'x-downsample-bucket'];
+
+function forwardedHeaders(res: Response): Record<string, string> {
+  const headers: Record<string, string> = {};
+  for (const name of FORWARDED_HEADERS) {
+    const value = res.headers.get(name);
+    if (value !== null) headers[name] = value;
+  }
+  return headers;
+}
+
+async function fetchFromBackend(query: string, ifNoneMatch: string | null): Promise<BackendResult> {
   const API_BASE = process.env.API_BASE || 'http://localhost:5000';
   const endpoints = [
-    `${API_BASE}/measures?limit=100`,
-    `${API_BASE}/mesures?limit=100`,
+    `${API_BASE}/measures?${query}`,
+    `${API_BASE}/mesures?${query}`,
   ];
+  // Forward the browser's validator so the API can answer 304 without querying the DB
+  const headers: Record<string, string> = ifNoneMatch ? { 'if-none-match': ifNoneMatch } : {};
   for (const url of endpoints) {
     try {
-      const res = await fetch(url, { cache: 'no-store' });
+      const res = await fetch(url, { cache: 'no-store', headers });
+      if (res.status === 304) return { status: 304, etag: res.headers.get('etag') };
       if (!res.ok) continue;
       const data = await res.json();
-      return Array.isArray(data) ? data : [];
+      // Array of rows, or an object (max_points series, format=columns arrays)
+      return {
+        status: 200,
+        data: data !== null && typeof data === 'object' ? data : [],
+        etag: res.headers.get('etag'),
+        headers: forwardedHeaders(res),
+      };
     } catch {
       // try next endpoint
     }
   }
-  return [];
+  return { status: 200, data: [], etag: null, headers: {} };
 }
 
-export async function GET() {
-  const data = await fetchFromBackend();
-  return new Response(JSON.stringify(data), {
-    headers: {
-      'content-type': 'application/json',
-      'cache-control': 'no-store',
-    },
+// Query parameters forwarded to the backend (time window, pagination)
+const FORWARDED_PARAMS = ['limit', 'offset', 'from', 'to', 'before_id', 'after_id', 'before', 'after', 'max_points', 'fields', 'format', 'station'];
+
+export async function GET(request: Request) {
+  const incoming = new URL(request.url).searchParams;
+  const params = new URLSearchParams();
+  for (const key of FORWARDED_PARAMS) {
+    const value = incoming.get(key);
+    if (value !== null) params.set(key, value);
+  }
+  if (!params.has('limit') && !params.has('from') && !params.has('to')) {
+    params.set('limit', '100');
+  }
+  const result = await fetchFromBackend(params.toString(), request.headers.get('if-none-match'));
+  // no-cache (not no-store): the browser keeps its copy and revalidates it with If-None-Match
+  const headers: Record<string, string> = { 'cache-control': 'no-cache' };
+  if (result.etag) headers['etag'] = result.etag;
+  if (result.status === 304) {
+    return new Response(null, { status: 304, headers });
+  }
+  return new Response(JSON.stringify(result.data), {
+    headers: { ...headers, ...result.headers, 'content-type': 'application/json' },
   });
 }
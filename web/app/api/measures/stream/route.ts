@@ -0,0 +1,45 @@
+export const dynamic = 'force-dynamic';
+
+// Relays the API's Server-Sent Events stream to the browser (one backend stream per open tab,
+// no database query per viewer). Last-Event-ID is forwarded so reconnections resume without gaps.
+export async function GET(request: Request) {
+  const API_BASE = process.env.API_BASE || 'http://localhost:5000';
+  const headers: Record<string, string> = { accept: 'text/event-stream' };
+  const lastEventId = request.headers.get('last-event-id');
+  if (lastEventId) headers['last-event-id'] = lastEventId;
+  // Initial resume point chosen by the page (newest row it already has) and station filter
+  const incoming = new URL(request.url).searchParams;
+  const params = new URLSearchParams();
+  for (const name of ['last_id', 'station']) {
+    const value = incoming.get(name);
+    if (value) params.set(name, value);
+  }
+  const query = params.toString() ? `?${params.toString()}` : '';
+  try {
+    const res = await fetch(`${API_BASE}/measures/stream${query}`, {
+      cache: 'no-store',
+      headers,
+      signal: request.signal,
+    });
+    if (res.status === 503) {
+      // Worker at its stream limit: EventSource gives up on an HTTP error, so end an empty stream
+      // and let it reconnect after the delay the API asks for
+      const retryAfter = Number(res.headers.get('retry-after')) || 5;
+      return new Response(`retry: ${retryAfter * 1000}\n\n`, {
+        headers: { 'content-type': 'text/event-stream', 'cache-control': 'no-cache, no-transform' },
+      });
+    }
+    if (!res.ok || !res.body) {
+      return new Response('upstream unavailable', { status: 502 });
+    }
+    return new Response(res.body, {
+      headers: {
+        'content-type': 'text/event-stream',
+        'cache-control': 'no-cache, no-transform',
+        connection: 'keep-alive',
+      },
+    });
+  } catch {
+    return new Response('upstream unavailable', { status: 502 });
+  }
+}
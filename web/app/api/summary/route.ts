@@ -0,0 +1,22 @@
+export const dynamic = 'force-dynamic';
+
+// Cartes du tableau de bord: dernières valeurs, min/max/moyenne 1h et 24h, tendance de la pression
+export async function GET(request: Request) {
+  const API_BASE = process.env.API_BASE || 'http://localhost:5000';
+  const station = new URL(request.url).searchParams.get('station');
+  const query = station ? `?${new URLSearchParams({ station }).toString()}` : '';
+  try {
+    const res = await fetch(`${API_BASE}/summary${query}`, { cache: 'no-store' });
+    if (res.status === 404) {
+      return new Response(JSON.stringify(null), { headers: { 'content-type': 'application/json' } });
+    }
+    if (!res.ok) {
+      return new Response('upstream unavailable', { status: 502 });
+    }
+    return new Response(await res.text(), {
+      headers: { 'content-type': 'application/json', 'cache-control': 'no-store' },
+    });
+  } catch {
+    return new Response('upstream unavailable', { status: 502 });
+  }
+}
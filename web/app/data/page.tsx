@@ -6,6 +6,7 @@ import { formatDateFR, parseCreatedAt } from '../../lib/date';
 type Measure = {
   id: number;
   created_at: string;
+  station_id?: string;
   temperature?: number;
   humidite?: number;
   pression?: number;
@@ -15,16 +16,34 @@ type Measure = {
   indice_uv?: number;
 };
 
+const CHART_FIELDS = ['temperature', 'humidite', 'pression', 'indice_uv', 'co2'] as const;
+// Budget de points par graphique (largeur utile du SVG)
+const CHART_MAX_POINTS = 300;
+
+// Série sous-échantillonnée (LTTB) renvoyée par /measures?max_points=N
+type SeriesPoint = { t: string; v: number };
+type DownsampledSeries = Partial<Record<typeof CHART_FIELDS[number], SeriesPoint[]>>;
+
 export default function DataPage() {
   const [data, setData] = useState<Measure[]>([]);
+  const [downsampled, setDownsampled] = useState<DownsampledSeries>({});
   const [loading, setLoading] = useState(true);
 
   async function load() {
     try {
       setLoading(true);
-      const res = await fetch('/api/measures', { cache: 'no-store' });
+      // Tableau: dernières mesures brutes. Graphiques: au plus CHART_MAX_POINTS points par série sur 24h,
+      // choisis par l'API (LTTB) pour garder les pics (début de pluie, CO2) quelle que soit la durée.
+      const res = await fetch('/api/measures', { cache: 'no-cache' });
       const json = await res.json();
-      setData(Array.isArray(json) ? json : []);
+      const rows: Measure[] = Array.isArray(json) ? json : [];
+      // Une série par station: celle de la mesure la plus récente du tableau
+      const params = new URLSearchParams({ from: '-24h', max_points: String(CHART_MAX_POINTS), fields: CHART_FIELDS.join(',') });
+      if (rows[0]?.station_id) params.set('station', rows[0].station_id);
+      const seriesRes = await fetch(`/api/measures?${params.toString()}`, { cache: 'no-cache' });
+      const seriesJson = await seriesRes.json();
+      setData(rows);
+      setDownsampled(seriesJson && !Array.isArray(seriesJson) ? seriesJson : {});
     } catch (err) {
       console.error("Failed to load data:", err);
     } finally {
@@ -39,49 +58,19 @@ export default function DataPage() {
   }, []);
 
   const series = useMemo(() => {
-    // Filtrer les données pour n'avoir qu'une mesure toutes les 10 minutes
-    // Cela rendra les graphiques plus propres et plus lisibles
-    const filterByTimeInterval = (data: Measure[]) => {
-      if (!data.length) return [];
-      
-      const filteredData = [data[0]]; // Garder toujours la mesure la plus récente
-      let lastTimestamp = parseCreatedAt(data[0].created_at)?.getTime() || 0;
-      
-      // Parcourir le reste des données et ne garder que celles espacées d'au moins 10 minutes
-      for (let i = 1; i < data.length; i++) {
-        const currentTimestamp = parseCreatedAt(data[i].created_at)?.getTime() || 0;
-        // 600000 ms = 10 minutes
-        if (Math.abs(currentTimestamp - lastTimestamp) >= 600000) {
-          filteredData.push(data[i]);
-          lastTimestamp = currentTimestamp;
-        }
-      }
-      
-      return filteredData;
-    };
-    
-    const filteredData = filterByTimeInterval(data);
-    console.log(`Données filtrées: ${filteredData.length} sur ${data.length} mesures (1 point toutes les 10 min)`);
-    
-    const toPairs = (key: keyof Measure) => {
-      const pairs = filteredData
-        .filter(m => typeof m[key] === 'number' && m[key] !== null)
-        .map(m => {
-          // Use our enhanced date parser
-          const parsedDate = parseCreatedAt(m.created_at);
-          
-          // Ensure we have a valid date (fallback to entry index if date is invalid)
-          const time = parsedDate && !isNaN(parsedDate.getTime()) 
-            ? parsedDate.getTime() 
-            : Date.now() - (filteredData.indexOf(m) * 600000); // Fallback: now - index*10min
-          
-          return { 
-            t: time, 
-            v: (m[key] as number),
-            label: formatDateFR(m.created_at) // Format date for display
+    const toPairs = (key: typeof CHART_FIELDS[number]) => {
+      const pairs = (downsampled[key] ?? [])
+        .filter(p => typeof p.v === 'number')
+        .map(p => {
+          const parsedDate = parseCreatedAt(p.t);
+          return {
+            t: parsedDate ? parsedDate.getTime() : 0,
+            v: p.v,
+            label: formatDateFR(p.t)
           };
-        });
-      
+        })
+        .filter(p => p.t > 0);
+
       // Sort by time to ensure line drawing works correctly
       return pairs.sort((a, b) => a.t - b.t);
     };
@@ -93,7 +82,7 @@ export default function DataPage() {
       indice_uv: toPairs('indice_uv'),
       co2: toPairs('co2'),
     };
-  }, [data]);
+  }, [downsampled]);
 
   function MiniChart({ points, color, label }:{ points: {t:number; v:number; label?: string}[]; color:string; label:string }){
     const width = 600, height = 160, pad = 30;
@@ -349,7 +338,7 @@ export default function DataPage() {
             letterSpacing: '0.04em',
             fontWeight: 400
           }}>
-            <span style={{ color: '#74e0c9', fontWeight: 700 }}>{data.length}</span> mesures • <span style={{ opacity: 0.9, color: '#74e0c9' }}>1 point tous les 10min</span> • Dernière mise à jour: <span style={{ fontWeight: 700 }}>{formatDateFR(data[0]?.created_at)}</span>
+            <span style={{ color: '#74e0c9', fontWeight: 700 }}>{data.length}</span> mesures • <span style={{ opacity: 0.9, color: '#74e0c9' }}>{CHART_MAX_POINTS} points max par graphique (24h)</span> • Dernière mise à jour: <span style={{ fontWeight: 700 }}>{formatDateFR(data[0]?.created_at)}</span>
           </div>
         </div>
         
@@ -433,8 +422,7 @@ export default function DataPage() {
           </thead>
           <tbody>
             {Array.isArray(data) && data.length > 0 ? (
-              // Afficher toutes les données dans le tableau (pas seulement les points filtrés)
-              // L'utilisateur peut ainsi voir toutes les mesures en détail
+              // Le tableau affiche les dernières mesures brutes (les graphiques, des séries sous-échantillonnées)
               data.map((r:any) => (
                 <tr key={r.id} style={{ 
                   borderTop: '1px solid rgba(255,255,255,0.06)', 
@@ -1,6 +1,6 @@
 "use client";
 
-import { useEffect, useMemo, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { formatDateFR } from '../lib/date';
 
 type Measure = {
@@ -15,6 +15,25 @@ type Measure = {
   indice_uv?: number;
 };
 
+type WindowStats = { min: number | null; max: number | null; mean: number | null; count: number };
+type FieldSummary = { latest: number | null; latest_at: string | null; '1h': WindowStats; '24h': WindowStats };
+type Summary = {
+  station_id: string;
+  updated_at: string | null;
+  fields: Record<string, FieldSummary>;
+  pression_trend: { delta: number; span_s: number; since: string; trend: string } | null;
+};
+
+// Tendance barométrique sur 3 h
+const TREND_LABELS: Record<string, string> = {
+  steady: 'stable',
+  rising_slowly: 'hausse lente', rising: 'hausse', rising_quickly: 'hausse rapide', rising_very_rapidly: 'hausse très rapide',
+  falling_slowly: 'baisse lente', falling: 'baisse', falling_quickly: 'baisse rapide', falling_very_rapidly: 'baisse très rapide',
+};
+
+// Intervalle minimal entre deux rechargements du résumé (ms)
+const SUMMARY_REFRESH_MS = 10000;
+
 function Card({ title, value, subtitle }:{ title:string; value:string; subtitle?:string }){
   return (
     <div className="card" style={{
@@ -132,15 +151,31 @@ function CloudIcon() {
 }
 
 export default function Page() {
-  const [data, setData] = useState<Measure[]>([]);
+  const [last, setLast] = useState<Measure | undefined>(undefined);
+  const [summary, setSummary] = useState<Summary | null>(null);
   const [loading, setLoading] = useState(true);
   const [now, setNow] = useState<Date>(new Date());
+  const summaryLoadedAt = useRef(0);
+
+  async function loadSummary() {
+    // Min/max/moyennes tenus à jour par l'API: aucune mesure brute à télécharger
+    summaryLoadedAt.current = Date.now();
+    try {
+      const res = await fetch('/api/summary', { cache: 'no-store' });
+      if (res.ok) setSummary(await res.json());
+    } catch {
+      // ignore
+    }
+  }
 
   async function load() {
     try {
-      const res = await fetch('/api/measures', { cache: 'no-store' });
+      // no-cache: revalidation via ETag, the API answers 304 when no new measure arrived
+      const [res] = await Promise.all([fetch('/api/measures?limit=1', { cache: 'no-cache' }), loadSummary()]);
       const json = await res.json();
-      setData(Array.isArray(json) ? json : []);
+      const rows: Measure[] = Array.isArray(json) ? json : [];
+      setLast(rows[0]);
+      return rows[0]?.id;
     } catch {
       // ignore
     } finally {
@@ -149,9 +184,28 @@ export default function Page() {
   }
 
   useEffect(() => {
-    load();
-    const id = setInterval(load, 15000);
-    return () => clearInterval(id);
+    // Nouvelles mesures poussées par l'API (SSE) au lieu d'un rechargement toutes les 15 s.
+    // Le flux reprend après la dernière mesure chargée; ensuite EventSource se reconnecte seul
+    // et renvoie Last-Event-ID pour récupérer les mesures manquées.
+    let source: EventSource | null = null;
+    let cancelled = false;
+    load().then((newestId) => {
+      if (cancelled) return;
+      source = new EventSource(`/api/measures/stream${newestId ? `?last_id=${newestId}` : ''}`);
+      source.addEventListener('measure', (event) => {
+        try {
+          const row = JSON.parse((event as MessageEvent).data) as Measure;
+          setLast(prev => (prev && prev.id >= row.id) ? prev : row);
+          if (Date.now() - summaryLoadedAt.current > SUMMARY_REFRESH_MS) loadSummary();
+        } catch {
+          // ignore malformed event
+        }
+      });
+    });
+    return () => {
+      cancelled = true;
+      source?.close();
+    };
   }, []);
 
   useEffect(() => {
@@ -159,14 +213,14 @@ export default function Page() {
     return () => clearInterval(t);
   }, []);
 
-  const last = data?.[0];
-  const avg = useMemo(()=> (key:string) => {
-    if (!data?.length) return '-';
-    const v = data.map((r:any)=> r[key]).filter((x:number)=> typeof x === 'number');
-    if (!v.length) return '-';
-    const m = v.reduce((a:number,b:number)=>a+b,0)/v.length;
-    return m.toFixed(1);
-  }, [data]);
+  // Moyenne, min et max sur 24 h d'un champ, depuis /summary
+  const stats24h = (key: string) => {
+    const w = summary?.fields?.[key]?.['24h'];
+    if (!w || w.mean === null) return 'moy 24h: -';
+    return `moy 24h: ${w.mean.toFixed(1)} (${w.min?.toFixed(1)}/${w.max?.toFixed(1)})`;
+  };
+  const trend = summary?.pression_trend;
+  const trendText = trend ? `${TREND_LABELS[trend.trend] ?? trend.trend} (${trend.delta > 0 ? '+' : ''}${trend.delta.toFixed(1)} hPa)` : '-';
 
   const isRain = Boolean(last?.pluie_detectee);
   const isSunny = !isRain && (typeof last?.indice_uv === 'number' ? last!.indice_uv! >= 2.5 : false) && (typeof last?.humidite === 'number' ? last!.humidite! <= 70 : true);
@@ -357,10 +411,10 @@ export default function Page() {
             gap: 12,
             zIndex: 1
           }}>
-            <Card title="Temp (°C)" value={last? `${last.temperature?.toFixed?.(1) ?? '-'}` : '-'} subtitle={`moy: ${avg('temperature')}`}/>
-            <Card title="Hum (%)" value={last? `${last.humidite?.toFixed?.(1) ?? '-'}` : '-'} subtitle={`moy: ${avg('humidite')}`}/>
-            <Card title="Press (hPa)" value={last? `${last.pression?.toFixed?.(1) ?? '-'}` : '-'} subtitle={`moy: ${avg('pression')}`}/>
-            <Card title="UV" value={last? `${last.indice_uv?.toFixed?.(1) ?? '-'}` : '-'} subtitle={`moy: ${avg('indice_uv')}`}/>
+            <Card title="Temp (°C)" value={last? `${last.temperature?.toFixed?.(1) ?? '-'}` : '-'} subtitle={stats24h('temperature')}/>
+            <Card title="Hum (%)" value={last? `${last.humidite?.toFixed?.(1) ?? '-'}` : '-'} subtitle={stats24h('humidite')}/>
+            <Card title="Press (hPa)" value={last? `${last.pression?.toFixed?.(1) ?? '-'}` : '-'} subtitle={`3 h: ${trendText}`}/>
+            <Card title="UV" value={last? `${last.indice_uv?.toFixed?.(1) ?? '-'}` : '-'} subtitle={stats24h('indice_uv')}/>
           </div>
           
           <div style={{ 